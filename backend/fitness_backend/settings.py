@@ -135,6 +135,23 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# STORAGES alias that holds generated meal images; None uses the default
+# storage under MEDIA_ROOT
+MEAL_IMAGE_STORAGE = os.getenv('MEAL_IMAGE_STORAGE') or None
+
+# Public origin meal image URLs are built on, e.g. https://api.example.com;
+# None uses the host of the request
+MEAL_IMAGE_BASE_URL = os.getenv('MEAL_IMAGE_BASE_URL') or None
+
+# Queue a job that generates images for every dish in a new meal plan.
+# Only enable this where `manage.py run_generation_worker` runs, otherwise
+# the jobs are never processed
+MEAL_IMAGE_PREFETCH = os.getenv('MEAL_IMAGE_PREFETCH', 'False') == 'True'
+
+# Default meal plan generator: "ai" (Gemini, falling back to templates) or
+# "template" (instant plans from the bundled food table)
+MEAL_PLAN_GENERATOR = os.getenv('MEAL_PLAN_GENERATOR', 'ai')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -171,3 +188,34 @@ CORS_ALLOW_CREDENTIALS = True
 
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
+
+# Gemini response cache (ml_models.llm_cache)
+LLM_RESPONSE_CACHE = {
+    'BACKEND': os.getenv('LLM_CACHE_BACKEND', 'memory'),  # memory, django or none
+    'TTL_SECONDS': int(os.getenv('LLM_CACHE_TTL_SECONDS', 6 * 60 * 60)),
+    'MAX_ENTRIES': int(os.getenv('LLM_CACHE_MAX_ENTRIES', 256)),
+    'CACHE_ALIAS': 'default',
+}
+
+# Generation job worker (python manage.py run_generation_worker). Set
+# GENERATION_WORKER_ENABLED where one runs; without it, follow-up work such
+# as deleting superseded meal plans runs inline in the request instead
+GENERATION_WORKER_ENABLED = os.getenv('GENERATION_WORKER_ENABLED', 'False') == 'True'
+GENERATION_WORKER_CONCURRENCY = int(os.getenv('GENERATION_WORKER_CONCURRENCY', 4))
+GENERATION_WORKER_POLL_INTERVAL = float(os.getenv('GENERATION_WORKER_POLL_INTERVAL', 1.0))
+
+# Shared Gemini client (ml_models.llm_gateway)
+LLM_GATEWAY = {
+    # 'fake' answers from ml_models.fake_llm without calling Gemini
+    'BACKEND': os.getenv('LLM_BACKEND', 'gemini'),
+    'FAKE': {
+        'LATENCY_SECONDS': float(os.getenv('FAKE_LLM_LATENCY_SECONDS', 2.0)),
+        'FAILURE_RATE': float(os.getenv('FAKE_LLM_FAILURE_RATE', 0.0)),
+    },
+    'MODEL': os.getenv('GEMINI_MODEL', 'gemini-2.5-flash'),
+    'TIMEOUT_SECONDS': float(os.getenv('GEMINI_TIMEOUT_SECONDS', 120)),
+    'MAX_CONCURRENT_REQUESTS': int(os.getenv('GEMINI_MAX_CONCURRENT_REQUESTS', 8)),
+    'MAX_RETRIES': int(os.getenv('GEMINI_MAX_RETRIES', 3)),
+    'BACKOFF_BASE_SECONDS': 1.0,
+    'BACKOFF_MAX_SECONDS': 20.0,
+}
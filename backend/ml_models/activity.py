@@ -0,0 +1,282 @@
+import uuid
+from datetime import date
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils.timezone import now
+
+from health_data.models import HealthData
+
+from .models import ActivityEntry, DailyActivityLog
+
+# HealthData totals that activity logging adds to
+ACTIVITY_FIELDS = ('steps', 'calories_burned', 'distance', 'active_minutes')
+
+# Amounts an ActivityEntry carries
+LEDGER_FIELDS = ('calories_burned', 'distance', 'active_minutes')
+
+
+def _column(model, field):
+    return connection.ops.quote_name(model._meta.get_field(field).column)
+
+
+def _as_date(value):
+    # SQLite hands dates back as text
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _accumulate(model, fields, user_id, increments):
+    """
+    Add increments ({date: {field: amount}}) to a model's per-user daily
+    rows in one INSERT ... ON CONFLICT (user, date) DO UPDATE, creating
+    missing days. Returns {date: {field: total after the update}}.
+    """
+    if not increments:
+        return {}
+    for amounts in increments.values():
+        unknown = set(amounts) - set(fields)
+        if unknown:
+            raise ValueError(f"Not an activity field: {', '.join(sorted(unknown))}")
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    stamps = [field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+    created = [field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now_add', False)]
+    columns = ('user', 'date') + tuple(fields) + tuple(created) + tuple(stamps)
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    stamp = now()
+    params = []
+    # Rows go in date order so concurrent batches lock them in the same order
+    for day in sorted(increments):
+        amounts = increments[day]
+        params += [user_id, day, *(amounts.get(field, 0) for field in fields)]
+        params += [stamp] * (len(created) + len(stamps))
+
+    updates = [f"{_column(model, f)} = {table}.{_column(model, f)} + EXCLUDED.{_column(model, f)}" for f in fields]
+    updates += [f"{_column(model, f)} = EXCLUDED.{_column(model, f)}" for f in stamps]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(_column(model, f) for f in columns)}) "
+        f"VALUES {', '.join([row] * len(increments))} "
+        f"ON CONFLICT ({_column(model, 'user')}, {_column(model, 'date')}) "
+        f"DO UPDATE SET {', '.join(updates)} "
+        f"RETURNING {_column(model, 'date')}, {', '.join(_column(model, f) for f in fields)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return {_as_date(day): dict(zip(fields, values)) for day, *values in rows}
+
+
+def add_activities(user, increments):
+    """
+    Add to the user's HealthData totals for several dates in one
+    INSERT ... ON CONFLICT DO UPDATE. Missing days are created holding the
+    increments and existing ones have them added by the database, so
+    concurrent calls never lose an update and no other column is written.
+
+    increments is {date: {field: amount}} with fields from ACTIVITY_FIELDS.
+    Returns {date: {field: total after the update}}.
+    """
+    return _accumulate(HealthData, ACTIVITY_FIELDS, user.pk, increments)
+
+
+def add_activity(user, day, **amounts):
+    """Add to one day's HealthData totals; returns the totals after the update"""
+    return add_activities(user, {day: amounts})[day]
+
+
+# ---------------- LEDGER ---------------- #
+def ledger_key(user, source_type, *parts):
+    return ':'.join(str(part) for part in (user.pk, source_type) + parts)
+
+
+def record_activity(user, entries):
+    """
+    Append unsaved ActivityEntry rows to the ledger and add the ones that
+    are new to DailyActivityLog and HealthData, in one transaction.
+    Entries whose idempotency_key is already in the ledger are skipped,
+    so replaying a request adds nothing.
+
+    Returns {date: HealthData totals} for the dates that changed.
+    """
+    if not entries:
+        return {}
+
+    table = connection.ops.quote_name(ActivityEntry._meta.db_table)
+    columns = ('user', 'source_type', 'source_id', 'date') + LEDGER_FIELDS + ('idempotency_key', 'created_at')
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    stamp = now()
+    params = []
+    for entry in entries:
+        params += [user.pk, entry.source_type, entry.source_id, entry.date]
+        params += [getattr(entry, field) for field in LEDGER_FIELDS]
+        params += [entry.idempotency_key, stamp]
+
+    sql = (
+        f"INSERT INTO {table} ({', '.join(_column(ActivityEntry, f) for f in columns)}) "
+        f"VALUES {', '.join([row] * len(entries))} "
+        f"ON CONFLICT ({_column(ActivityEntry, 'idempotency_key')}) DO NOTHING "
+        f"RETURNING {_column(ActivityEntry, 'date')}, {', '.join(_column(ActivityEntry, f) for f in LEDGER_FIELDS)}"
+    )
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            written = cursor.fetchall()
+
+        increments = {}
+        for day, *amounts in written:
+            totals = increments.setdefault(_as_date(day), dict.fromkeys(LEDGER_FIELDS, 0))
+            for field, amount in zip(LEDGER_FIELDS, amounts):
+                totals[field] += amount
+
+        _accumulate(DailyActivityLog, LEDGER_FIELDS, user.pk, increments)
+        return add_activities(user, increments)
+
+
+def log_activity(user, source_type, day, idempotency_key=None, **amounts):
+    """
+    Record activity the user logged by hand. Requests sent again with the
+    same idempotency_key are only counted once; without one every call
+    counts. Returns the day's HealthData totals and whether it was added.
+    """
+    key = idempotency_key or uuid.uuid4().hex
+    changed = record_activity(user, [ActivityEntry(
+        source_type=source_type,
+        source_id=key,
+        date=day,
+        idempotency_key=ledger_key(user, source_type, key),
+        **amounts,
+    )])
+    if day in changed:
+        return changed[day], True
+
+    totals = HealthData.objects.filter(user=user, date=day).values(*ACTIVITY_FIELDS).first()
+    return totals or dict.fromkeys(ACTIVITY_FIELDS, 0), False
+
+
+def set_source_activities(user, source_type, targets):
+    """
+    Make what each source (an exercise, a marathon day) adds to the
+    user's activity match its state. targets is {source_id: (date,
+    amounts)}, with amounts None or empty when the source no longer
+    counts, e.g. an exercise marked not done.
+
+    A source that already counts is left as it is, so completing it twice
+    adds nothing. One that stops counting gets a reversal on every date
+    it added to. Entry keys number each source's entries, so concurrent
+    requests for the same change write the same key and only one lands.
+    Returns {date: HealthData totals} for the dates that changed.
+    """
+    if not targets:
+        return {}
+
+    ledger = {}
+    rows = (
+        ActivityEntry.objects
+        .filter(user=user, source_type=source_type, source_id__in=[str(source_id) for source_id in targets])
+        .values('source_id', 'date')
+        .annotate(entries=Count('id'), **{field: Sum(field) for field in LEDGER_FIELDS})
+        .order_by()
+    )
+    for row in rows:
+        ledger.setdefault(row['source_id'], []).append(row)
+
+    entries = []
+    for source_id, (day, amounts) in targets.items():
+        source_id = str(source_id)
+        by_date = ledger.get(source_id, [])
+        counted = [row for row in by_date if any(row[field] for field in LEDGER_FIELDS)]
+        sequence = sum(row['entries'] for row in by_date)
+
+        if amounts and any(amounts.values()):
+            changes = [] if counted else [(day, amounts)]
+        else:
+            changes = [(row['date'], {field: -row[field] for field in LEDGER_FIELDS}) for row in counted]
+
+        for offset, (change_date, change) in enumerate(changes):
+            entries.append(ActivityEntry(
+                source_type=source_type,
+                source_id=source_id,
+                date=change_date,
+                idempotency_key=ledger_key(user, source_type, source_id, sequence + offset),
+                **change,
+            ))
+
+    return record_activity(user, entries)
+
+
+def set_source_activity(user, source_type, source_id, day, amounts=None):
+    return set_source_activities(user, source_type, {source_id: (day, amounts)})
+
+
+# ---------------- RECONCILIATION ---------------- #
+def reconcile_daily_activity(start_date=None, end_date=None, user=None, batch_size=500):
+    """
+    Recompute DailyActivityLog from the ledger for a date range in bulk
+    and push any difference into HealthData, so totals that drifted from
+    the ledger (rows edited by hand, activity logged before the ledger
+    existed) match it again. Activity synced from devices is untouched.
+    Safe to run while activity is being recorded. Returns the number of
+    days corrected.
+    """
+    entries = ActivityEntry.objects.all()
+    logs = DailyActivityLog.objects.all()
+    if user is not None:
+        entries = entries.filter(user=user)
+        logs = logs.filter(user=user)
+    if start_date is not None:
+        entries = entries.filter(date__gte=start_date)
+        logs = logs.filter(date__gte=start_date)
+    if end_date is not None:
+        entries = entries.filter(date__lte=end_date)
+        logs = logs.filter(date__lte=end_date)
+
+    with transaction.atomic():
+        # Give every ledger day a row, then lock the rows before reading the
+        # ledger. record_activity writes its entries and adds them to these
+        # rows in one transaction, so it either committed before the lock
+        # (the ledger read sees its entries) or waits and adds them on top
+        # of the corrected totals. Rows it creates after the lock match the
+        # ledger already and are left alone.
+        DailyActivityLog.objects.bulk_create(
+            [
+                DailyActivityLog(user_id=user_id, date=day)
+                for user_id, day in entries.values_list('user', 'date').distinct().order_by()
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        logged = {
+            (row['user'], row['date']): row
+            for row in logs.select_for_update().order_by('user', 'date').values('user', 'date', *LEDGER_FIELDS)
+        }
+        truth = {
+            (row['user'], row['date']): row
+            for row in entries.values('user', 'date').annotate(**{f: Sum(f) for f in LEDGER_FIELDS}).order_by()
+        }
+
+        corrected = []
+        deltas = {}
+        for key, current in logged.items():
+            expected = truth.get(key, {})
+            delta = {field: (expected.get(field) or 0) - (current.get(field) or 0) for field in LEDGER_FIELDS}
+            if not any(abs(amount) > 1e-9 for amount in delta.values()):
+                continue
+            user_id, day = key
+            corrected.append(DailyActivityLog(
+                user_id=user_id, date=day, **{field: expected.get(field) or 0 for field in LEDGER_FIELDS}
+            ))
+            deltas.setdefault(user_id, {})[day] = delta
+
+        DailyActivityLog.objects.bulk_create(
+            corrected,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['user', 'date'],
+            update_fields=list(LEDGER_FIELDS) + ['updated_at'],
+        )
+        for user_id, increments in deltas.items():
+            _accumulate(HealthData, ACTIVITY_FIELDS, user_id, increments)
+
+    return len(corrected)
@@ -1,9 +1,17 @@
-import os
-import json
-from google import genai
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize Gemini API
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+from . import llm_cache, llm_gateway
+from .json_stream import JSONObjectStream, JSONSchema, PartialJSON, parse_llm_json
+from .meal_templates import template_meal_plan
+from .plan_correction import correct_meal_plan
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner')
+FOOD_FIELDS = ('name', 'calories', 'protein', 'carbs', 'fat')
+
+# Long plans are requested in windows of this many days, several at a time
+PLAN_WINDOW_DAYS = 7
+MAX_PARALLEL_WINDOWS = 4
+MAX_WINDOW_ATTEMPTS = 2
 
 
 def generate_meal_image_prompt(meal_name, meal_type):
@@ -31,21 +39,8 @@ The image should match a soft pastel glassmorphism AI assistant interface with:
 Make the food look fresh, healthy, and appealing."""
 
 
-def generate_meal_plan(calories, diet_type, allergies, goal, days, feedback=None):
-    """
-    Generate a personalized meal plan using Google Gemini AI
-    
-    Args:
-        calories (int): Daily calorie target
-        diet_type (str): Dietary preference (vegetarian, vegan, keto, etc.)
-        allergies (str): Comma-separated list of allergies
-        goal (str): Fitness goal (lose weight, gain muscle, maintain, etc.)
-        days (int): Number of days to generate (7, 30, 90, 180, 365)
-        feedback (dict): User's recent eating patterns for smart recommendations
-    
-    Returns:
-        dict: Meal plan structured by day with breakfast, lunch, dinner
-    """
+def build_meal_plan_prompt(calories, diet_type, allergies, goal, days, feedback=None, first_day=1, total_days=None):
+    """Gemini prompt for `days` days of a meal plan, optionally one window of a longer plan"""
     feedback_text = ""
 
     if feedback:
@@ -59,8 +54,16 @@ def generate_meal_plan(calories, diet_type, allergies, goal, days, feedback=None
         Adjust the new meal plan to correct imbalances and match user preferences.
         """
 
+    window_text = ""
+    if total_days and total_days > days:
+        window_text = f"""
+    These are days {first_day}-{first_day + days - 1} of a {total_days}-day plan.
+    Number the days in your JSON from 1 to {days}.
+    """
+
     prompt = f"""
     Create a {days}-day healthy meal plan with VARIETY - each day should have DIFFERENT meals.
+    {window_text}
 
     Daily calories target: {calories}
     Diet type: {diet_type}
@@ -133,31 +136,178 @@ def generate_meal_plan(calories, diet_type, allergies, goal, days, feedback=None
     - If total is short, add more food items or increase portions
     - Each meal should have 3-5 items to comfortably reach the calorie target
     """
+    return prompt
 
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
+
+def validate_meal_day(day, meals):
+    """Raise ValueError unless one day has all meals with complete food items"""
+    if not isinstance(meals, dict):
+        raise ValueError(f"Day {day} missing from meal plan")
+    for meal_type in MEAL_TYPES:
+        foods = meals.get(meal_type)
+        if not isinstance(foods, list) or not foods:
+            raise ValueError(f"Day {day} has no {meal_type}")
+        for food in foods:
+            if not isinstance(food, dict):
+                raise ValueError(f"Day {day} {meal_type} item is not an object")
+            missing = [field for field in FOOD_FIELDS if field not in food]
+            if missing:
+                raise ValueError(f"Day {day} {meal_type} item missing {', '.join(missing)}")
+
+
+def meal_plan_schema(days):
+    """Days 1..days, each with all meals and food fields"""
+    return JSONSchema(lambda key, meals: validate_meal_day(int(key), meals), expected=range(1, days + 1))
+
+
+def plan_windows(days, window_days=PLAN_WINDOW_DAYS):
+    """Split a plan into (first_day, length) windows of at most window_days days"""
+    return [(first, min(window_days, days - first + 1)) for first in range(1, days + 1, window_days)]
+
+
+def missing_windows(plan, days, window_days=PLAN_WINDOW_DAYS):
+    """(first_day, length) windows covering the days of 1..days missing from plan"""
+    windows = []
+    for day in range(1, days + 1):
+        if str(day) in plan:
+            continue
+        if windows and sum(windows[-1]) == day and windows[-1][1] < window_days:
+            windows[-1] = (windows[-1][0], windows[-1][1] + 1)
+        else:
+            windows.append((day, 1))
+    return windows
+
+
+def generate_meal_plan_window(llm, calories, diet_type, allergies, goal, first_day, length, total_days, feedback=None,
+                              use_cache=True):
+    """
+    Request and validate one window of the plan, with days numbered
+    1..length. Raises PartialJSON holding the valid days when some are
+    cut off or broken. Prompts carrying the user's intake feedback are
+    personal and never cached.
+    """
+    prompt = build_meal_plan_prompt(
+        calories, diet_type, allergies, goal, length,
+        feedback=feedback, first_day=first_day, total_days=total_days
+    )
+    schema = meal_plan_schema(length)
+    return llm_cache.generate(
+        prompt, client=llm, use_cache=use_cache and not feedback, parse=lambda text: parse_llm_json(text, schema)
+    )
+
+
+def generate_meal_plan(calories, diet_type, allergies, goal, days, feedback=None,
+                       llm=None, window_days=PLAN_WINDOW_DAYS, max_workers=MAX_PARALLEL_WINDOWS, use_cache=True):
+    """
+    Generate a personalized meal plan using Google Gemini AI
+    
+    The plan is requested in windows of window_days days, up to max_workers
+    at a time. Valid days of a cut off or partly broken response are kept
+    and only the missing days are requested again; days still missing
+    after MAX_WINDOW_ATTEMPTS fall back to the template plan. Portions
+    are then rescaled to hit the calorie target, and days that can't be
+    rescaled are replaced from the template plan too.
+    
+    Args:
+        calories (int): Daily calorie target
+        diet_type (str): Dietary preference (vegetarian, vegan, keto, etc.)
+        allergies (str): Comma-separated list of allergies
+        goal (str): Fitness goal (lose weight, gain muscle, maintain, etc.)
+        days (int): Number of days to generate (7, 30, 90, 180, 365)
+        feedback (dict): User's recent eating patterns for smart recommendations
+        llm: Gemini client to use, defaults to the shared gateway client
+        use_cache (bool): Reuse cached responses for identical prompts; pass
+            False to always ask Gemini for a new plan
+    
+    Returns:
+        dict: Meal plan structured by day with breakfast, lunch, dinner
+    """
+    plan = {}
+    pending = plan_windows(days, window_days)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as pool:
+        for attempt in range(MAX_WINDOW_ATTEMPTS):
+            futures = {
+                pool.submit(
+                    generate_meal_plan_window, llm, calories, diet_type, allergies, goal,
+                    first_day, length, days, feedback, use_cache
+                ): (first_day, length)
+                for first_day, length in pending
+            }
+            for future, (first_day, length) in futures.items():
+                try:
+                    window = future.result()
+                except PartialJSON as e:
+                    print(f"Keeping {e.report['units']} of {length} meal plan days from day {first_day}: {e.report}")
+                    window = e.value
+                except Exception as e:
+                    print(f"Error generating meal plan days {first_day}-{first_day + length - 1} with Gemini: {e}")
+                    continue
+                for day, meals in window.items():
+                    plan[str(first_day + int(day) - 1)] = meals
+            pending = missing_windows(plan, days, window_days)
+            if not pending:
+                break
+
+    for first_day, length in pending:
+        # Fallback to simple plan for the days the API could not produce
+        window = generate_fallback_plan(
+            calories, diet_type, length, allergies=allergies, goal=goal, first_day=first_day
         )
-        
-        # Extract JSON from response
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.startswith('```'):
-            response_text = response_text[3:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        
-        response_text = response_text.strip()
-        
-        return json.loads(response_text)
-    except Exception as e:
-        print(f"Error generating meal plan with Gemini: {e}")
-        # Fallback to simple plan if API fails
-        return generate_fallback_plan(calories, diet_type, days)
+        for day in range(1, length + 1):
+            plan[str(first_day + day - 1)] = window[str(day)]
+    plan = {str(day): plan[str(day)] for day in range(1, days + 1)}
+
+    report = correct_meal_plan(plan, calories, days, diet_type=diet_type, goal=goal)
+    for day in report['impossible_days']:
+        print(f"Replacing meal plan day {day}: its portions can't be scaled to {calories} calories")
+        plan[str(day)] = generate_fallback_plan(
+            calories, diet_type, 1, allergies=allergies, goal=goal, first_day=day
+        )["1"]
+    return plan
+
+
+def stream_meal_plan_days(calories, diet_type, allergies, goal, days, feedback=None,
+                          llm=None, window_days=PLAN_WINDOW_DAYS):
+    """
+    Yield (day_number, meals, is_fallback) as Gemini streams each day.
+
+    Windows are streamed one after another so the first day arrives after
+    a few seconds. Each day's portions are rescaled to the calorie target
+    as it arrives; days that can't be, and days a window fails to deliver,
+    are filled from the template plan.
+    """
+    for first_day, length in plan_windows(days, window_days):
+        received = set()
+        try:
+            prompt = build_meal_plan_prompt(
+                calories, diet_type, allergies, goal, length,
+                feedback=feedback, first_day=first_day, total_days=days
+            )
+            parser = JSONObjectStream()
+            for chunk in llm_gateway.generate_content_stream(prompt, client=llm):
+                for key, meals in parser.feed(chunk.text or ''):
+                    try:
+                        day = int(key)
+                        validate_meal_day(day, meals)
+                        if correct_meal_plan({"1": meals}, calories, 1, diet_type=diet_type, goal=goal)['impossible_days']:
+                            raise ValueError(f"portions can't be scaled to {calories} calories")
+                    except ValueError as e:
+                        print(f"Skipping invalid streamed meal plan day {key}: {e}")
+                        continue
+                    if 1 <= day <= length and day not in received:
+                        received.add(day)
+                        yield first_day + day - 1, meals, False
+        except Exception as e:
+            print(f"Error streaming meal plan days {first_day}-{first_day + length - 1} with Gemini: {e}")
+
+        if len(received) < length:
+            fallback = generate_fallback_plan(
+                calories, diet_type, length, allergies=allergies, goal=goal, first_day=first_day
+            )
+            for day in range(1, length + 1):
+                if day not in received:
+                    yield first_day + day - 1, fallback[str(day)], True
 
 
 def generate_meal_image(meal_name, meal_type):
@@ -174,9 +324,9 @@ def generate_meal_image(meal_name, meal_type):
     try:
         prompt = generate_meal_image_prompt(meal_name, meal_type)
         
-        response = client.models.generate_images(
+        response = llm_gateway.generate_images(
+            prompt,
             model='imagen-3.0-generate-001',
-            prompt=prompt,
             number_of_images=1,
             aspect_ratio='1:1',
             safety_filter_level='block_some',
@@ -193,44 +343,9 @@ def generate_meal_image(meal_name, meal_type):
         return None
 
 
-def generate_fallback_plan(calories, diet_type, days):
-    """Simple fallback meal plan if API fails"""
-    if diet_type in ['vegetarian', 'vegan']:
-        breakfast = [
-            {"name": "Oatmeal with Berries", "calories": 250, "protein": 8, "carbs": 45, "fat": 5},
-            {"name": "Banana", "calories": 105, "protein": 1, "carbs": 27, "fat": 0}
-        ]
-        lunch = [
-            {"name": "Quinoa Salad", "calories": 350, "protein": 12, "carbs": 55, "fat": 10},
-            {"name": "Mixed Vegetables", "calories": 80, "protein": 3, "carbs": 15, "fat": 1}
-        ]
-        dinner = [
-            {"name": "Tofu Stir Fry", "calories": 300, "protein": 18, "carbs": 25, "fat": 15},
-            {"name": "Brown Rice", "calories": 215, "protein": 5, "carbs": 45, "fat": 2}
-        ]
-    else:
-        breakfast = [
-            {"name": "Scrambled Eggs", "calories": 200, "protein": 14, "carbs": 2, "fat": 15},
-            {"name": "Whole Wheat Toast", "calories": 140, "protein": 6, "carbs": 26, "fat": 2}
-        ]
-        lunch = [
-            {"name": "Grilled Chicken Breast", "calories": 280, "protein": 53, "carbs": 0, "fat": 6},
-            {"name": "Sweet Potato", "calories": 180, "protein": 4, "carbs": 41, "fat": 0}
-        ]
-        dinner = [
-            {"name": "Baked Salmon", "calories": 350, "protein": 39, "carbs": 0, "fat": 20},
-            {"name": "Quinoa", "calories": 220, "protein": 8, "carbs": 39, "fat": 4}
-        ]
-    
-    plan = {}
-    for day in range(1, days + 1):
-        plan[str(day)] = {
-            "breakfast": breakfast,
-            "lunch": lunch,
-            "dinner": dinner
-        }
-    
-    return plan
+def generate_fallback_plan(calories, diet_type, days, allergies='', goal=None, first_day=1):
+    """Meal plan built locally from the bundled food table, for when the API fails"""
+    return template_meal_plan(calories, diet_type, allergies, goal, days, first_day=first_day)
 
 
 def recalculate_meal_plan(user_intake_data, target_calories, diet_type, allergies, goal, remaining_days):
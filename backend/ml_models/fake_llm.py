@@ -0,0 +1,238 @@
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from google.genai import errors
+
+from .ai_meal_planner import generate_fallback_plan
+
+DEFAULT_FAKE_SETTINGS = {
+    'DISTRIBUTION': 'lognormal',  # fixed, uniform or lognormal
+    'LATENCY_SECONDS': 2.0,  # median latency of a response
+    'LATENCY_SPREAD': 0.5,  # lognormal sigma, or +/- fraction for uniform
+    'SECONDS_PER_1K_CHARS': 0.1,  # longer responses take longer
+    'FAILURE_RATE': 0.0,  # share of calls that fail with a 503
+    'TRUNCATION_RATE': 0.0,  # share of responses cut off halfway
+    'STREAM_CHUNK_CHARS': 400,
+    'SEED': None,
+}
+
+EXERCISES = (
+    ('Jumping Jacks', 'cardio', '3 sets of 30 seconds', 30),
+    ('Push-ups', 'strength', '3 sets of 12 reps', 40),
+    ('Bodyweight Squats', 'strength', '3 sets of 15 reps', 45),
+    ('Plank', 'core', '3 sets of 45 seconds', 25),
+    ('Mountain Climbers', 'hiit', '3 sets of 30 seconds', 50),
+    ('Walking Lunges', 'strength', '3 sets of 10 reps per leg', 45),
+    ('Downward Dog Flow', 'yoga', '5 minutes', 20),
+    ('Hamstring Stretch', 'flexibility', '3 minutes', 10),
+    ('Burpees', 'hiit', '3 sets of 10 reps', 60),
+    ('Bicycle Crunches', 'core', '3 sets of 20 reps', 30),
+)
+
+MARATHON_WEEK = (
+    ('Monday', 'Easy Run', 5, 'Comfortable conversational pace'),
+    ('Tuesday', 'Rest Day', 0, 'Recovery and stretching'),
+    ('Wednesday', 'Tempo Run', 6, 'Middle 3 km at threshold pace'),
+    ('Thursday', 'Cross-Training', 0, '30 minutes cycling or swimming'),
+    ('Friday', 'Easy Run', 5, 'Keep heart rate low'),
+    ('Saturday', 'Long Run', 12, 'Slow and steady'),
+    ('Sunday', 'Rest Day', 0, 'Full rest'),
+)
+
+# Real meal plans miss their calorie targets; each meal is off by up to this share
+MEAL_CALORIE_DRIFT = 0.15
+
+# 1x1 transparent PNG
+PLACEHOLDER_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)
+
+
+def fake_settings(overrides=None):
+    return {**DEFAULT_FAKE_SETTINGS, **(overrides or {})}
+
+
+# ---------------- RESPONSES ---------------- #
+def _exercises(rng, count):
+    exercises = []
+    for name, workout_type, reps, calories in rng.sample(EXERCISES, count):
+        exercises.append({
+            "name": name,
+            "workout_type": workout_type,
+            "reps_or_duration": reps,
+            "calories": calories
+        })
+    return exercises
+
+
+def fake_meal_plan(prompt, rng):
+    days = int(re.search(r'Create a (\d+)-day', prompt).group(1))
+    calories = int(re.search(r'Daily calories target: (\d+)', prompt).group(1))
+    diet_type = re.search(r'Diet type: (\S+)', prompt).group(1)
+    plan = generate_fallback_plan(calories, diet_type, days)
+    for meals in plan.values():
+        for items in meals.values():
+            drift = rng.uniform(1 - MEAL_CALORIE_DRIFT, 1 + MEAL_CALORIE_DRIFT)
+            for item in items:
+                for field in ('calories', 'protein', 'carbs', 'fat'):
+                    item[field] = round(item[field] * drift)
+    return plan
+
+
+def fake_workout_plan(prompt, rng):
+    num_days = int(re.search(r'Generate a (\d+)-day', prompt).group(1))
+    days = []
+    for day_number in range(1, num_days + 1):
+        is_rest_day = day_number % 7 == 0
+        exercises = [] if is_rest_day else _exercises(rng, rng.randint(6, 8))
+        days.append({
+            "day_number": day_number,
+            "day_name": f"Day {day_number} - {'Rest' if is_rest_day else 'Full Body'}",
+            "is_rest_day": is_rest_day,
+            "total_duration_minutes": 0 if is_rest_day else 45,
+            "total_calories": sum(e["calories"] for e in exercises),
+            "exercises": exercises
+        })
+    return {
+        "plan_title": f"Personalized {num_days}-Day Workout Plan",
+        "total_days": num_days,
+        "days": days
+    }
+
+
+def fake_daily_workout(prompt, rng):
+    day_number = int(re.search(r'TODAY ONLY \(Day (\d+)\)', prompt).group(1))
+    exercises = _exercises(rng, rng.randint(6, 8))
+    return {
+        "workout_name": f"Day {day_number} - Full Body",
+        "total_duration_minutes": 45,
+        "total_calories": sum(e["calories"] for e in exercises),
+        "exercises": exercises
+    }
+
+
+def fake_adaptive_workout(prompt, rng):
+    exercises = _exercises(rng, 8)
+    return {
+        "plan_title": "Adaptive Workout Plan",
+        "total_duration_minutes": 45,
+        "total_calories": sum(e["calories"] for e in exercises),
+        "exercise_count": len(exercises),
+        "adaptation_note": "Matches your recent workout frequency",
+        "exercises": exercises
+    }
+
+
+def fake_marathon_plan(prompt, rng):
+    schedule = [
+        {"day": day, "run_type": run_type, "distance_km": distance, "notes": notes}
+        for day, run_type, distance, notes in MARATHON_WEEK
+    ]
+    return {
+        "plan_title": "Marathon Training Plan - Week 1",
+        "weekly_mileage_km": sum(day["distance_km"] for day in schedule),
+        "workouts_per_week": sum(1 for day in schedule if day["distance_km"]),
+        "estimated_weekly_calories": 2500,
+        "weekly_schedule": schedule
+    }
+
+
+# First matching marker in the prompt decides the response schema
+RESPONDERS = (
+    ('healthy meal plan', fake_meal_plan),
+    ('TODAY ONLY', fake_daily_workout),
+    ('ADAPTIVE workout plan', fake_adaptive_workout),
+    ('marathon training plan', fake_marathon_plan),
+    ('personalized workout plan', fake_workout_plan),
+)
+
+
+# ---------------- CLIENT ---------------- #
+class FakeGeminiClient:
+    """
+    Offline stand-in for genai.Client.
+
+    Answers meal, workout and marathon prompts with schema-valid JSON after
+    a simulated latency, and fails or truncates a configurable share of
+    calls. Select it with LLM_GATEWAY['BACKEND'] = 'fake'.
+    """
+
+    def __init__(self, config=None):
+        self.config = fake_settings(config)
+        self.rng = random.Random(self.config['SEED'])
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.models = self
+
+    def _call_rng(self):
+        """A generator of its own for each call, so concurrent calls stay reproducible"""
+        with self.lock:
+            self.calls += 1
+            return random.Random(self.rng.random())
+
+    def latency(self, rng, chars=0):
+        config = self.config
+        base = config['LATENCY_SECONDS']
+        if config['DISTRIBUTION'] == 'uniform':
+            base *= 1 + rng.uniform(-config['LATENCY_SPREAD'], config['LATENCY_SPREAD'])
+        elif config['DISTRIBUTION'] == 'lognormal':
+            base *= rng.lognormvariate(0, config['LATENCY_SPREAD'])
+        return max(0.0, base + config['SECONDS_PER_1K_CHARS'] * chars / 1000)
+
+    def _fail(self, rng):
+        if rng.random() < self.config['FAILURE_RATE']:
+            time.sleep(self.latency(rng))
+            raise errors.ServerError(503, {'error': {
+                'code': 503, 'message': 'Fake Gemini is overloaded', 'status': 'UNAVAILABLE'
+            }})
+
+    def _respond(self, contents):
+        """Response text for the prompt and how long it takes to generate"""
+        rng = self._call_rng()
+        self._fail(rng)
+
+        text = '{}'
+        for marker, responder in RESPONDERS:
+            if marker in contents:
+                text = json.dumps(responder(contents, rng))
+                break
+
+        if rng.random() < self.config['TRUNCATION_RATE']:
+            text = text[:len(text) // 2]
+        return text, self.latency(rng, len(text))
+
+    @staticmethod
+    def _usage(contents, text):
+        prompt_tokens = len(contents) // 4
+        output_tokens = len(text) // 4
+        return SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+
+    def generate_content(self, model, contents):
+        text, delay = self._respond(contents)
+        time.sleep(delay)
+        return SimpleNamespace(text=text, usage_metadata=self._usage(contents, text))
+
+    def generate_content_stream(self, model, contents):
+        text, delay = self._respond(contents)
+        size = self.config['STREAM_CHUNK_CHARS']
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+        for index, chunk in enumerate(chunks):
+            time.sleep(delay / len(chunks))
+            usage = self._usage(contents, text) if index == len(chunks) - 1 else None
+            yield SimpleNamespace(text=chunk, usage_metadata=usage)
+
+    def generate_images(self, model, prompt, **kwargs):
+        rng = self._call_rng()
+        self._fail(rng)
+        time.sleep(self.latency(rng))
+        image = SimpleNamespace(data=PLACEHOLDER_PNG, image_bytes=PLACEHOLDER_PNG)
+        return SimpleNamespace(generated_images=[SimpleNamespace(image=image)])
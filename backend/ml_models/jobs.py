@@ -0,0 +1,172 @@
+import hashlib
+import json
+import socket
+import threading
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils.timezone import now
+from rest_framework.response import Response
+
+from .models import GenerationJob
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Running jobs older than this are assumed to belong to a dead worker
+STALE_JOB_AGE = timedelta(minutes=15)
+
+# kind -> handler(user, data) returning a DRF Response
+JOB_HANDLERS = {}
+
+
+def generation_job(kind):
+    """Register a (user, data) -> Response handler that can run inline or as a job"""
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def wants_async(request):
+    value = request.data.get("async", False)
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def job_payload(data):
+    """Request data as a plain dict, without the async flag"""
+    if hasattr(data, 'dict'):
+        data = data.dict()
+    return {key: value for key, value in data.items() if key != 'async'}
+
+
+def dedup_key(kind, payload):
+    raw = json.dumps([kind, payload], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def enqueue_job(user, kind, payload):
+    """
+    Queue a job, or return the user's identical queued/running job.
+
+    Returns (job, created).
+    """
+    key = dedup_key(kind, payload)
+
+    for _ in range(2):
+        existing = GenerationJob.objects.filter(
+            user=user, dedup_key=key, status__in=ACTIVE_STATUSES
+        ).first()
+        if existing:
+            return existing, False
+        try:
+            with transaction.atomic():
+                job = GenerationJob.objects.create(user=user, kind=kind, payload=payload, dedup_key=key)
+            return job, True
+        except IntegrityError:
+            # Lost a race with an identical request; pick up its job
+            continue
+
+    raise RuntimeError("Could not enqueue generation job")
+
+
+def run_or_enqueue(request, kind):
+    """Run a registered handler for the request, or queue it when the client asks for async"""
+    if not wants_async(request):
+        return JOB_HANDLERS[kind](request.user, request.data)
+
+    job, created = enqueue_job(request.user, kind, job_payload(request.data))
+    return Response({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "deduplicated": not created
+    }, status=202)
+
+
+def job_status(job):
+    data = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+    if job.status in ('succeeded', 'failed'):
+        data["status_code"] = job.status_code
+        data["result"] = job.result
+        data["error"] = job.error
+    return data
+
+
+# ---------------- WORKER ---------------- #
+def worker_name():
+    return f"{socket.gethostname()}:{threading.get_ident()}"
+
+
+def claim_next_job(worker, kinds=None):
+    """Atomically move the oldest queued job to running, or return None"""
+    with transaction.atomic():
+        jobs = GenerationJob.objects.select_for_update(skip_locked=True).filter(status='queued')
+        if kinds:
+            jobs = jobs.filter(kind__in=kinds)
+        job = jobs.order_by('created_at').first()
+        if job is None:
+            return None
+
+        job.status = 'running'
+        job.started_at = now()
+        job.attempts += 1
+        job.worker = worker
+        job.save(update_fields=['status', 'started_at', 'attempts', 'worker'])
+    return job
+
+
+def run_job(job):
+    """Run a claimed job's handler and store its response"""
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        response = handler(job.user, job.payload)
+        job.result = response.data
+        job.status_code = response.status_code
+        job.status = 'succeeded' if response.status_code < 400 else 'failed'
+    except Exception as e:
+        job.result = None
+        job.status_code = 500
+        job.error = str(e)
+        job.status = 'failed'
+
+    job.finished_at = now()
+    job.save(update_fields=['result', 'status_code', 'error', 'status', 'finished_at'])
+    return job
+
+
+def requeue_stale_jobs(older_than):
+    """Put back jobs left running by a worker that died more than `older_than` ago"""
+    return GenerationJob.objects.filter(
+        status='running', started_at__lt=now() - older_than
+    ).update(status='queued', worker='')
+
+
+def work(stop_event, kinds=None, poll_interval=1.0, exit_when_idle=False):
+    """Worker thread loop: claim and run jobs until stop_event is set"""
+    # Handlers register themselves when the views module is imported
+    from . import views  # noqa: F401
+
+    worker = worker_name()
+    while not stop_event.is_set():
+        close_old_connections()
+        job = claim_next_job(worker, kinds)
+        if job is None:
+            if exit_when_idle:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        run_job(job)
+
@@ -0,0 +1,327 @@
+import json
+import re
+import threading
+
+
+class JSONObjectStream:
+    """
+    Incrementally parse the members of the outermost JSON object in LLM output.
+
+    Text can be fed in arbitrary chunks; feed() returns every (key, value)
+    member of the outermost object that has been completed so far. Anything
+    before the opening brace (code fences, prose) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.member_start = None
+        self.done = False
+
+    def feed(self, text):
+        if self.done:
+            return []
+
+        self.buffer += text
+        members = []
+
+        while self.pos < len(self.buffer) and not self.done:
+            ch = self.buffer[self.pos]
+
+            if self.depth == 0:
+                if ch == '{':
+                    self.depth = 1
+                    self.member_start = self.pos + 1
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                self.depth += 1
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    self._flush(members)
+                    self.done = True
+            elif ch == ',' and self.depth == 1:
+                self._flush(members)
+                self.member_start = self.pos + 1
+
+            self.pos += 1
+
+        # Drop text that has already been consumed
+        if self.member_start is not None and self.member_start > 0:
+            self.buffer = self.buffer[self.member_start:]
+            self.pos -= self.member_start
+            self.member_start = 0
+
+        return members
+
+    def _flush(self, members):
+        text = self.buffer[self.member_start:self.pos].strip()
+        if not text:
+            return
+        try:
+            members.extend(json.loads('{' + text + '}').items())
+        except json.JSONDecodeError:
+            pass
+
+
+# ---------------- WHOLE RESPONSES ---------------- #
+# Strings (possibly cut off at the end of the text) and structural characters
+TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*(?:"|$)|[{}\[\],]', re.S)
+KEY_RE = re.compile(r'\s*"((?:[^"\\]|\\.)*)"\s*:')
+# A trailing comma before a closing bracket, skipping over strings
+TRAILING_COMMA_RE = re.compile(r'("(?:[^"\\]|\\.)*")|,(\s*[}\]])', re.S)
+
+
+class PartialJSON(ValueError):
+    """Only part of the expected JSON could be recovered; `value` holds that part"""
+
+    def __init__(self, value, report):
+        super().__init__(f"Partial JSON response: {report}")
+        self.value = value
+        self.report = report
+
+
+class ParseStats:
+    """How LLM responses parsed in this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.complete = self.repaired = self.salvaged = self.failed = 0
+        self.units_salvaged = self.units_dropped = 0
+
+    def record(self, outcome, units=0, dropped=0):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if outcome == 'salvaged':
+                self.units_salvaged += units
+            self.units_dropped += dropped
+
+    def as_dict(self):
+        return {
+            'complete': self.complete,
+            'repaired': self.repaired,
+            'salvaged': self.salvaged,
+            'failed': self.failed,
+            'units_salvaged': self.units_salvaged,
+            'units_dropped': self.units_dropped,
+        }
+
+
+stats = ParseStats()
+
+
+def _scan(text, start):
+    """
+    Spans of the members of the object whose body starts at `start`, plus
+    the spans of the elements of members whose value is an array.
+    Returns (members, closed) where each member is [start, end, elements]
+    and an end of None marks a member cut off by the end of the text.
+    """
+    members = [[start, None, None]]
+    stack = []  # containers open inside the object
+    for match in TOKEN_RE.finditer(text, start):
+        token = match.group()
+        if token[0] == '"':
+            continue
+        pos = match.start()
+        member = members[-1]
+        elements = member[2]
+        if token in '{[':
+            if not stack and token == '[':
+                member[2] = [[pos + 1, None]]
+            stack.append(token)
+        elif token in '}]':
+            if not stack:
+                member[1] = pos
+                return members, True
+            stack.pop()
+            if not stack and elements is not None:
+                elements[-1][1] = pos
+        elif not stack:
+            member[1] = pos
+            members.append([pos + 1, None, None])
+        elif len(stack) == 1 and elements is not None:
+            elements[-1][1] = pos
+            elements.append([pos + 1, None])
+    return members, False
+
+
+def extract_json(text):
+    """
+    The outermost JSON object in LLM output, recovering what it can.
+
+    Code fences and prose around the object are ignored and trailing
+    commas are removed. When the object still doesn't parse as a whole
+    (cut off, or a stray token in one place), its members are parsed one
+    by one, and members holding arrays element by element, so only the
+    broken pieces are lost.
+    Returns (value, truncated, pieces dropped, repaired); raises
+    ValueError if there is no object.
+    """
+    start = text.find('{')
+    if start < 0:
+        raise ValueError("No JSON object in response")
+
+    for repaired in (False, True):
+        if repaired:
+            cleaned = TRAILING_COMMA_RE.sub(lambda match: match.group(1) or match.group(2), text)
+            if cleaned == text:
+                break
+            text = cleaned
+        end = text.rfind('}')
+        if end > start:
+            try:
+                value = json.loads(text[start:end + 1])
+                if isinstance(value, dict):
+                    return value, False, 0, repaired
+            except json.JSONDecodeError:
+                pass
+
+    members, closed = _scan(text, start + 1)
+    value = {}
+    dropped = 0
+    for member_start, member_end, elements in members:
+        member = text[member_start:member_end]
+        if not member.strip():
+            continue
+        if member_end is not None:
+            try:
+                value.update(json.loads('{' + member + '}'))
+                continue
+            except json.JSONDecodeError:
+                pass
+        key = KEY_RE.match(member)
+        if key is None or elements is None:
+            dropped += 1
+            continue
+        items = []
+        for element_start, element_end in elements:
+            element = text[element_start:element_end]
+            if not element.strip():
+                continue
+            try:
+                if element_end is None:
+                    raise json.JSONDecodeError("Cut off", element, 0)
+                items.append(json.loads(element))
+            except json.JSONDecodeError:
+                dropped += 1
+        value[json.loads(f'"{key.group(1)}"')] = items
+
+    return value, not closed, dropped, True
+
+
+def require_fields(*fields):
+    """Unit validator: a dict with all of `fields`"""
+    def validate(key, unit):
+        if not isinstance(unit, dict):
+            raise ValueError(f"{key} is not an object")
+        missing = [field for field in fields if field not in unit]
+        if missing:
+            raise ValueError(f"{key} missing {', '.join(missing)}")
+    return validate
+
+
+class JSONSchema:
+    """
+    What a plan's JSON must hold: units (days, exercises...) that can be
+    kept or dropped one by one.
+
+    Units are the elements of the `units` array, or the members of the
+    object itself when `units` is None. `expected` is the number of units
+    (or, for members, their keys) a complete response has; `required`
+    are other top-level keys that must be present.
+    """
+
+    def __init__(self, validate_unit, units=None, expected=None, required=(), min_units=1):
+        self.validate_unit = validate_unit
+        self.units = units
+        self.expected = expected
+        self.required = required
+        self.min_units = min_units
+
+    def _valid(self, key, unit):
+        try:
+            self.validate_unit(key, unit)
+            return True
+        except ValueError as e:
+            print(f"Dropping invalid {key} from LLM response: {e}")
+            return False
+
+    def check(self, value):
+        """Drop invalid units in place; returns (units kept, units dropped, units missing)"""
+        missing = [key for key in self.required if key not in value]
+        if missing:
+            raise ValueError(f"Response missing {', '.join(missing)}")
+
+        if self.units is None:
+            expected = [str(key) for key in self.expected] if self.expected is not None else list(value)
+            invalid = 0
+            for key in list(value):
+                if key not in expected:
+                    del value[key]
+                elif not self._valid(key, value[key]):
+                    del value[key]
+                    invalid += 1
+            return len(value), invalid, sum(1 for key in expected if key not in value)
+
+        units = value.get(self.units)
+        if not isinstance(units, list):
+            raise ValueError(f"Response has no {self.units} list")
+        kept = [unit for index, unit in enumerate(units) if self._valid(f"{self.units}[{index}]", unit)]
+        value[self.units] = kept
+        expected = self.expected if self.expected is not None else len(units)
+        return len(kept), len(units) - len(kept), max(expected - len(kept), 0)
+
+
+def parse_llm_json(text, schema=None):
+    """
+    Parse an LLM response against a schema, keeping every valid unit.
+
+    Returns the value when the response is complete. When units are cut
+    off, broken or missing, raises PartialJSON carrying the valid ones, so
+    callers can keep them and re-request the rest, and response caches
+    never store the damaged text. Raises ValueError when fewer than
+    schema.min_units are usable.
+    """
+    try:
+        value, truncated, dropped, repaired = extract_json(text)
+        if schema is None:
+            kept = invalid = missing = 0
+            if truncated or dropped:
+                raise ValueError("Response is cut off or malformed")
+        else:
+            kept, invalid, missing = schema.check(value)
+            if kept < schema.min_units:
+                raise ValueError(f"Only {kept} usable {schema.units or 'units'} in response")
+    except ValueError:
+        stats.record('failed')
+        raise
+
+    # Elements extract_json had to drop are damage even when the schema
+    # expects no fixed count and so finds nothing missing
+    if not (truncated or dropped or invalid or missing):
+        stats.record('repaired' if repaired else 'complete')
+        return value
+
+    report = {
+        'truncated': truncated,
+        'units': kept,
+        'dropped': dropped + invalid,
+        'missing': missing,
+    }
+    stats.record('salvaged', units=kept, dropped=dropped + invalid)
+    raise PartialJSON(value, report)
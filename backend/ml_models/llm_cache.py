@@ -0,0 +1,161 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import llm_gateway
+
+DEFAULT_CACHE_SETTINGS = {
+    'BACKEND': 'memory',  # memory, django or none
+    'TTL_SECONDS': 6 * 60 * 60,
+    'MAX_ENTRIES': 256,  # memory backend only
+    'CACHE_ALIAS': 'default',  # django backend only
+}
+
+
+def cache_settings():
+    return {**DEFAULT_CACHE_SETTINGS, **getattr(settings, 'LLM_RESPONSE_CACHE', {})}
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so indentation changes don't defeat the cache"""
+    return re.sub(r'\s+', ' ', prompt).strip()
+
+
+def cache_key(model, prompt):
+    digest = hashlib.sha256(f"{model}\n{normalize_prompt(prompt)}".encode()).hexdigest()
+    return f"llm:{digest}"
+
+
+class InProcessCache:
+    """Thread-safe LRU of response texts with a per-entry TTL"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, text = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return text
+
+    def set(self, key, text):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, text)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DjangoCache:
+    """Response texts stored in one of the CACHES configured in settings"""
+
+    def __init__(self, alias, ttl):
+        self.alias = alias
+        self.ttl = ttl
+
+    def get(self, key):
+        return caches[self.alias].get(key)
+
+    def set(self, key, text):
+        caches[self.alias].set(key, text, self.ttl)
+
+    def clear(self):
+        caches[self.alias].clear()
+
+
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = self.misses = self.stores = self.bypassed = 0
+
+    def incr(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'bypassed': self.bypassed,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+stats = CacheStats()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The configured cache backend, or None when caching is disabled"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = cache_settings()
+            if config['BACKEND'] == 'memory':
+                _backend = InProcessCache(config['MAX_ENTRIES'], config['TTL_SECONDS'])
+            elif config['BACKEND'] == 'django':
+                _backend = DjangoCache(config['CACHE_ALIAS'], config['TTL_SECONDS'])
+            else:
+                _backend = False
+        return _backend or None
+
+
+def reset_backend():
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def generate(contents, model=None, client=None, use_cache=True, parse=None):
+    """
+    Run generate_content through the response cache and the LLM gateway.
+
+    Returns the response text, or parse(text) when `parse` is given. Only
+    texts that parse are stored, so truncated or malformed responses are
+    never cached. Pass use_cache=False for personalized prompts whose
+    answer should not be reused.
+    """
+    parse = parse or (lambda text: text)
+    model = model or llm_gateway.default_model()
+
+    backend = get_backend() if use_cache else None
+    if backend is None:
+        stats.incr('bypassed')
+        return parse(llm_gateway.generate_content(contents, model=model, client=client).text)
+
+    key = cache_key(model, contents)
+    text = backend.get(key)
+    if text is not None:
+        stats.incr('hits')
+        return parse(text)
+
+    stats.incr('misses')
+    text = llm_gateway.generate_content(contents, model=model, client=client).text
+    result = parse(text)
+    backend.set(key, text)
+    stats.incr('stores')
+    return result
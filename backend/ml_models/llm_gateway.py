@@ -0,0 +1,214 @@
+import os
+import random
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from google import genai
+from google.genai import errors, types
+
+DEFAULT_GATEWAY_SETTINGS = {
+    'BACKEND': 'gemini',  # gemini, or fake for offline load tests
+    'FAKE': {},  # ml_models.fake_llm options
+    'MODEL': 'gemini-2.5-flash',
+    'TIMEOUT_SECONDS': 120,
+    'MAX_CONCURRENT_REQUESTS': 8,
+    'MAX_RETRIES': 3,
+    'BACKOFF_BASE_SECONDS': 1.0,
+    'BACKOFF_MAX_SECONDS': 20.0,
+}
+
+
+def gateway_settings():
+    return {**DEFAULT_GATEWAY_SETTINGS, **getattr(settings, 'LLM_GATEWAY', {})}
+
+
+def default_model():
+    return gateway_settings()['MODEL']
+
+
+# ---------------- SHARED CLIENT ---------------- #
+_client = None
+_client_lock = threading.Lock()
+_semaphore = None
+
+
+def get_client():
+    """The process-wide Gemini client, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            config = gateway_settings()
+            if config['BACKEND'] == 'fake':
+                from .fake_llm import FakeGeminiClient
+                _client = FakeGeminiClient(config['FAKE'])
+            else:
+                pool_size = config['MAX_CONCURRENT_REQUESTS']
+                _client = genai.Client(
+                    api_key=os.getenv("GEMINI_API_KEY"),
+                    http_options=types.HttpOptions(
+                        timeout=int(config['TIMEOUT_SECONDS'] * 1000),
+                        # Keep connections to the API open between requests
+                        client_args={'limits': httpx.Limits(
+                            max_connections=pool_size,
+                            max_keepalive_connections=pool_size,
+                        )},
+                    ),
+                )
+        return _client
+
+
+def _get_semaphore():
+    global _semaphore
+    with _client_lock:
+        if _semaphore is None:
+            _semaphore = threading.BoundedSemaphore(gateway_settings()['MAX_CONCURRENT_REQUESTS'])
+        return _semaphore
+
+
+def reset():
+    """Drop the shared client and limits so new settings take effect"""
+    global _client, _semaphore
+    with _client_lock:
+        _client = None
+        _semaphore = None
+
+
+# ---------------- METRICS ---------------- #
+class LLMMetrics:
+    """Per-model call counts, latency and token usage for this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_model = {}
+
+    def record(self, model, operation, latency, usage=None, retries=0, error=False):
+        with self.lock:
+            entry = self.by_model.setdefault(model, {
+                'calls': 0,
+                'errors': 0,
+                'retries': 0,
+                'latency_ms_total': 0.0,
+                'latency_ms_max': 0.0,
+                'prompt_tokens': 0,
+                'output_tokens': 0,
+                'total_tokens': 0,
+                'operations': {},
+            })
+            latency_ms = latency * 1000
+            entry['calls'] += 1
+            entry['errors'] += int(error)
+            entry['retries'] += retries
+            entry['latency_ms_total'] += latency_ms
+            entry['latency_ms_max'] = max(entry['latency_ms_max'], latency_ms)
+            entry['operations'][operation] = entry['operations'].get(operation, 0) + 1
+            if usage is not None:
+                entry['prompt_tokens'] += usage.prompt_token_count or 0
+                entry['output_tokens'] += usage.candidates_token_count or 0
+                entry['total_tokens'] += usage.total_token_count or 0
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for model, entry in self.by_model.items():
+                result[model] = {
+                    **entry,
+                    'operations': dict(entry['operations']),
+                    'latency_ms_avg': round(entry['latency_ms_total'] / entry['calls'], 1) if entry['calls'] else 0.0,
+                }
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.by_model = {}
+
+
+metrics = LLMMetrics()
+
+
+# ---------------- CALLS ---------------- #
+def is_retryable(exc):
+    """Rate limits, server errors and network failures are worth retrying"""
+    if isinstance(exc, errors.APIError):
+        return exc.code == 429 or (exc.code or 0) >= 500
+    return isinstance(exc, (ConnectionError, TimeoutError, httpx.TransportError))
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)"""
+    config = gateway_settings()
+    ceiling = min(config['BACKOFF_MAX_SECONDS'], config['BACKOFF_BASE_SECONDS'] * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def _call(operation, model, request, client=None):
+    """Run request(client) under the concurrency limit with retries and metrics"""
+    client = client or get_client()
+    max_retries = gateway_settings()['MAX_RETRIES']
+    start = time.perf_counter()
+    attempt = 0
+
+    while True:
+        try:
+            with _get_semaphore():
+                response = request(client)
+        except Exception as e:
+            if attempt < max_retries and is_retryable(e):
+                delay = backoff_delay(attempt)
+                print(f"Gemini {operation} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            metrics.record(model, operation, time.perf_counter() - start, retries=attempt, error=True)
+            raise
+
+        metrics.record(
+            model, operation, time.perf_counter() - start,
+            usage=getattr(response, 'usage_metadata', None), retries=attempt
+        )
+        return response
+
+
+def generate_content(contents, model=None, client=None):
+    """client.models.generate_content through the shared client"""
+    model = model or default_model()
+    return _call(
+        'generate_content', model,
+        lambda c: c.models.generate_content(model=model, contents=contents),
+        client,
+    )
+
+
+def generate_content_stream(contents, model=None, client=None):
+    """
+    Yield generate_content_stream chunks through the shared client.
+
+    The concurrency slot is held until the stream is consumed. Streams are
+    not retried once chunks have been yielded.
+    """
+    model = model or default_model()
+    client = client or get_client()
+    start = time.perf_counter()
+    usage = None
+    error = False
+
+    try:
+        with _get_semaphore():
+            for chunk in client.models.generate_content_stream(model=model, contents=contents):
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                yield chunk
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.record(model, 'generate_content_stream', time.perf_counter() - start, usage=usage, error=error)
+
+
+def generate_images(prompt, model, client=None, **kwargs):
+    """client.models.generate_images through the shared client"""
+    return _call(
+        'generate_images', model,
+        lambda c: c.models.generate_images(model=model, prompt=prompt, **kwargs),
+        client,
+    )
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from ml_models.models import MealItem, MealItemTracking
+
+
+def latest_tracking(field):
+    """Value of `field` from the most recent tracking row of the outer MealItem"""
+    return Subquery(
+        MealItemTracking.objects
+        .filter(meal_item=OuterRef('pk'))
+        .order_by('-timestamp', '-id')
+        .values(field)[:1]
+    )
+
+
+class Command(BaseCommand):
+    help = "Copy each MealItem's latest tracking row into its current_status/current_quantity_ratio/tracked_at"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        items = (
+            MealItem.objects
+            .filter(mealitemtracking__isnull=False)
+            .distinct()
+            .annotate(
+                latest_status=latest_tracking('status'),
+                latest_ratio=latest_tracking('quantity_ratio'),
+                latest_at=latest_tracking('timestamp'),
+            )
+            .only('id')
+            .order_by('id')
+        )
+
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(items.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            for item in batch:
+                item.current_status = item.latest_status
+                item.current_quantity_ratio = item.latest_ratio
+                item.tracked_at = item.latest_at
+            with transaction.atomic():
+                MealItem.objects.bulk_update(batch, ['current_status', 'current_quantity_ratio', 'tracked_at'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled the current tracking of {updated} meal items"))
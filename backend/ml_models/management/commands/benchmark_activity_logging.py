@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from health_data.models import HealthData
+from ml_models.activity import add_activities, add_activity
+
+User = get_user_model()
+
+
+def add_activity_read_modify_write(user, day, calories):
+    """Previous logging path: get_or_create, add in Python, save every column"""
+    health_data, _ = HealthData.objects.get_or_create(
+        user=user,
+        date=day,
+        defaults={'steps': 0, 'calories_burned': 0, 'distance': 0, 'active_minutes': 0}
+    )
+    health_data.calories_burned += calories
+    health_data.active_minutes += 1
+    health_data.save()
+
+
+def add_activity_upsert(user, day, calories):
+    add_activity(user, day, calories_burned=calories, active_minutes=1)
+
+
+def add_activity_batch(user, day, calories):
+    """One call adding to three days at once"""
+    add_activities(user, {
+        day + timedelta(days=offset): {'calories_burned': calories, 'active_minutes': 1} for offset in range(3)
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire parallel activity increments at one HealthData row through the old "
+        "read-modify-write path and the upsert, and report updates lost by each"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--increments', type=int, default=50, help="Increments per thread")
+
+    def run(self, func, user, day, threads, increments):
+        def worker(_):
+            try:
+                for _ in range(increments):
+                    func(user, day, 1.0)
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            errors = [
+                future.exception() for future in [pool.submit(worker, n) for n in range(threads)]
+                if future.exception()
+            ]
+        elapsed = time.perf_counter() - start
+
+        row = HealthData.objects.get(user=user, date=day)
+        return elapsed, row.calories_burned, row.active_minutes, errors
+
+    def handle(self, *args, **options):
+        threads, increments = options['threads'], options['increments']
+        expected = threads * increments
+        user = User.objects.create_user(
+            email='activity-benchmark@fitwell.local', username='activity-benchmark', password=None
+        )
+        try:
+            paths = (
+                ('read-modify-write', add_activity_read_modify_write),
+                ('upsert', add_activity_upsert),
+                ('upsert, 3 days a call', add_activity_batch),
+            )
+            for offset, (name, func) in enumerate(paths):
+                day = date.today() + timedelta(days=offset * 3)
+                elapsed, calories, minutes, errors = self.run(func, user, day, threads, increments)
+                lost = expected - calories
+                self.stdout.write(
+                    f"{name:22} {threads} threads x {increments}: {elapsed * 1000:8.1f} ms, "
+                    f"calories {calories:g}/{expected}, minutes {minutes}/{expected}, "
+                    f"lost {lost:g}, errors {len(errors)}"
+                )
+                for error in errors[:3]:
+                    self.stdout.write(f"    {error!r}")
+        finally:
+            user.delete()
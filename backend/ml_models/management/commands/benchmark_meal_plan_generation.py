@@ -0,0 +1,74 @@
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from ml_models.ai_meal_planner import generate_meal_plan, generate_fallback_plan, PLAN_WINDOW_DAYS
+
+
+class StubGeminiClient:
+    """
+    Local stand-in for genai.Client whose latency grows with the number of
+    days requested, like a real generation. Responses longer than
+    truncate_after_days days come back cut off, as Gemini's do.
+    """
+
+    def __init__(self, base_latency, latency_per_day, truncate_after_days=None, failure_rate=0.0):
+        self.base_latency = base_latency
+        self.latency_per_day = latency_per_day
+        self.truncate_after_days = truncate_after_days
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.models = self
+
+    def generate_content(self, model, contents):
+        with self._lock:
+            self.calls += 1
+        days = int(re.search(r'Create a (\d+)-day', contents).group(1))
+        time.sleep(self.base_latency + self.latency_per_day * days)
+
+        if random.random() < self.failure_rate:
+            raise ConnectionError("Stub Gemini request failed")
+
+        text = json.dumps(generate_fallback_plan(2000, 'none', days))
+        if self.truncate_after_days and days > self.truncate_after_days:
+            text = text[:len(text) // 2]
+        return SimpleNamespace(text=text)
+
+
+class Command(BaseCommand):
+    help = "Measure single-prompt vs windowed meal plan generation latency against a stub Gemini client"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, nargs='+', default=[7, 30, 90, 365])
+        parser.add_argument('--base-latency', type=float, default=1.0, help="Seconds per request")
+        parser.add_argument('--latency-per-day', type=float, default=0.5, help="Seconds per generated day")
+        parser.add_argument('--truncate-after-days', type=int, default=60,
+                            help="Responses for more days than this come back truncated")
+        parser.add_argument('--failure-rate', type=float, default=0.0)
+
+    def run(self, days, **kwargs):
+        stub = StubGeminiClient(
+            self.options['base_latency'],
+            self.options['latency_per_day'],
+            self.options['truncate_after_days'],
+            self.options['failure_rate'],
+        )
+        start = time.perf_counter()
+        plan = generate_meal_plan(2000, 'none', '', 'maintain', days, llm=stub, **kwargs)
+        return time.perf_counter() - start, stub.calls, len(plan)
+
+    def handle(self, *args, **options):
+        self.options = options
+        for days in options['days']:
+            single_time, single_calls, _ = self.run(days, window_days=days, max_workers=1)
+            windowed_time, windowed_calls, planned = self.run(days, window_days=PLAN_WINDOW_DAYS)
+            self.stdout.write(
+                f"{days:>4} days: single prompt {single_time:6.2f}s ({single_calls} calls), "
+                f"windowed {windowed_time:6.2f}s ({windowed_calls} calls, {planned} days)"
+            )
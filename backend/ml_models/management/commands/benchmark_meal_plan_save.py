@@ -0,0 +1,62 @@
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ml_models.ai_meal_planner import generate_fallback_plan
+from ml_models.meal_plans import save_meal_plan
+from ml_models.models import MealPlan, MealPlanVersion, MealItem
+
+User = get_user_model()
+
+
+def save_meal_plan_per_row(user, plan, start_date, days):
+    """Previous persistence path: one INSERT per meal and per item"""
+    version = MealPlanVersion.objects.create(user=user, start_date=start_date)
+    for d in range(days):
+        day_date = start_date + timedelta(days=d)
+        for meal_type, items in plan[str(d + 1)].items():
+            meal = MealPlan.objects.create(user=user, version=version, date=day_date, meal_type=meal_type)
+            for food in items:
+                MealItem.objects.create(
+                    meal=meal,
+                    food_name=food["name"],
+                    calories=food["calories"],
+                    protein=food["protein"],
+                    carbs=food["carbs"],
+                    fat=food["fat"]
+                )
+
+
+class Command(BaseCommand):
+    help = "Compare per-row and bulk meal plan persistence (all writes are rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, nargs='+', default=[7, 90, 365])
+
+    def run(self, func, *args):
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email='benchmark@fitwell.local', username='benchmark', password=None
+            )
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                func(user, *args)
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed, len(queries)
+
+    def handle(self, *args, **options):
+        today = date.today()
+        for days in options['days']:
+            plan = generate_fallback_plan(2000, 'none', days)
+            legacy_time, legacy_queries = self.run(save_meal_plan_per_row, plan, today, days)
+            bulk_time, bulk_queries = self.run(save_meal_plan, plan, today, days)
+            self.stdout.write(
+                f"{days:>4} days: per-row {legacy_time * 1000:8.1f} ms / {legacy_queries:5} queries, "
+                f"bulk {bulk_time * 1000:8.1f} ms / {bulk_queries:3} queries "
+                f"({legacy_time / bulk_time:.1f}x)"
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ml_models.meal_plan_versions import GC_BATCH_SIZE, collect_superseded_meals, superseded_meals
+
+
+class Command(BaseCommand):
+    help = "Delete meals superseded by newer meal plan versions, and versions left empty"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=GC_BATCH_SIZE,
+                            help="Meals deleted per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Count the superseded meals without deleting them")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f"{superseded_meals().count()} superseded meals")
+            return
+
+        meals, versions = collect_superseded_meals(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {meals} superseded meals and {versions} empty versions"
+        ))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ml_models.media_store import decode_data_url, store_image
+from ml_models.models import MealItem
+
+
+class Command(BaseCommand):
+    help = "Move base64 meal images out of MealItem.image_url into the media store"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Meal items loaded (and their blobs held in memory) at a time")
+        parser.add_argument('--dry-run', action='store_true', help="Count the blobs without moving them")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        blobs = MealItem.objects.filter(image_url__startswith='data:').order_by('id')
+
+        if options['dry_run']:
+            self.stdout.write(f"{blobs.count()} meal items hold base64 images")
+            return
+
+        moved = skipped = 0
+        last_id = 0
+        while True:
+            batch = list(blobs.filter(id__gt=last_id).only('id', 'image_url')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            updated = []
+            for item in batch:
+                decoded = decode_data_url(item.image_url)
+                if decoded is None:
+                    skipped += 1
+                    continue
+                data, extension = decoded
+                item.image_url = store_image(data, extension)
+                updated.append(item)
+
+            with transaction.atomic():
+                MealItem.objects.bulk_update(updated, ['image_url'])
+            moved += len(updated)
+            self.stdout.write(f"Moved {moved} images (up to meal item {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} images to the media store, skipped {skipped} undecodable blobs"
+        ))
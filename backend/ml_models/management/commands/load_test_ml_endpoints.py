@@ -0,0 +1,326 @@
+import json
+import math
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from ml_models import json_stream, llm_cache, llm_gateway, plan_correction
+from ml_models.ai_meal_planner import generate_fallback_plan
+from ml_models.meal_plans import save_meal_plan
+from ml_models.models import MealItem, MealItemTracking
+from ml_models.nutrition import rebuild_daily_logs
+
+API = '/api/ml/'
+
+
+# ---------------- SCENARIO ---------------- #
+# (name, method, path, data) run in order by every synthetic user. Paths and
+# data are formatted with the ids remembered from earlier responses.
+SCENARIO = (
+    ('check-active-plan', 'get', 'check-active-plan/', None),
+    ('generate-ai-meal-plan', 'post', 'generate-ai-meal-plan/', {'days': 7, 'force_new': True}),
+    ('generate-ai-meal-plan/stream', 'post', 'generate-ai-meal-plan/stream/', {'days': 3, 'force_new': True}),
+    ('generate-ai-meal-plan (template)', 'post', 'generate-ai-meal-plan/',
+     {'days': 7, 'force_new': True, 'generator': 'template'}),
+    ('meal-plan', 'get', 'meal-plan/', None),
+    ('track-meal-item', 'post', 'track-meal-item/',
+     {'meal_item_id': '{meal_item_id}', 'status': 'eaten', 'quantity_ratio': 1.0}),
+    ('track-meal-items', 'post', 'track-meal-items/',
+     {'items': [{'meal_item_id': '{meal_item_id}', 'status': 'skipped', 'quantity_ratio': 1.0}]}),
+    ('daily_nutrition', 'get', 'daily_nutrition/', None),
+    ('generate-meal-image', 'post', 'generate-meal-image/', {'meal_item_id': '{meal_item_id}'}),
+    ('recalculate-meal-plan', 'post', 'recalculate-meal-plan/', {}),
+    ('workout-plan', 'post', 'workout-plan/', {'duration': '7_days'}),
+    ('active-workout-plan', 'get', 'active-workout-plan/', None),
+    ('active-workout-plan (day window)', 'get', 'active-workout-plan/?from_day=1&to_day=3', None),
+    ('track-workout-exercise', 'post', 'track-workout-exercise/', {'workout_id': '{workout_id}', 'exercise_index': 0}),
+    ('track-workout-exercises', 'post', 'track-workout-exercises/',
+     {'workout_id': '{workout_id}', 'exercises': [{'exercise_index': 0}, {'exercise_index': 1, 'completed': False}]}),
+    ('complete-workout-plan', 'post', 'complete-workout-plan/', {'workout_id': '{workout_id}', 'difficulty': 'just_right'}),
+    ('regenerate-workout-plan', 'post', 'regenerate-workout-plan/', {}),
+    ('workout-plans', 'get', 'workout-plans/', None),
+    ('marathon-plan', 'post', 'marathon-plan/', {}),
+    ('active-marathon-plan', 'get', 'active-marathon-plan/', None),
+    ('track-marathon-day', 'post', 'track-marathon-day/', {'marathon_id': '{marathon_id}', 'day_index': 0}),
+    ('track-marathon-days', 'post', 'track-marathon-days/',
+     {'marathon_id': '{marathon_id}', 'days': [{'day_index': 0}, {'day_index': 1}]}),
+    ('complete-marathon-week', 'post', 'complete-marathon-week/', {'marathon_id': '{marathon_id}', 'difficulty': 'just_right'}),
+    ('marathon-plans', 'get', 'marathon-plans/', None),
+    ('check-active-marathon-plan', 'get', 'check-active-marathon-plan/', None),
+    ('log-workout-calories', 'post', 'log-workout-calories/', {'calories': 150}),
+    ('log-marathon-calories', 'post', 'log-marathon-calories/', {'calories': 300, 'distance_km': 5, 'duration_minutes': 30}),
+    ('daily-workout-summary', 'get', 'daily-workout-summary/', None),
+    ('generate-daily-workout', 'post', 'generate-daily-workout/', {}),
+    ('todays-workout', 'get', 'todays-workout/', None),
+    ('complete-daily-workout', 'post', 'complete-daily-workout/', {'workout_id': '{daily_workout_id}', 'feedback': 'just_right'}),
+    ('check-active-workout-plan', 'get', 'check-active-workout-plan/', None),
+    ('generate-daily-workout (async)', 'post', 'generate-daily-workout/', {'async': True}),
+    ('jobs', 'get', 'jobs/{job_id}/', None),
+    ('delete-meal-plan', 'delete', 'delete-meal-plan/', None),
+)
+
+
+def remember_ids(state, body):
+    """Keep the ids later steps of the scenario refer to"""
+    if 'meals' in body and isinstance(body['meals'], dict):
+        for meal in body['meals'].values():
+            if meal['items']:
+                state.setdefault('meal_item_id', meal['items'][0]['id'])
+    for key in ('workout_id', 'marathon_id', 'job_id'):
+        if key in body:
+            state[key] = body[key]
+    if 'workout' in body and isinstance(body['workout'], dict):
+        state['daily_workout_id'] = body['workout']['id']
+
+
+def fill(value, state):
+    if isinstance(value, dict):
+        return {key: fill(item, state) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, state) for item in value]
+    if isinstance(value, str) and value.startswith('{') and value.endswith('}'):
+        return state.get(value[1:-1])
+    return value
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+# ---------------- SYNTHETIC USERS ---------------- #
+def create_synthetic_users(count, run_id):
+    User = get_user_model()
+    users = []
+    for i in range(count):
+        users.append(User.objects.create_user(
+            username=f"loadtest-{run_id}-{i}",
+            email=f"loadtest-{run_id}-{i}@example.com",
+            password=uuid.uuid4().hex,
+            date_of_birth=date(1990, 1, 1) + timedelta(days=97 * i),
+            height=160 + i % 30,
+            weight=55 + i % 40,
+            gender=('male', 'female')[i % 2],
+            fitness_goal=('lose_weight', 'gain_muscle', 'maintain', 'improve_endurance')[i % 4],
+        ))
+    return users
+
+
+def seed_yesterday(user):
+    """An eaten day of meals so recalculate-meal-plan has intake to work from"""
+    yesterday = date.today() - timedelta(days=1)
+    save_meal_plan(user, generate_fallback_plan(2000, 'none', 1), yesterday, 1)
+    items = MealItem.objects.filter(meal__user=user, meal__date=yesterday)
+    MealItemTracking.objects.bulk_create([
+        MealItemTracking(meal_item=item, status='eaten', quantity_ratio=1.0) for item in items
+    ])
+    items.update(current_status='eaten', current_quantity_ratio=1.0, tracked_at=now())
+    rebuild_daily_logs(start_date=yesterday, end_date=yesterday, user=user)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every api/ml/ endpoint with concurrent synthetic users and report "
+        "latency percentiles, throughput and DB query counts per endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help="Concurrent synthetic users")
+        parser.add_argument('--iterations', type=int, default=1, help="Scenario runs per user")
+        parser.add_argument('--endpoints', nargs='+', help="Only run these scenario steps")
+        parser.add_argument('--latency', type=float, help="Fake LLM median latency in seconds")
+        parser.add_argument('--distribution', choices=['fixed', 'uniform', 'lognormal'])
+        parser.add_argument('--failure-rate', type=float, help="Share of fake LLM calls that fail")
+        parser.add_argument('--truncation-rate', type=float, help="Share of fake LLM responses cut off")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--no-llm-cache', action='store_true', help="Bypass the LLM response cache")
+        parser.add_argument('--real-llm', action='store_true',
+                            help="Call the configured LLM backend instead of the fake one")
+        parser.add_argument('--keep-users', action='store_true', help="Don't delete the synthetic users")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['iterations'] < 1:
+            raise CommandError("--users and --iterations must be at least 1")
+
+        steps = SCENARIO
+        if options['endpoints']:
+            names = {step[0] for step in SCENARIO}
+            unknown = set(options['endpoints']) - names
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            steps = [step for step in SCENARIO if step[0] in options['endpoints']]
+
+        gateway = dict(getattr(settings, 'LLM_GATEWAY', {}))
+        if not options['real_llm']:
+            fake = dict(gateway.get('FAKE', {}))
+            for option, key in (('latency', 'LATENCY_SECONDS'), ('distribution', 'DISTRIBUTION'),
+                                ('failure_rate', 'FAILURE_RATE'), ('truncation_rate', 'TRUNCATION_RATE'),
+                                ('seed', 'SEED')):
+                if options[option] is not None:
+                    fake[key] = options[option]
+            gateway.update(BACKEND='fake', FAKE=fake)
+
+        response_cache = dict(getattr(settings, 'LLM_RESPONSE_CACHE', {}))
+        if options['no_llm_cache']:
+            response_cache['BACKEND'] = 'none'
+
+        with override_settings(LLM_GATEWAY=gateway, LLM_RESPONSE_CACHE=response_cache):
+            llm_gateway.reset()
+            llm_cache.reset_backend()
+            llm_gateway.metrics.reset()
+            llm_cache.stats.reset()
+            plan_correction.stats.reset()
+            json_stream.stats.reset()
+            try:
+                report = self.run(steps, options)
+            finally:
+                llm_gateway.reset()
+                llm_cache.reset_backend()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def run(self, steps, options):
+        run_id = uuid.uuid4().hex[:8]
+        users = create_synthetic_users(options['users'], run_id)
+        for user in users:
+            seed_yesterday(user)
+
+        samples = {step[0]: [] for step in steps}
+        samples_lock = threading.Lock()
+        start_barrier = threading.Barrier(len(users))
+
+        def run_user(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            start_barrier.wait()
+            try:
+                for _ in range(options['iterations']):
+                    state = {}
+                    for name, method, path, data in steps:
+                        result = self.request(client, method, path, data, state)
+                        with samples_lock:
+                            samples[name].append(result)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run_user, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if not options['keep_users']:
+            get_user_model().objects.filter(id__in=[user.id for user in users]).delete()
+
+        return self.summarise(samples, elapsed, options)
+
+    def request(self, client, method, path, data, state):
+        """Run one scenario step; returns (seconds, query count, status code)"""
+        data = fill(data, state)
+        try:
+            path = API + path.format(**state)
+        except KeyError:
+            path = None
+        if path is None or (data and None in data.values()):
+            # An earlier step that provides an id failed
+            return None
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            try:
+                response = getattr(client, method)(path, data, format='json')
+                if response.streaming:
+                    content = b''.join(response.streaming_content)
+                else:
+                    content = response.content
+            except Exception as e:
+                # Count unhandled view errors as 500s and keep the user going
+                self.stderr.write(f"{method.upper()} {path} raised {e!r}")
+                return time.perf_counter() - started, len(queries), 500
+            elapsed = time.perf_counter() - started
+
+        if response.get('Content-Type', '').startswith('application/json'):
+            body = json.loads(content or b'{}')
+            if isinstance(body, dict):
+                remember_ids(state, body)
+        return elapsed, len(queries), response.status_code
+
+    def summarise(self, samples, elapsed, options):
+        endpoints = {}
+        total = 0
+        for name, results in samples.items():
+            done = [result for result in results if result is not None]
+            latencies = sorted(result[0] * 1000 for result in done)
+            query_counts = [result[1] for result in done]
+            total += len(done)
+            endpoints[name] = {
+                'requests': len(done),
+                'skipped': len(results) - len(done),
+                'errors': sum(1 for result in done if result[2] >= 400),
+                'p50_ms': round(percentile(latencies, 50), 1),
+                'p95_ms': round(percentile(latencies, 95), 1),
+                'p99_ms': round(percentile(latencies, 99), 1),
+                'max_ms': round(latencies[-1], 1) if latencies else 0.0,
+                'avg_queries': round(sum(query_counts) / len(query_counts), 1) if query_counts else 0.0,
+                'max_queries': max(query_counts, default=0),
+            }
+
+        return {
+            'users': options['users'],
+            'iterations': options['iterations'],
+            'llm_backend': llm_gateway.gateway_settings()['BACKEND'],
+            'elapsed_seconds': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'endpoints': endpoints,
+            'llm': llm_gateway.metrics.snapshot(),
+            'llm_cache': llm_cache.stats.as_dict(),
+            'plan_correction': plan_correction.stats.as_dict(),
+            'json_parsing': json_stream.stats.as_dict(),
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{report['users']} users x {report['iterations']} iterations against the "
+            f"{report['llm_backend']} LLM backend: {report['requests']} requests in "
+            f"{report['elapsed_seconds']}s ({report['throughput_rps']} req/s)\n"
+        )
+        self.stdout.write(
+            f"{'endpoint':<32}{'reqs':>6}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'avg q':>8}{'max q':>8}"
+        )
+        for name, row in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:<32}{row['requests']:>6}{row['errors']:>6}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+                f"{row['p99_ms']:>10}{row['avg_queries']:>8}{row['max_queries']:>8}"
+            )
+            if row['skipped']:
+                self.stdout.write(f"{'':<4}{row['skipped']} skipped after an earlier step failed")
+
+        self.stdout.write('')
+        for model, entry in report['llm'].items():
+            self.stdout.write(
+                f"LLM {model}: {entry['calls']} calls, {entry['errors']} errors, {entry['retries']} retries, "
+                f"avg {entry['latency_ms_avg']} ms, {entry['total_tokens']} tokens"
+            )
+        self.stdout.write(f"LLM response cache: {report['llm_cache']}")
+        self.stdout.write(f"Meal plan calorie correction: {report['plan_correction']}")
+        self.stdout.write(f"LLM JSON parsing: {report['json_parsing']}")
@@ -0,0 +1,21 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.nutrition import lock_daily_logs
+
+
+class Command(BaseCommand):
+    help = "Lock DailyNutritionLog rollups for past days (run nightly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help="Lock days before this date (YYYY-MM-DD), defaults to today")
+
+    def handle(self, *args, **options):
+        try:
+            before = date.fromisoformat(options['before']) if options['before'] else date.today()
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        locked = lock_daily_logs(before)
+        self.stdout.write(self.style.SUCCESS(f"Locked {locked} daily nutrition logs before {before}"))
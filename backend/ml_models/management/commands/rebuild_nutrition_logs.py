@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.nutrition import rebuild_daily_logs
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rebuild/backfill DailyNutritionLog rollups from raw meal tracking"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First date to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--end', help="Last date to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--user', help="Only rebuild rollups for this email")
+        parser.add_argument('--include-locked', action='store_true',
+                            help="Also overwrite days that have been locked")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            start_date = date.fromisoformat(options['start']) if options['start'] else None
+            end_date = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(email=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+
+        written = rebuild_daily_logs(
+            start_date=start_date,
+            end_date=end_date,
+            user=user,
+            include_locked=options['include_locked'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily nutrition logs"))
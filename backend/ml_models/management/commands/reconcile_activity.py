@@ -0,0 +1,40 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.activity import reconcile_daily_activity
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Recompute DailyActivityLog rollups from the activity ledger and correct HealthData drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First date to reconcile (YYYY-MM-DD)")
+        parser.add_argument('--end', help="Last date to reconcile (YYYY-MM-DD)")
+        parser.add_argument('--user', help="Only reconcile activity for this email")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            start_date = date.fromisoformat(options['start']) if options['start'] else None
+            end_date = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(email=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+
+        corrected = reconcile_daily_activity(
+            start_date=start_date,
+            end_date=end_date,
+            user=user,
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Corrected {corrected} daily activity logs"))
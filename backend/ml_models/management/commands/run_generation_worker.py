@@ -0,0 +1,48 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ml_models.jobs import work, requeue_stale_jobs, STALE_JOB_AGE
+
+
+class Command(BaseCommand):
+    help = "Run queued LLM generation jobs (meal, workout and marathon plans)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.GENERATION_WORKER_CONCURRENCY,
+                            help="Number of jobs to run at the same time")
+        parser.add_argument('--kinds', nargs='+',
+                            help="Only run these job kinds, e.g. meal_plan workout_plan")
+        parser.add_argument('--poll-interval', type=float, default=settings.GENERATION_WORKER_POLL_INTERVAL,
+                            help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(STALE_JOB_AGE)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale jobs")
+
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(
+                target=work,
+                args=(stop_event, options['kinds'], options['poll_interval'], options['once']),
+                daemon=True,
+            )
+            for _ in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(self.style.SUCCESS(f"Generation worker running with {len(threads)} threads"))
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1.0)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping after running jobs finish...")
+            stop_event.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,126 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import connection
+from django.utils.timezone import now
+
+from .ai_meal_planner import generate_meal_image
+from .meal_plan_versions import current_meals_filter
+from .media_store import store_image
+from .models import MealImage, MealItem
+
+# How long prefetch waits for another request generating the same dish
+IMAGE_WAIT_SECONDS = 60
+# How long an API request waits before telling the client to come back
+IMAGE_REQUEST_WAIT_SECONDS = 5
+IMAGE_POLL_INTERVAL = 0.5
+
+# A pending catalog entry not touched for this long belongs to a dead request
+STALE_PENDING_AGE = timedelta(minutes=2)
+
+PREFETCH_WORKERS = 4
+
+
+class ImagePending(Exception):
+    """Another request is still generating the dish's image"""
+
+
+def normalize_dish(food_name):
+    """Lowercase and drop punctuation and extra spaces so spelling variants share an image"""
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', food_name.lower())).strip()
+
+
+def dish_key(food_name, meal_type):
+    return f"{meal_type.lower()}:{normalize_dish(food_name)}"[:150]
+
+
+def _claim_stale(entry):
+    """Take over a pending entry whose generating request died"""
+    return MealImage.objects.filter(
+        id=entry.id, status='pending', updated_at__lt=now() - STALE_PENDING_AGE
+    ).update(updated_at=now()) == 1
+
+
+def _generate(entry):
+    try:
+        image_data = generate_meal_image(entry.food_name, entry.meal_type)
+        url = store_image(image_data) if image_data else None
+    except Exception as e:
+        print(f"Error generating catalog image for {entry.dish_key}: {e}")
+        url = None
+    if url is None:
+        # Let the next request for this dish try again
+        MealImage.objects.filter(id=entry.id, status='pending').delete()
+        return None
+
+    MealImage.objects.filter(id=entry.id).update(status='ready', image_url=url, updated_at=now())
+    return url
+
+
+def catalog_image(food_name, meal_type, wait=IMAGE_WAIT_SECONDS):
+    """
+    URL of the shared image for a dish, generating it if nobody has yet.
+
+    Only one request generates each dish: the one that creates its pending
+    catalog entry. Concurrent requests for the same dish wait for that
+    generation instead of starting their own. Returns None if generation
+    fails; raises ImagePending if it doesn't finish within `wait` seconds.
+    """
+    entry, created = MealImage.objects.get_or_create(
+        dish_key=dish_key(food_name, meal_type),
+        defaults={'food_name': food_name, 'meal_type': meal_type}
+    )
+    if entry.status == 'ready':
+        return entry.image_url
+    if created or _claim_stale(entry):
+        return _generate(entry)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(IMAGE_POLL_INTERVAL)
+        entry = MealImage.objects.filter(id=entry.id).first()
+        if entry is None:
+            return None
+        if entry.status == 'ready':
+            return entry.image_url
+    raise ImagePending(entry.dish_key)
+
+
+def _prefetch_dish(dish):
+    food_name, meal_type, item_ids = dish
+    try:
+        try:
+            url = catalog_image(food_name, meal_type)
+        except ImagePending:
+            return None
+        if url:
+            MealItem.objects.filter(id__in=item_ids, image_url__isnull=True).update(image_url=url)
+        return url
+    finally:
+        # Runs in a pool thread with its own connection
+        connection.close()
+
+
+def prefetch_plan_images(user, start_date, end_date, max_workers=PREFETCH_WORKERS):
+    """Fill in images for every distinct dish in the user's plan between the two dates"""
+    items = MealItem.objects.filter(
+        current_meals_filter('meal__'),
+        meal__user=user,
+        meal__date__range=(start_date, end_date),
+        image_url__isnull=True,
+    ).values_list('id', 'food_name', 'meal__meal_type')
+
+    dishes = {}
+    for item_id, food_name, meal_type in items:
+        dish = dishes.setdefault(dish_key(food_name, meal_type), (food_name, meal_type, []))
+        dish[2].append(item_id)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        urls = list(pool.map(_prefetch_dish, dishes.values()))
+
+    return {
+        'dishes': len(dishes),
+        'images_ready': sum(1 for url in urls if url),
+    }
@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import ActiveMealPlan, MealPlan, MealPlanVersion
+
+GC_BATCH_SIZE = 500
+
+
+def current_meals_filter(prefix=''):
+    """
+    Q for meals that aren't superseded by a newer version. Pass
+    prefix='meal__' to filter MealItems by their meal.
+    """
+    return (
+        Q(**{f'{prefix}version__replaced_from__isnull': True})
+        | Q(**{f'{prefix}date__lt': F(f'{prefix}version__replaced_from')})
+    )
+
+
+def current_meals(user):
+    """The user's meal plan as readers see it: every meal of the version owning its date"""
+    return MealPlan.objects.filter(current_meals_filter(), user=user)
+
+
+def locked_active_plan(user):
+    """Get or create the user's active version pointer, locked for update"""
+    ActiveMealPlan.objects.get_or_create(user=user)
+    return ActiveMealPlan.objects.select_for_update().select_related('version').get(user=user)
+
+
+def supersede_versions(user, from_date, keep=None):
+    """
+    Hand every date from from_date onwards to `keep` (or to no version):
+    the user's other versions stop there. Touches version rows only; their
+    meals stay until collect_superseded_meals deletes them.
+
+    Must run in the same transaction as locked_active_plan().
+    """
+    versions = MealPlanVersion.objects.filter(
+        Q(replaced_from__isnull=True) | Q(replaced_from__gt=from_date), user=user
+    )
+    if keep is not None:
+        versions = versions.exclude(pk=keep.pk)
+    return versions.update(replaced_from=from_date)
+
+
+def superseded_meals(user=None):
+    meals = MealPlan.objects.filter(version__replaced_from__isnull=False, date__gte=F('version__replaced_from'))
+    if user is not None:
+        meals = meals.filter(user=user)
+    return meals
+
+
+def collect_superseded_meals(user=None, batch_size=GC_BATCH_SIZE):
+    """
+    Delete superseded meals (with their items and tracking) a batch at a
+    time, then versions left with no meals. Returns (meals, versions) deleted.
+    """
+    superseded = superseded_meals(user)
+    versions = MealPlanVersion.objects.filter(replaced_from__isnull=False, activemealplan__isnull=True)
+    if user is not None:
+        versions = versions.filter(user=user)
+
+    deleted_meals = 0
+    while True:
+        ids = list(superseded.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            MealPlan.objects.filter(id__in=ids).delete()
+        deleted_meals += len(ids)
+
+    deleted_versions, _ = versions.filter(meals__isnull=True).delete()
+    return deleted_meals, deleted_versions
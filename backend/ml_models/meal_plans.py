@@ -0,0 +1,150 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Prefetch
+
+from .media_store import absolute_image_url
+from .meal_plan_versions import current_meals, locked_active_plan, supersede_versions
+from .models import MealPlan, MealPlanVersion, MealItem
+from .nutrition import rebuild_daily_logs
+
+BULK_BATCH_SIZE = 500
+
+# Longest range get_meal_plan returns in one call
+MAX_RANGE_DAYS = 31
+
+
+def build_meal_plan_rows(user, plan, start_date, days):
+    """Unsaved MealPlan rows and, per row, the list of food dicts for it"""
+    meals = []
+    foods = []
+    for d in range(days):
+        day_date = start_date + timedelta(days=d)
+        for meal_type, items in plan[str(d + 1)].items():
+            meals.append(MealPlan(user=user, date=day_date, meal_type=meal_type))
+            foods.append(items)
+    return meals, foods
+
+
+def save_meal_plan(user, plan, start_date, days, replace_from=None, batch_size=BULK_BATCH_SIZE):
+    """
+    Persist a generated plan ({"1": {"breakfast": [...], ...}, ...}) in bulk.
+
+    With replace_from, the meals go into a new version that takes over the
+    user's plan from that date onwards; otherwise they are added to the
+    active version. The old meals aren't deleted here: the swap is a
+    pointer update in the same transaction, so readers see either plan
+    but never a mix, and a failed write keeps the old one.
+    Returns the new version and the number of versions superseded and rows written.
+    """
+    meals, foods = build_meal_plan_rows(user, plan, start_date, days)
+    replaces_from = replace_from or start_date
+
+    with transaction.atomic():
+        active = locked_active_plan(user)
+        version = active.version
+        if replace_from is not None or version is None:
+            version = MealPlanVersion.objects.create(user=user, start_date=replaces_from)
+            active.version = version
+            active.save()
+        elif replaces_from < version.start_date:
+            version.start_date = replaces_from
+            version.save(update_fields=['start_date'])
+
+        superseded = supersede_versions(user, replaces_from, keep=version)
+
+        for meal in meals:
+            meal.version = version
+        MealPlan.objects.bulk_create(meals, batch_size=batch_size)
+
+        items = [
+            MealItem(
+                meal=meal,
+                food_name=food["name"],
+                calories=food["calories"],
+                protein=food["protein"],
+                carbs=food["carbs"],
+                fat=food["fat"]
+            )
+            for meal, meal_foods in zip(meals, foods)
+            for food in meal_foods
+        ]
+        MealItem.objects.bulk_create(items, batch_size=batch_size)
+
+        if superseded:
+            # Tracking of superseded meals no longer counts, so drop it from the rollups too
+            rebuild_daily_logs(start_date=replaces_from, user=user)
+
+    return {
+        'version': version.id,
+        'superseded_versions': superseded,
+        'meals_created': len(meals),
+        'items_created': len(items),
+    }
+
+
+def retire_meal_plan(user, from_date):
+    """
+    Supersede all of the user's meals from from_date onwards, leaving no
+    active version. Returns the number of versions superseded.
+    """
+    with transaction.atomic():
+        active = locked_active_plan(user)
+        superseded = supersede_versions(user, from_date)
+        active.version = None
+        active.save()
+        rebuild_daily_logs(start_date=from_date, user=user)
+    return superseded
+
+
+def active_plan_summary(user, today):
+    """
+    First and last date, meal count and day count of the user's meals from
+    today onwards, in one aggregate query. Counts are 0 with no active plan.
+    """
+    return current_meals(user).filter(date__gte=today).aggregate(
+        start_date=Min('date'),
+        end_date=Max('date'),
+        meals=Count('id'),
+        days=Count('date', distinct=True),
+    )
+
+
+def meal_plan_days(user, start_date, end_date, request=None):
+    """
+    The user's current meals between two dates (inclusive) as
+    {date: {meal_type: {"items": [...], "total_calories": ...}}}.
+    Image URLs are made absolute for the host of `request`.
+
+    Two queries whatever the range: the meals, then all their items, which
+    carry their latest tracking state.
+    """
+    meals = (
+        current_meals(user)
+        .filter(date__range=(start_date, end_date))
+        .order_by('date', 'id')
+        .prefetch_related(Prefetch('items', queryset=MealItem.objects.order_by('id')))
+    )
+
+    days = {}
+    for meal in meals:
+        items = [
+            {
+                'id': item.id,
+                'name': item.food_name,
+                'calories': item.calories,
+                'protein': item.protein,
+                'carbs': item.carbs,
+                'fat': item.fat,
+                'image_url': absolute_image_url(item.image_url, request),
+                'tracked': item.current_status is not None,
+                'status': item.current_status,
+                'quantity_ratio': item.current_quantity_ratio if item.current_status is not None else 1.0
+            }
+            for item in meal.items.all()
+        ]
+        days.setdefault(meal.date, {})[meal.meal_type] = {
+            'items': items,
+            'total_calories': round(sum(item['calories'] for item in items), 1)
+        }
+    return days
@@ -0,0 +1,315 @@
+import csv
+import re
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+FOOD_TABLE_PATH = Path(__file__).resolve().parent / 'data' / 'foods.csv'
+
+MEAL_SPLIT = {'breakfast': 0.30, 'lunch': 0.35, 'dinner': 0.35}
+MEAL_CODES = {'breakfast': 'b', 'lunch': 'l', 'dinner': 'd'}
+
+# Every meal is one main, one side and one extra (fruit, drink or snack)
+ROLES = ('main', 'side', 'extra')
+KINDS = ('plant', 'dairy', 'egg', 'fish', 'meat')
+TAGS = ('gluten', 'grain', 'legume', 'dairy', 'egg', 'nuts', 'peanut', 'soy', 'fish', 'shellfish', 'sesame')
+
+# Portions are scaled by one factor per meal to hit its calorie share
+MIN_PORTION = 0.5
+MAX_PORTION = 2.0
+
+# Meals are held this far inside the macro ranges so rounding the
+# portioned grams can't push a day back out
+MACRO_MARGIN = 0.01
+
+# Score added to meals outside the ranges, more than any in-range meal scores
+OUT_OF_RANGE_PENALTY = 100.0
+
+# Meal options kept per meal type, and at most this many per main dish
+OPTIONS_PER_MEAL = 48
+OPTIONS_PER_MAIN = 3
+
+DIET_KINDS = {
+    'vegetarian': {'plant', 'dairy', 'egg'},
+    'vegan': {'plant'},
+    'pescatarian': {'plant', 'dairy', 'egg', 'fish'},
+}
+DIET_EXCLUDED_TAGS = {
+    'vegetarian': {'fish', 'shellfish'},
+    'vegan': {'dairy', 'egg', 'fish', 'shellfish'},
+    'gluten_free': {'gluten'},
+    'dairy_free': {'dairy'},
+    'paleo': {'grain', 'legume', 'dairy'},
+}
+# Foods getting more than this share of their calories from carbs are left out
+DIET_MAX_CARB_SHARE = {'keto': 0.35, 'low_carb': 0.5}
+
+# (low, high) share of calories from protein, carbs and fat
+MACRO_RANGES = {
+    'default': ((0.15, 0.35), (0.40, 0.60), (0.20, 0.35)),
+    'keto': ((0.15, 0.35), (0.0, 0.10), (0.60, 0.80)),
+    'low_carb': ((0.20, 0.40), (0.10, 0.30), (0.30, 0.55)),
+}
+HIGH_PROTEIN_GOALS = {'lose_weight', 'gain_muscle', 'build_muscle', 'weight_loss', 'muscle_gain'}
+
+# Allergy words -> food table tag
+ALLERGY_TAGS = {
+    'nut': 'nuts', 'tree nut': 'nuts', 'almond': 'nuts', 'cashew': 'nuts', 'walnut': 'nuts', 'pecan': 'nuts',
+    'peanut': 'peanut',
+    'milk': 'dairy', 'dairy': 'dairy', 'lactose': 'dairy', 'cheese': 'dairy',
+    'egg': 'egg',
+    'gluten': 'gluten', 'wheat': 'gluten',
+    'soy': 'soy', 'soya': 'soy',
+    'fish': 'fish',
+    'shellfish': 'shellfish', 'shrimp': 'shellfish', 'prawn': 'shellfish', 'crab': 'shellfish', 'lobster': 'shellfish',
+    'sesame': 'sesame',
+}
+
+
+class FoodTable:
+    """The bundled food list as NumPy arrays, one row per food"""
+
+    def __init__(self, rows):
+        self.names = [row['name'] for row in rows]
+        self.lower_names = [name.lower() for name in self.names]
+        # calories, protein, carbs, fat per portion
+        self.nutrients = np.array(
+            [[float(row[field]) for field in ('calories', 'protein', 'carbs', 'fat')] for row in rows],
+            dtype=np.float32
+        )
+        self.meals = np.array(
+            [[code in row['meals'] for code in MEAL_CODES.values()] for row in rows], dtype=bool
+        )
+        self.roles = np.array([ROLES.index(row['role']) for row in rows], dtype=np.int8)
+        self.kinds = np.array([KINDS.index(row['kind']) for row in rows], dtype=np.int8)
+        self.tags = np.array(
+            [sum(1 << TAGS.index(tag) for tag in row['tags'].split(';') if tag) for row in rows],
+            dtype=np.uint16
+        )
+
+    def tag_mask(self, tags):
+        return np.uint16(sum(1 << TAGS.index(tag) for tag in tags))
+
+
+def load_food_table(path=FOOD_TABLE_PATH):
+    with open(path, newline='', encoding='utf-8') as f:
+        return FoodTable(list(csv.DictReader(f)))
+
+
+FOODS = load_food_table()
+
+
+def normalize_diet(diet_type):
+    return re.sub(r'[\s-]+', '_', (diet_type or 'none').strip().lower())
+
+
+def allergy_terms(allergies):
+    """Lowercase singular allergy words from a comma separated list"""
+    terms = []
+    for term in re.split(r'[,;/]|\band\b', (allergies or '').lower()):
+        term = term.strip()
+        if term.endswith('s') and not term.endswith('ss'):
+            term = term[:-1]
+        if term and term != 'none':
+            terms.append(term)
+    return terms
+
+
+def allowed_foods(diet_type, allergies, foods=FOODS):
+    """Boolean mask of the foods that fit the diet and avoid every allergy"""
+    diet = normalize_diet(diet_type)
+    allowed = np.ones(len(foods.names), dtype=bool)
+
+    if diet in DIET_KINDS:
+        allowed &= np.isin(foods.kinds, [KINDS.index(kind) for kind in DIET_KINDS[diet]])
+    if diet in DIET_MAX_CARB_SHARE:
+        calories = np.maximum(foods.nutrients[:, 0], 1)
+        allowed &= foods.nutrients[:, 2] * 4 / calories <= DIET_MAX_CARB_SHARE[diet]
+
+    excluded = set(DIET_EXCLUDED_TAGS.get(diet, ()))
+    for term in allergy_terms(allergies):
+        if term in ALLERGY_TAGS:
+            excluded.add(ALLERGY_TAGS[term])
+        # Anything named after the allergen goes too, e.g. "banana"
+        allowed &= np.array([term not in name for name in foods.lower_names], dtype=bool)
+    if excluded:
+        allowed &= (foods.tags & foods.tag_mask(excluded)) == 0
+
+    return allowed
+
+
+def check_diet_foods(diet_type, allergies, foods=FOODS):
+    """Raise ValueError when the diet and allergies leave no food for some meal"""
+    allowed = allowed_foods(diet_type, allergies, foods)
+    for meal_type, column in zip(MEAL_CODES, foods.meals.T):
+        if not (allowed & column).any():
+            raise ValueError(f"No foods left for {meal_type} with this diet and these allergies")
+
+
+def macro_ranges(diet_type, goal):
+    ranges = np.array(MACRO_RANGES.get(normalize_diet(diet_type), MACRO_RANGES['default']), dtype=np.float32)
+    if normalize_diet(goal) in HIGH_PROTEIN_GOALS:
+        ranges[0] = np.maximum(ranges[0], (0.25, 0.40))
+    return ranges
+
+
+def macro_shares(totals):
+    """Share of calories from protein, carbs and fat for rows of (calories, protein, carbs, fat)"""
+    return totals[..., 1:] * np.array([4, 4, 9], dtype=np.float32) / np.maximum(totals[..., :1], 1)
+
+
+def ranges_miss(shares, ranges):
+    return (np.maximum(ranges[:, 0] - shares, 0) + np.maximum(shares - ranges[:, 1], 0)).sum(axis=-1)
+
+
+def meal_options(meal_type, target, allowed, ranges, foods=FOODS):
+    """
+    The best (main, side, extra) combinations for one meal as arrays of
+    food indices, portion scale and rank among combinations with the same
+    main, in order of preference.
+
+    Every combination is scored at once: how far the portion scale needed
+    to hit `target` calories strays from 1, whether it stays within
+    MIN_PORTION..MAX_PORTION, and how far the macro split falls outside
+    `ranges`. Combinations that hit the calories with their macros inside
+    the ranges always rank above those that don't, which are only kept
+    for day_menu() to balance a day with when there are too few. Roles
+    with no allowed food are left out of the meal.
+    """
+    in_meal = allowed & foods.meals[:, list(MEAL_CODES).index(meal_type)]
+    pools = [np.flatnonzero(in_meal & (foods.roles == role)) for role in range(len(ROLES))]
+    pools = [pool for pool in pools if len(pool)]
+    if not pools:
+        raise ValueError(f"No foods left for {meal_type} with this diet and these allergies")
+
+    # Every combination of one food per role, as rows of food indices
+    combos = np.stack([grid.ravel() for grid in np.meshgrid(*pools, indexing='ij')], axis=1)
+    totals = foods.nutrients[combos].sum(axis=1)
+    calories = np.maximum(totals[:, 0], 1)
+
+    scale = target / calories
+    portion = np.clip(scale, MIN_PORTION, MAX_PORTION)
+    calorie_miss = np.abs(portion - scale) / scale
+
+    shares = macro_shares(totals)
+    score = 4 * calorie_miss + ranges_miss(shares, ranges) + 0.15 * np.abs(np.log(portion))
+
+    # Meals inside the ranges come before any that aren't
+    inner = ranges + np.array([MACRO_MARGIN, -MACRO_MARGIN], dtype=np.float32)
+    fits = (calorie_miss <= 1e-6) & ((shares >= inner[:, 0]) & (shares <= inner[:, 1])).all(axis=1)
+    score = score + OUT_OF_RANGE_PENALTY * ~fits
+
+    # Keep the best few combinations of each main dish, then the best overall
+    by_main = np.lexsort((score, combos[:, 0]))
+    sorted_mains = combos[by_main, 0]
+    first_of_main = np.searchsorted(sorted_mains, sorted_mains)
+    rank = np.arange(len(by_main)) - first_of_main
+    kept, rank = by_main[rank < OPTIONS_PER_MAIN], rank[rank < OPTIONS_PER_MAIN]
+    best = np.argsort(score[kept], kind='stable')[:OPTIONS_PER_MEAL]
+
+    return combos[kept[best]], portion[kept[best]], rank[best]
+
+
+def plan_seed(calories, diet_type, allergies, goal):
+    """Same request, same plan, in any process"""
+    return zlib.crc32(f"{calories}|{normalize_diet(diet_type)}|{allergies}|{goal}".encode())
+
+
+def portion_items(combo, portion, foods=FOODS):
+    items = []
+    for index in combo:
+        calories, protein, carbs, fat = (foods.nutrients[index] * portion).tolist()
+        items.append({
+            "name": foods.names[index],
+            "calories": round(calories),
+            "protein": round(protein),
+            "carbs": round(carbs),
+            "fat": round(fat)
+        })
+    return items
+
+
+def meal_totals(meals):
+    """(calories, protein, carbs, fat) of each portioned meal as an array"""
+    return np.array(
+        [[sum(item[field] for item in meal) for field in ('calories', 'protein', 'carbs', 'fat')] for meal in meals],
+        dtype=np.float32
+    )
+
+
+def day_menu(totals, ranges, day):
+    """
+    The (breakfast, lunch, dinner) option indices for one day of the
+    rotation. Each meal type cycles through its own options, and the day
+    keeps them when together they meet the macro ranges. Else it takes
+    the nearest options further along the rotations that bring the day
+    inside the ranges, trying lunch and dinner before breakfast, or, when
+    no combination can, the one that misses them least.
+    """
+    breakfast, lunch, dinner = totals
+    b, l, d = day % len(breakfast), day % len(lunch), day % len(dinner)
+    if ranges_miss(macro_shares(breakfast[b] + lunch[l] + dinner[d]), ranges) <= 1e-6:
+        return b, l, d
+
+    # Distance along the lunch and dinner rotations from the day's own options
+    distance = (np.arange(len(lunch)) - l)[:, None] % len(lunch) + (np.arange(len(dinner)) - d)[None, :] % len(dinner)
+    closest = None
+    for step in range(len(breakfast)):
+        option = (b + step) % len(breakfast)
+        miss = ranges_miss(macro_shares(breakfast[option] + lunch[:, None, :] + dinner[None, :, :]), ranges)
+        if (miss <= 1e-6).any():
+            pair = np.unravel_index(np.argmin(np.where(miss <= 1e-6, distance, np.inf)), miss.shape)
+            return option, int(pair[0]), int(pair[1])
+        pair = np.unravel_index(np.argmin(miss * 1e6 + distance), miss.shape)
+        if closest is None or miss[pair] < closest[0]:
+            closest = (miss[pair], option, int(pair[0]), int(pair[1]))
+    return closest[1:]
+
+
+@lru_cache(maxsize=256)
+def _plan_options(calories, diet_type, allergies, goal):
+    """
+    Per meal type, the portioned meals to choose from in the order the
+    plan cycles through them: every main's best option in a shuffled order,
+    then every main's second best in the same order, and so on, so a main
+    dish only comes back once every other main has had its turn. Also
+    each meal type's meal_totals() for day_menu().
+    """
+    allowed = allowed_foods(diet_type, allergies)
+    ranges = macro_ranges(diet_type, goal)
+    rng = np.random.default_rng(plan_seed(calories, diet_type, allergies, goal))
+
+    options = {}
+    for meal_type, share in MEAL_SPLIT.items():
+        combos, portions, ranks = meal_options(meal_type, calories * share, allowed, ranges)
+        meals = [portion_items(combo, portion) for combo, portion in zip(combos, portions.tolist())]
+        main_order = rng.permutation(len(FOODS.names))
+        rotation = np.lexsort((main_order[combos[:, 0]], ranks))
+        options[meal_type] = [meals[index] for index in rotation.tolist()]
+    return options, tuple(meal_totals(meals) for meals in options.values())
+
+
+def template_meal_plan(calories, diet_type='none', allergies='', goal=None, days=7, first_day=1):
+    """
+    Assemble a plan from the bundled food table, in the same
+    {"1": {"breakfast": [...], ...}} shape Gemini returns.
+
+    Meals get 30/35/35% of the daily calories, and days keep their macros
+    within the ranges for the diet and goal wherever the allowed foods
+    can, coming as close as they can otherwise. Plans are deterministic,
+    so first_day picks up the same rotation part way through, e.g. to fill
+    in one failed window of a longer plan.
+    """
+    options, totals = _plan_options(int(calories), diet_type or 'none', allergies or '', goal)
+    ranges = macro_ranges(diet_type, goal)
+
+    plan = {}
+    for day in range(days):
+        menu = day_menu(totals, ranges, first_day - 1 + day)
+        plan[str(day + 1)] = {
+            meal_type: [dict(item) for item in options[meal_type][index]]
+            for meal_type, index in zip(MEAL_SPLIT, menu)
+        }
+    return plan
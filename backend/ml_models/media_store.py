@@ -0,0 +1,88 @@
+import base64
+import binascii
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.urls import reverse
+
+# Images are keyed by content hash, so a stored file never changes
+IMAGE_DIR = 'meal-images'
+IMAGE_CACHE_SECONDS = 365 * 24 * 60 * 60
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+}
+
+DATA_URL_RE = re.compile(r'^data:image/(?P<format>[a-z]+);base64,(?P<data>.*)$', re.DOTALL)
+
+
+def get_storage():
+    """Storage for meal images: STORAGES['meal_images'] if configured, else the default"""
+    alias = getattr(settings, 'MEAL_IMAGE_STORAGE', None)
+    return storages[alias] if alias else default_storage
+
+
+def image_path(digest, extension):
+    # Fan out by hash prefix so no single directory grows too large
+    return f"{IMAGE_DIR}/{digest[:2]}/{digest}.{extension}"
+
+
+def image_url(digest, extension):
+    return reverse('meal-image', kwargs={'digest': digest, 'extension': extension})
+
+
+def absolute_image_url(url, request=None):
+    """
+    The URL a client can load a stored image from. Stored URLs are
+    host-relative; they are joined to MEAL_IMAGE_BASE_URL when it is set,
+    else to the host of `request`. Anything else (old base64 data URLs,
+    external links) is returned as is.
+    """
+    if not url or not url.startswith('/'):
+        return url
+    base_url = getattr(settings, 'MEAL_IMAGE_BASE_URL', None)
+    if base_url:
+        return base_url.rstrip('/') + url
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def store_image(data, extension='png'):
+    """
+    Write image bytes once, keyed by their sha256, and return the short URL
+    they are served from.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    storage = get_storage()
+    path = image_path(digest, extension)
+    if not storage.exists(path):
+        storage.save(path, ContentFile(data))
+    return image_url(digest, extension)
+
+
+def decode_data_url(value):
+    """(bytes, extension) of a base64 data: URL, or None if it isn't one"""
+    match = DATA_URL_RE.match(value or '')
+    if not match:
+        return None
+    extension = 'jpeg' if match['format'] == 'jpg' else match['format']
+    if extension not in CONTENT_TYPES:
+        return None
+    try:
+        return base64.b64decode(match['data'], validate=True), extension
+    except (binascii.Error, ValueError):
+        return None
+
+
+def open_image(digest, extension):
+    """Open a stored image for reading, or None if it isn't in the store"""
+    storage = get_storage()
+    path = image_path(digest, extension)
+    if not storage.exists(path):
+        return None
+    return storage.open(path, 'rb')
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_models', '0005_generationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dish_key', models.CharField(max_length=150, unique=True)),
+                ('food_name', models.CharField(max_length=100)),
+                ('meal_type', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready')], default='pending', max_length=20)),
+                ('image_url', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'meal_image',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_models', '0006_mealimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mealitem',
+            name='current_quantity_ratio',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mealitem',
+            name='current_status',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='mealitem',
+            name='tracked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='mealitemtracking',
+            index=models.Index(fields=['meal_item', '-timestamp'], name='mealitemtracking_item_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+
+def merge_duplicate_meals(apps, schema_editor):
+    """
+    Keep only the newest meal per (user, date, meal_type) so the unique
+    constraint in 0009 can be added. The older duplicates are deleted
+    with their items and tracking rather than moved onto the kept meal,
+    which would plan the slot's food twice.
+    """
+    MealPlan = apps.get_model('ml_models', 'MealPlan')
+    newer = MealPlan.objects.filter(
+        user=OuterRef('user'),
+        date=OuterRef('date'),
+        meal_type=OuterRef('meal_type'),
+        id__gt=OuterRef('id'),
+    )
+    MealPlan.objects.filter(Exists(newer)).delete()
+
+
+# Changes user data: older duplicate meals and their items are deleted,
+# and reversing can't bring them back. Daily nutrition rollups are
+# rebuilt from the remaining items by 0014. Kept apart from the index and
+# constraint DDL in 0009, which Postgres refuses to run in a transaction
+# that has just deleted rows ("pending trigger events").
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_models', '0007_mealitem_current_tracking'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_meals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_models', '0008_merge_duplicate_meals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mealplan',
+            index=models.Index(fields=['user', 'date'], name='mealplan_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mealplan',
+            index=models.Index(fields=['user', 'meal_type', 'date'], name='mealplan_user_type_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='mealplan',
+            constraint=models.UniqueConstraint(fields=('user', 'date', 'meal_type'), name='unique_user_date_meal_type'),
+        ),
+    ]
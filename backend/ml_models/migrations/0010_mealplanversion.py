@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def create_initial_versions(apps, schema_editor):
+    """Put each user's existing meals in one active version"""
+    MealPlan = apps.get_model('ml_models', 'MealPlan')
+    MealPlanVersion = apps.get_model('ml_models', 'MealPlanVersion')
+    ActiveMealPlan = apps.get_model('ml_models', 'ActiveMealPlan')
+
+    users = MealPlan.objects.values('user').annotate(start_date=Min('date')).order_by('user')
+    for row in users:
+        version = MealPlanVersion.objects.create(user_id=row['user'], start_date=row['start_date'])
+        MealPlan.objects.filter(user_id=row['user']).update(version=version)
+        ActiveMealPlan.objects.create(user_id=row['user'], version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_models', '0009_mealplan_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealPlanVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('replaced_from', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_plan_versions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'meal_plan_version',
+            },
+        ),
+        migrations.CreateModel(
+            name='ActiveMealPlan',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('version', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='ml_models.mealplanversion')),
+            ],
+            options={
+                'db_table': 'active_meal_plan',
+            },
+        ),
+        migrations.AddField(
+            model_name='mealplan',
+            name='version',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='meals', to='ml_models.mealplanversion'),
+        ),
+        migrations.RunPython(create_initial_versions, migrations.RunPython.noop),
+    ]
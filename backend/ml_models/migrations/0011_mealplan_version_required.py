@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_models', '0010_mealplanversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mealplan',
+            name='version',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meals', to='ml_models.mealplanversion'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='mealplan',
+            name='unique_user_date_meal_type',
+        ),
+        migrations.AddConstraint(
+            model_name='mealplan',
+            constraint=models.UniqueConstraint(fields=('version', 'date', 'meal_type'), name='unique_version_date_meal_type'),
+        ),
+    ]
@@ -0,0 +1,198 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:49
+
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+AI_WORKOUT_TYPES = ('AI Generated', 'AI Adaptive', 'Daily Progressive')
+
+
+def number(value, cast=float):
+    try:
+        return cast(float(value))
+    except (TypeError, ValueError):
+        return cast(0)
+
+
+def text(value, max_length=None):
+    value = '' if value is None else str(value)
+    return value[:max_length] if max_length else value
+
+
+def json_list(value):
+    """The list of objects a plan stored as JSON text, or None for other text"""
+    try:
+        value = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+        return None
+    return value
+
+
+def split_plans(apps, schema_editor):
+    """Move AI plans out of Workout.description and Marathon.notes into rows"""
+    Workout = apps.get_model('health_data', 'Workout')
+    Marathon = apps.get_model('health_data', 'Marathon')
+    PlanDay = apps.get_model('ml_models', 'PlanDay')
+    PlanExercise = apps.get_model('ml_models', 'PlanExercise')
+    MarathonSession = apps.get_model('ml_models', 'MarathonSession')
+
+    def exercise_row(workout, index, exercise, day=None):
+        return PlanExercise(
+            workout=workout, day=day, exercise_index=index,
+            name=text(exercise.get('name'), 200),
+            workout_type=text(exercise.get('workout_type') or 'general', 50),
+            reps_or_duration=text(exercise.get('reps_or_duration'), 100),
+            calories=number(exercise.get('calories')),
+        )
+
+    for workout in Workout.objects.filter(workout_type__in=AI_WORKOUT_TYPES).exclude(description='').iterator():
+        items = json_list(workout.description)
+        if items is None:
+            continue
+        exercises = []
+        if items and 'day_number' in items[0]:
+            for position, day in enumerate(items):
+                plan_day = PlanDay.objects.create(
+                    workout=workout, position=position,
+                    day_number=number(day.get('day_number'), int) or position + 1,
+                    day_name=text(day.get('day_name'), 100),
+                    is_rest_day=bool(day.get('is_rest_day', False)),
+                    total_duration_minutes=number(day.get('total_duration_minutes'), int),
+                    total_calories=number(day.get('total_calories')),
+                )
+                for exercise in day.get('exercises') or []:
+                    if isinstance(exercise, dict):
+                        exercises.append(exercise_row(workout, len(exercises), exercise, plan_day))
+        else:
+            exercises = [exercise_row(workout, index, exercise) for index, exercise in enumerate(items)]
+        PlanExercise.objects.bulk_create(exercises)
+        Workout.objects.filter(pk=workout.pk).update(description='')
+
+    for marathon in Marathon.objects.exclude(notes='').iterator():
+        schedule = json_list(marathon.notes)
+        if schedule is None:
+            continue
+        MarathonSession.objects.bulk_create([
+            MarathonSession(
+                marathon=marathon, day_index=index,
+                day=text(day.get('day'), 20),
+                run_type=text(day.get('run_type'), 50),
+                distance_km=number(day.get('distance_km')),
+                notes=text(day.get('notes')),
+            )
+            for index, day in enumerate(schedule)
+        ])
+        Marathon.objects.filter(pk=marathon.pk).update(notes='')
+
+
+def join_plans(apps, schema_editor):
+    """Write the rows back as the JSON text they came from"""
+    Workout = apps.get_model('health_data', 'Workout')
+    Marathon = apps.get_model('health_data', 'Marathon')
+    PlanDay = apps.get_model('ml_models', 'PlanDay')
+    PlanExercise = apps.get_model('ml_models', 'PlanExercise')
+    MarathonSession = apps.get_model('ml_models', 'MarathonSession')
+
+    def exercise_json(exercise):
+        return {
+            'name': exercise.name, 'workout_type': exercise.workout_type,
+            'reps_or_duration': exercise.reps_or_duration, 'calories': exercise.calories,
+        }
+
+    workout_ids = set(PlanExercise.objects.order_by().values_list('workout', flat=True))
+    workout_ids |= set(PlanDay.objects.order_by().values_list('workout', flat=True))
+    for workout_id in workout_ids:
+        days = PlanDay.objects.filter(workout=workout_id).order_by('position')
+        if days:
+            items = [
+                {
+                    'day_number': day.day_number, 'day_name': day.day_name, 'is_rest_day': day.is_rest_day,
+                    'total_duration_minutes': day.total_duration_minutes, 'total_calories': day.total_calories,
+                    'exercises': [
+                        exercise_json(exercise)
+                        for exercise in PlanExercise.objects.filter(day=day).order_by('exercise_index')
+                    ],
+                }
+                for day in days
+            ]
+        else:
+            items = [
+                exercise_json(exercise)
+                for exercise in PlanExercise.objects.filter(workout=workout_id).order_by('exercise_index')
+            ]
+        Workout.objects.filter(pk=workout_id).update(description=json.dumps(items))
+
+    for marathon_id in set(MarathonSession.objects.order_by().values_list('marathon', flat=True)):
+        schedule = [
+            {'day': session.day, 'run_type': session.run_type, 'distance_km': session.distance_km, 'notes': session.notes}
+            for session in MarathonSession.objects.filter(marathon=marathon_id).order_by('day_index')
+        ]
+        Marathon.objects.filter(pk=marathon_id).update(notes=json.dumps(schedule))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_data', '0005_add_workout_feedback_fields'),
+        ('ml_models', '0011_mealplan_version_required'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('day_number', models.IntegerField()),
+                ('day_name', models.CharField(blank=True, max_length=100)),
+                ('is_rest_day', models.BooleanField(default=False)),
+                ('total_duration_minutes', models.IntegerField(default=0)),
+                ('total_calories', models.FloatField(default=0.0)),
+                ('workout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_days', to='health_data.workout')),
+            ],
+            options={
+                'db_table': 'plan_day',
+                'ordering': ['position'],
+                'unique_together': {('workout', 'position')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MarathonSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day_index', models.IntegerField()),
+                ('day', models.CharField(blank=True, max_length=20)),
+                ('run_type', models.CharField(blank=True, max_length=50)),
+                ('distance_km', models.FloatField(default=0.0)),
+                ('notes', models.TextField(blank=True)),
+                ('marathon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='health_data.marathon')),
+            ],
+            options={
+                'db_table': 'marathon_session',
+                'ordering': ['day_index'],
+                'unique_together': {('marathon', 'day_index')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PlanExercise',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise_index', models.IntegerField()),
+                ('name', models.CharField(max_length=200)),
+                ('workout_type', models.CharField(default='general', max_length=50)),
+                ('reps_or_duration', models.CharField(blank=True, max_length=100)),
+                ('calories', models.FloatField(default=0.0)),
+                ('day', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exercises', to='ml_models.planday')),
+                ('workout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_exercises', to='health_data.workout')),
+            ],
+            options={
+                'db_table': 'plan_exercise',
+                'ordering': ['exercise_index'],
+                'unique_together': {('workout', 'exercise_index')},
+            },
+        ),
+        migrations.RunPython(split_plans, join_plans),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_models', '0012_planday_marathonsession_planexercise'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_type', models.CharField(choices=[('workout_exercise', 'Workout exercise'), ('marathon_day', 'Marathon day'), ('workout_log', 'Logged workout'), ('marathon_log', 'Logged marathon training')], max_length=30)),
+                ('source_id', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('calories_burned', models.FloatField(default=0.0)),
+                ('distance', models.FloatField(default=0.0)),
+                ('active_minutes', models.IntegerField(default=0)),
+                ('idempotency_key', models.CharField(max_length=200, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'activity_entry',
+                'indexes': [models.Index(fields=['user', 'date'], name='activity_user_date_idx'), models.Index(fields=['user', 'source_type', 'source_id'], name='activity_user_source_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyActivityLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('calories_burned', models.FloatField(default=0.0)),
+                ('distance', models.FloatField(default=0.0)),
+                ('active_minutes', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity_logs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'daily_activity_log',
+                'unique_together': {('user', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+from django.db import migrations
+from django.db.models import Case, Exists, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+NUTRIENT_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+
+
+def backfill_daily_nutrition_logs(apps, schema_editor):
+    """
+    Daily nutrition is read from DailyNutritionLog, which tracking only
+    keeps up to date from the tracking it sees. Bring meal items tracked
+    before MealItem.current_* existed up to date, then rebuild every
+    unlocked rollup from them so older days don't read as nothing eaten.
+    """
+    MealItem = apps.get_model('ml_models', 'MealItem')
+    MealItemTracking = apps.get_model('ml_models', 'MealItemTracking')
+    DailyNutritionLog = apps.get_model('health_data', 'DailyNutritionLog')
+
+    def latest_tracking(field):
+        return Subquery(
+            MealItemTracking.objects
+            .filter(meal_item=OuterRef('pk'))
+            .order_by('-timestamp', '-id')
+            .values(field)[:1]
+        )
+
+    MealItem.objects.filter(
+        Exists(MealItemTracking.objects.filter(meal_item=OuterRef('pk'))),
+        current_status__isnull=True,
+    ).update(
+        current_status=latest_tracking('status'),
+        current_quantity_ratio=latest_tracking('quantity_ratio'),
+        tracked_at=latest_tracking('timestamp'),
+    )
+
+    eaten_ratio = Case(
+        When(current_status='eaten', then=F('current_quantity_ratio')),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    rows = (
+        MealItem.objects
+        .filter(
+            Q(meal__version__replaced_from__isnull=True) | Q(meal__date__lt=F('meal__version__replaced_from')),
+            current_status='eaten',
+        )
+        .values('meal__user', 'meal__date')
+        .annotate(**{
+            field: Coalesce(Sum(F(field) * eaten_ratio, output_field=FloatField()), Value(0.0))
+            for field in NUTRIENT_FIELDS
+        })
+        .order_by()
+    )
+    locked = set(DailyNutritionLog.objects.filter(is_locked=True).values_list('user_id', 'date'))
+
+    DailyNutritionLog.objects.bulk_create(
+        [
+            DailyNutritionLog(
+                user_id=row['meal__user'],
+                date=row['meal__date'],
+                **{f'total_{field}': row[field] for field in NUTRIENT_FIELDS},
+            )
+            for row in rows
+            if (row['meal__user'], row['meal__date']) not in locked
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['user', 'date'],
+        update_fields=[f'total_{field}' for field in NUTRIENT_FIELDS],
+    )
+
+
+# Writes user data: MealItem.current_* and DailyNutritionLog rows, both
+# derived from MealItemTracking, so reversing leaves them in place.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml_models', '0013_activityentry_dailyactivitylog'),
+        ('health_data', '0003_dailynutritionlog'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_nutrition_logs, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,47 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
 # UserBodyProfile removed - using User table directly (has age, gender, height, weight)
 
+# One generation of a user's meal plan. A newer version takes over every
+# date from its start onwards; older meals from there on are superseded
+# and wait for collect_superseded_meals to delete them.
+class MealPlanVersion(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='meal_plan_versions')
+    start_date = models.DateField()
+    replaced_from = models.DateField(null=True, blank=True)  # Meals from this date on are superseded
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'meal_plan_version'
+
+
+# The version new meals are added to; its row lock serialises plan swaps
+class ActiveMealPlan(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    version = models.ForeignKey(MealPlanVersion, on_delete=models.SET_NULL, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'active_meal_plan'
+
+
 class MealPlan(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    version = models.ForeignKey(MealPlanVersion, on_delete=models.CASCADE, related_name='meals')
     date = models.DateField()
     meal_type = models.CharField(max_length=20)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'], name='mealplan_user_date_idx'),
+            models.Index(fields=['user', 'meal_type', 'date'], name='mealplan_user_type_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['version', 'date', 'meal_type'], name='unique_version_date_meal_type'),
+        ]
+
 
 class MealItem(models.Model):
     meal = models.ForeignKey(MealPlan, on_delete=models.CASCADE, related_name="items")
@@ -16,14 +50,24 @@ class MealItem(models.Model):
     protein = models.FloatField()
     carbs = models.FloatField()
     fat = models.FloatField()
-    image_url = models.TextField(null=True, blank=True)  # Store base64 or URL
+    image_url = models.TextField(null=True, blank=True)  # Media store URL (older rows may hold base64)
+    # Copy of the latest MealItemTracking row, kept in step by track_meal_item
+    current_status = models.CharField(max_length=20, null=True, blank=True)
+    current_quantity_ratio = models.FloatField(null=True, blank=True)
+    tracked_at = models.DateTimeField(null=True, blank=True)
 
+# Append-only tracking history; MealItem.current_* holds the latest state
 class MealItemTracking(models.Model):
     meal_item = models.ForeignKey(MealItem, on_delete=models.CASCADE)
     status = models.CharField(max_length=20)  # eaten / skipped
     quantity_ratio = models.FloatField()  # 1.0 full, 0.5 half
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['meal_item', '-timestamp'], name='mealitemtracking_item_ts_idx'),
+        ]
+
 
 # Workout Plan Exercise Tracking
 class WorkoutExerciseTracking(models.Model):
@@ -67,3 +111,151 @@ class MarathonDayTracking(models.Model):
         db_table = 'marathon_day_tracking'
         unique_together = ['marathon', 'day_index']
         ordering = ['day_index']
+
+
+# One day of a multi-day AI workout plan
+class PlanDay(models.Model):
+    workout = models.ForeignKey('health_data.Workout', on_delete=models.CASCADE, related_name='plan_days')
+    position = models.IntegerField()  # Order of the day in the plan, from 0
+    day_number = models.IntegerField()
+    day_name = models.CharField(max_length=100, blank=True)
+    is_rest_day = models.BooleanField(default=False)
+    total_duration_minutes = models.IntegerField(default=0)
+    total_calories = models.FloatField(default=0.0)
+
+    class Meta:
+        db_table = 'plan_day'
+        unique_together = ['workout', 'position']
+        ordering = ['position']
+
+
+# One exercise of an AI workout plan; day is empty for single-day plans
+class PlanExercise(models.Model):
+    workout = models.ForeignKey('health_data.Workout', on_delete=models.CASCADE, related_name='plan_exercises')
+    day = models.ForeignKey(PlanDay, on_delete=models.CASCADE, null=True, blank=True, related_name='exercises')
+    exercise_index = models.IntegerField()  # Position across the whole plan, as used by WorkoutExerciseTracking
+    name = models.CharField(max_length=200)
+    workout_type = models.CharField(max_length=50, default='general')
+    reps_or_duration = models.CharField(max_length=100, blank=True)
+    calories = models.FloatField(default=0.0)
+
+    class Meta:
+        db_table = 'plan_exercise'
+        unique_together = ['workout', 'exercise_index']
+        ordering = ['exercise_index']
+
+
+# One day of an AI marathon training week
+class MarathonSession(models.Model):
+    marathon = models.ForeignKey('health_data.Marathon', on_delete=models.CASCADE, related_name='sessions')
+    day_index = models.IntegerField()  # Position in the week, as used by MarathonDayTracking
+    day = models.CharField(max_length=20, blank=True)
+    run_type = models.CharField(max_length=50, blank=True)
+    distance_km = models.FloatField(default=0.0)
+    notes = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'marathon_session'
+        unique_together = ['marathon', 'day_index']
+        ordering = ['day_index']
+
+
+# Append-only record of the activity logging adds to HealthData. Taking
+# activity back (an exercise marked not done) is a new entry with negated
+# amounts; replayed requests are dropped by their idempotency key.
+class ActivityEntry(models.Model):
+    SOURCE_CHOICES = [
+        ('workout_exercise', 'Workout exercise'),
+        ('marathon_day', 'Marathon day'),
+        ('workout_log', 'Logged workout'),
+        ('marathon_log', 'Logged marathon training'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='activity_entries')
+    source_type = models.CharField(max_length=30, choices=SOURCE_CHOICES)
+    source_id = models.CharField(max_length=100)  # e.g. "<workout id>:<exercise index>"
+    date = models.DateField()
+    calories_burned = models.FloatField(default=0.0)
+    distance = models.FloatField(default=0.0)
+    active_minutes = models.IntegerField(default=0)
+    idempotency_key = models.CharField(max_length=200, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'activity_entry'
+        indexes = [
+            models.Index(fields=['user', 'date'], name='activity_user_date_idx'),
+            models.Index(fields=['user', 'source_type', 'source_id'], name='activity_user_source_idx'),
+        ]
+
+
+# Per-day sums of ActivityEntry, i.e. what logging has added to HealthData
+class DailyActivityLog(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_activity_logs')
+    date = models.DateField()
+    calories_burned = models.FloatField(default=0.0)
+    distance = models.FloatField(default=0.0)
+    active_minutes = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'daily_activity_log'
+        unique_together = ['user', 'date']
+
+
+# Queued LLM generation requests, run by the run_generation_worker command
+class GenerationJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='generation_jobs')
+    kind = models.CharField(max_length=50)  # Registered handler name, e.g. meal_plan
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    dedup_key = models.CharField(max_length=64)  # Hash of kind + payload
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    status_code = models.IntegerField(null=True, blank=True)  # HTTP status of the handler response
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'generation_job'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            # At most one identical queued/running job per user
+            models.UniqueConstraint(
+                fields=['user', 'dedup_key'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_generation_job',
+            ),
+        ]
+
+
+# Generated images shared by every meal item for the same dish
+class MealImage(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+    ]
+
+    dish_key = models.CharField(max_length=150, unique=True)  # meal_type:normalized food name
+    food_name = models.CharField(max_length=100)
+    meal_type = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    image_url = models.CharField(max_length=200, blank=True)  # Media store URL
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'meal_image'
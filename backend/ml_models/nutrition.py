@@ -0,0 +1,282 @@
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from health_data.models import DailyNutritionLog
+from .meal_plan_versions import current_meals_filter
+from .models import MealItem, MealItemTracking
+
+NUTRIENT_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+
+# Tracking states; only "eaten" adds to the day's totals
+TRACKING_STATUSES = ('eaten', 'skipped')
+
+# DailyNutritionLog column for each nutrient
+LOG_FIELDS = {field: f'total_{field}' for field in NUTRIENT_FIELDS}
+
+
+def empty_totals():
+    return {field: 0.0 for field in NUTRIENT_FIELDS}
+
+
+def tracked_items(user, start_date, end_date=None):
+    """
+    MealItems of the user's current plan between start_date and end_date
+    (inclusive). Their current_status/current_quantity_ratio hold the latest
+    tracking.
+    """
+    items = MealItem.objects.filter(
+        current_meals_filter('meal__'), meal__user=user, meal__date__gte=start_date
+    )
+    if end_date is not None:
+        items = items.filter(meal__date__lte=end_date)
+
+    return items
+
+
+def _eaten_sums():
+    eaten_ratio = Case(
+        When(current_status='eaten', then=F('current_quantity_ratio')),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return {
+        field: Coalesce(Sum(F(field) * eaten_ratio, output_field=FloatField()), Value(0.0))
+        for field in NUTRIENT_FIELDS
+    }
+
+
+def nutrition_totals(user, start_date, end_date=None):
+    """
+    Eaten calories/macros over a date range in a single query.
+
+    Only items whose latest tracking is "eaten" count, scaled by its
+    quantity_ratio.
+    """
+    return tracked_items(user, start_date, end_date).aggregate(**_eaten_sums())
+
+
+def daily_nutrition_totals(user, start_date, end_date=None):
+    """
+    Eaten calories/macros per plan date in a single query.
+
+    Returns {date: totals} for every date that has planned items, including
+    days where nothing was eaten.
+    """
+    rows = (
+        tracked_items(user, start_date, end_date)
+        .values('meal__date')
+        .annotate(**_eaten_sums())
+        .order_by('meal__date')
+    )
+    return {
+        row['meal__date']: {field: row[field] for field in NUTRIENT_FIELDS}
+        for row in rows
+    }
+
+
+def rounded(totals):
+    return {field: round(totals[field], 1) for field in NUTRIENT_FIELDS}
+
+
+# ---------------- DAILY NUTRITION ROLLUPS ---------------- #
+def logged_nutrition_totals(user, start_date, end_date=None):
+    """Eaten calories/macros over a date range, read from DailyNutritionLog"""
+    logs = DailyNutritionLog.objects.filter(user=user, date__gte=start_date)
+    if end_date is not None:
+        logs = logs.filter(date__lte=end_date)
+
+    return logs.aggregate(**{
+        field: Coalesce(Sum(column), Value(0.0))
+        for field, column in LOG_FIELDS.items()
+    })
+
+
+def logged_daily_totals(user, days):
+    """Eaten calories/macros per day from DailyNutritionLog, as {date: totals}"""
+    logs = DailyNutritionLog.objects.filter(user=user, date__in=days).order_by('date')
+    return {
+        log.date: {field: getattr(log, column) for field, column in LOG_FIELDS.items()}
+        for log in logs
+    }
+
+
+def tracking_contribution(meal_item, status, quantity_ratio):
+    """Calories/macros an item adds to the day in a tracking state (zero unless eaten)"""
+    if status != 'eaten':
+        return empty_totals()
+
+    ratio = float(quantity_ratio)
+    return {field: getattr(meal_item, field) * ratio for field in NUTRIENT_FIELDS}
+
+
+def locked_daily_log(user, day):
+    """Get or create the user's rollup row for `day`, locked for update"""
+    DailyNutritionLog.objects.get_or_create(user=user, date=day)
+    return DailyNutritionLog.objects.select_for_update().get(user=user, date=day)
+
+
+def locked_daily_logs(user, days):
+    """
+    Get or create the user's rollup rows for several days, locked for
+    update, as {date: log}. Rows are locked in date order so concurrent
+    batches can't deadlock.
+    """
+    DailyNutritionLog.objects.bulk_create(
+        [DailyNutritionLog(user=user, date=day) for day in days],
+        ignore_conflicts=True,
+    )
+    logs = DailyNutritionLog.objects.select_for_update().filter(user=user, date__in=days).order_by('date')
+    return {log.date: log for log in logs}
+
+
+def _move_rollup(log, delta):
+    DailyNutritionLog.objects.filter(pk=log.pk).update(
+        updated_at=now(),
+        **{column: F(column) + delta[field] for field, column in LOG_FIELDS.items()},
+    )
+
+
+def _tracking_delta(meal_item, status, quantity_ratio):
+    before = tracking_contribution(meal_item, meal_item.current_status, meal_item.current_quantity_ratio)
+    after = tracking_contribution(meal_item, status, quantity_ratio)
+    return {field: after[field] - before[field] for field in NUTRIENT_FIELDS}
+
+
+def record_tracking(log, meal_item, status, quantity_ratio):
+    """
+    Append a tracking row, make it the item's current state and move the
+    day's rollup from the previous state to the new one.
+
+    Must run in the same transaction as locked_daily_log(), with meal_item
+    fetched after the lock was taken.
+    """
+    delta = _tracking_delta(meal_item, status, quantity_ratio)
+
+    tracking = MealItemTracking.objects.create(
+        meal_item=meal_item,
+        status=status,
+        quantity_ratio=quantity_ratio
+    )
+    meal_item.current_status = status
+    meal_item.current_quantity_ratio = quantity_ratio
+    meal_item.tracked_at = tracking.timestamp
+    meal_item.save(update_fields=['current_status', 'current_quantity_ratio', 'tracked_at'])
+
+    _move_rollup(log, delta)
+    return tracking
+
+
+def record_trackings(logs, entries):
+    """
+    record_tracking() for a batch of (meal_item, status, quantity_ratio)
+    entries, applied in order: one bulk insert of history rows, one bulk
+    update of the items and one rollup update per day.
+
+    `logs` is locked_daily_logs() for the items' dates, and the items
+    (with their meal) must have been fetched after the lock was taken.
+    """
+    deltas = {day: empty_totals() for day in logs}
+    history = []
+    for meal_item, status, quantity_ratio in entries:
+        delta = _tracking_delta(meal_item, status, quantity_ratio)
+        for field in NUTRIENT_FIELDS:
+            deltas[meal_item.meal.date][field] += delta[field]
+
+        meal_item.current_status = status
+        meal_item.current_quantity_ratio = quantity_ratio
+        history.append(MealItemTracking(meal_item=meal_item, status=status, quantity_ratio=quantity_ratio))
+
+    history = MealItemTracking.objects.bulk_create(history)
+    items = {}
+    for tracking in history:
+        tracking.meal_item.tracked_at = tracking.timestamp
+        items[tracking.meal_item.pk] = tracking.meal_item
+    MealItem.objects.bulk_update(items.values(), ['current_status', 'current_quantity_ratio', 'tracked_at'])
+
+    for day, delta in deltas.items():
+        if any(delta.values()):
+            _move_rollup(logs[day], delta)
+    return history
+
+
+@transaction.atomic
+def rebuild_daily_logs(start_date=None, end_date=None, user=None, include_locked=False, batch_size=500):
+    """
+    Recompute DailyNutritionLog rows from the items' current tracking in bulk.
+
+    Days with eaten items are upserted, stale rows in the range are zeroed
+    and locked days are left untouched unless include_locked is set.
+    Returns the number of rows written.
+    """
+    items = MealItem.objects.filter(current_meals_filter('meal__'))
+    logs = DailyNutritionLog.objects.all()
+    if user is not None:
+        items = items.filter(meal__user=user)
+        logs = logs.filter(user=user)
+    if start_date is not None:
+        items = items.filter(meal__date__gte=start_date)
+        logs = logs.filter(date__gte=start_date)
+    if end_date is not None:
+        items = items.filter(meal__date__lte=end_date)
+        logs = logs.filter(date__lte=end_date)
+    if not include_locked:
+        logs = logs.filter(is_locked=False)
+
+    locked = set()
+    if not include_locked:
+        locked = set(
+            DailyNutritionLog.objects
+            .filter(is_locked=True, user_id__in=items.values('meal__user'))
+            .values_list('user_id', 'date')
+        )
+
+    rows = (
+        items
+        .values('meal__user', 'meal__date')
+        .annotate(**_eaten_sums())
+        .order_by()
+    )
+
+    rollups = []
+    for row in rows:
+        key = (row['meal__user'], row['meal__date'])
+        if key in locked or not any(row[field] for field in NUTRIENT_FIELDS):
+            continue
+        rollups.append(DailyNutritionLog(
+            user_id=key[0],
+            date=key[1],
+            **{column: row[field] for field, column in LOG_FIELDS.items()},
+        ))
+
+    written = {(log.user_id, log.date) for log in rollups}
+    stale_ids = [
+        log_id for log_id, user_id, day in logs
+        .exclude(**{column: 0 for column in LOG_FIELDS.values()})
+        .values_list('id', 'user_id', 'date')
+        if (user_id, day) not in written
+    ]
+
+    DailyNutritionLog.objects.bulk_create(
+        rollups,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['user', 'date'],
+        update_fields=list(LOG_FIELDS.values()) + ['updated_at'],
+    )
+    for i in range(0, len(stale_ids), batch_size):
+        DailyNutritionLog.objects.filter(id__in=stale_ids[i:i + batch_size]).update(
+            updated_at=now(),
+            **{column: 0 for column in LOG_FIELDS.values()},
+        )
+
+    return len(rollups) + len(stale_ids)
+
+
+def lock_daily_logs(before):
+    """Freeze every rollup dated before `before`. Returns rows locked."""
+    return DailyNutritionLog.objects.filter(date__lt=before, is_locked=False).update(
+        is_locked=True,
+        locked_at=now(),
+    )
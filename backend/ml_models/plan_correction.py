@@ -0,0 +1,127 @@
+import threading
+
+import numpy as np
+
+from .meal_templates import MEAL_SPLIT, MIN_PORTION, MAX_PORTION, macro_ranges
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fat')
+
+# The prompt's tolerances: meals further off than this are rescaled
+MEAL_TOLERANCE = 20
+DAY_TOLERANCE = 30
+
+
+def plan_arrays(plan, days):
+    """
+    Every food item of days 1..days as (items, values, slots, broken):
+    the item dicts, their nutrients as an (n, 4) array, the meal slot
+    (day index * 3 + meal index) of each, and the day indices with
+    non-numeric values.
+    """
+    items, rows, slots = [], [], []
+    broken = set()
+    for day in range(days):
+        meals = plan[str(day + 1)]
+        for meal_index, meal_type in enumerate(MEAL_SPLIT):
+            for item in meals[meal_type]:
+                try:
+                    rows.append([float(item[field]) for field in NUTRIENTS])
+                except (TypeError, ValueError):
+                    broken.add(day)
+                    rows.append([0.0] * len(NUTRIENTS))
+                items.append(item)
+                slots.append(day * len(MEAL_SPLIT) + meal_index)
+
+    values = np.array(rows, dtype=np.float64).reshape(-1, len(NUTRIENTS))
+    return items, values, np.array(slots, dtype=np.intp), broken
+
+
+def correct_meal_plan(plan, calories, days=None, diet_type=None, goal=None):
+    """
+    Rescale the portions of every meal that misses its 30/35/35 share of
+    `calories` by more than MEAL_TOLERANCE, scaling calories and macros of
+    its items together. The plan's item dicts are updated in place.
+
+    All days are measured and corrected at once. A day is impossible when
+    one of its meals has no calories, non-numeric values, or would need
+    its portions scaled beyond MIN_PORTION..MAX_PORTION; those days are
+    left as they are and listed for regeneration in the returned report.
+    """
+    days = len(plan) if days is None else days
+    items, values, slots, broken = plan_arrays(plan, days)
+    meal_count = len(MEAL_SPLIT)
+
+    targets = np.tile(np.array(list(MEAL_SPLIT.values())) * calories, days)
+    meal_calories = np.bincount(slots, weights=values[:, 0], minlength=days * meal_count)
+    day_before = meal_calories.reshape(days, meal_count).sum(axis=1) - calories
+
+    off_target = np.abs(meal_calories - targets) > MEAL_TOLERANCE
+    scale = np.where(off_target, targets / np.maximum(meal_calories, 1e-9), 1.0)
+    possible = (meal_calories > 0) & (scale >= MIN_PORTION) & (scale <= MAX_PORTION)
+    impossible = ~possible.reshape(days, meal_count).all(axis=1)
+    impossible[list(broken)] = True
+
+    rescale = off_target & np.repeat(~impossible, meal_count)
+    changed = np.flatnonzero(rescale[slots])
+    corrected = values.copy()
+    corrected[changed] = np.round(values[changed] * scale[slots[changed], None])
+    for index, row in zip(changed.tolist(), corrected[changed].tolist()):
+        items[index].update(zip(NUTRIENTS, (round(value) for value in row)))
+
+    day_slots = slots // meal_count
+    day_totals = np.stack(
+        [np.bincount(day_slots, weights=corrected[:, i], minlength=days) for i in range(len(NUTRIENTS))],
+        axis=1
+    )
+    day_after = day_totals[~impossible, 0] - calories
+
+    shares = day_totals[:, 1:] * np.array([4, 4, 9]) / np.maximum(day_totals[:, :1], 1e-9)
+    ranges = macro_ranges(diet_type, goal)
+    off_macros = ((shares < ranges[:, 0]) | (shares > ranges[:, 1])).any(axis=1) & ~impossible
+
+    report = {
+        'days': days,
+        'meals_rescaled': int(rescale.sum()),
+        'impossible_days': (np.flatnonzero(impossible) + 1).tolist(),
+        'days_off_target_before': int((np.abs(day_before) > DAY_TOLERANCE).sum()),
+        'days_off_target_after': int((np.abs(day_after) > DAY_TOLERANCE).sum()),
+        'max_day_deviation_before': round(float(np.abs(day_before).max(initial=0)), 1),
+        'max_day_deviation_after': round(float(np.abs(day_after).max(initial=0)), 1),
+        'days_outside_macro_ranges': int(off_macros.sum()),
+    }
+    stats.record(report)
+    return report
+
+
+class CorrectionStats:
+    """Totals of the correction reports for this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.plans = self.days = self.meals_rescaled = self.impossible_days = 0
+        self.days_off_target_before = self.days_off_target_after = 0
+
+    def record(self, report):
+        with self.lock:
+            self.plans += 1
+            self.days += report['days']
+            self.meals_rescaled += report['meals_rescaled']
+            self.impossible_days += len(report['impossible_days'])
+            self.days_off_target_before += report['days_off_target_before']
+            self.days_off_target_after += report['days_off_target_after']
+
+    def as_dict(self):
+        return {
+            'plans': self.plans,
+            'days': self.days,
+            'meals_rescaled': self.meals_rescaled,
+            'impossible_days': self.impossible_days,
+            'days_off_target_before': self.days_off_target_before,
+            'days_off_target_after': self.days_off_target_after,
+        }
+
+
+stats = CorrectionStats()
@@ -0,0 +1,401 @@
+import asyncio
+import json
+import re
+import threading
+from datetime import date, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from health_data.models import HealthData, Marathon
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .activity import add_activity, log_activity, reconcile_daily_activity
+from .ai_meal_planner import meal_plan_schema
+from .json_stream import JSONSchema, PartialJSON, parse_llm_json, require_fields
+from .meal_plan_versions import current_meals
+from .meal_plans import save_meal_plan
+from .meal_templates import macro_ranges, template_meal_plan
+from .models import DailyActivityLog, MarathonDayTracking, MarathonSession, MealItem, MealItemTracking, MealPlan
+from .nutrition import daily_nutrition_totals, nutrition_totals, rebuild_daily_logs, tracked_items
+
+User = get_user_model()
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner')
+
+
+def make_user(name='tester'):
+    return User.objects.create_user(email=f'{name}@example.com', username=name, password='x')
+
+
+def make_plan(user, start_date, days=7, items_per_meal=5):
+    """Save a plan of `days` days with three meals of identical foods"""
+    food = {'name': 'Oats', 'calories': 100.0, 'protein': 5.0, 'carbs': 15.0, 'fat': 2.0}
+    plan = {
+        str(day + 1): {meal_type: [dict(food) for _ in range(items_per_meal)] for meal_type in MEAL_TYPES}
+        for day in range(days)
+    }
+    return save_meal_plan(user, plan, start_date, days)
+
+
+def eat_everything(user, ratio=1.0):
+    MealItem.objects.filter(meal__user=user).update(current_status='eaten', current_quantity_ratio=ratio)
+
+
+class NutritionAggregateTests(TestCase):
+    """Eaten totals take the same number of queries whatever the plan size"""
+
+    def setUp(self):
+        self.user = make_user()
+        self.start = date.today() - timedelta(days=7)
+
+    def test_totals_are_one_query(self):
+        for days in (1, 7):
+            with self.subTest(days=days):
+                MealPlan.objects.all().delete()
+                make_plan(self.user, self.start, days=days)
+                eat_everything(self.user, 0.5)
+
+                with self.assertNumQueries(1):
+                    totals = nutrition_totals(self.user, self.start)
+                self.assertAlmostEqual(totals['calories'], days * len(MEAL_TYPES) * 5 * 50.0)
+
+                with self.assertNumQueries(1):
+                    by_day = daily_nutrition_totals(self.user, self.start)
+                self.assertEqual(len(by_day), days)
+
+    def test_daily_nutrition_reads_one_rollup(self):
+        make_plan(self.user, date.today(), days=7)
+        eat_everything(self.user)
+        rebuild_daily_logs(user=self.user)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = client.get('/api/ml/daily_nutrition/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['calories'], len(MEAL_TYPES) * 5 * 100.0)
+
+
+class MealTrackingTests(TestCase):
+    """Tracking accepts only the statuses the nutrition rollups understand"""
+
+    def setUp(self):
+        self.user = make_user('eater')
+        make_plan(self.user, date.today(), days=1, items_per_meal=1)
+        self.item = MealItem.objects.filter(meal__user=self.user).first()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rejects_unknown_status(self):
+        for status in ('ate', 'eaten' * 5, '', None, ['eaten']):
+            with self.subTest(status=status):
+                entry = {'meal_item_id': self.item.id, 'status': status}
+                response = self.client.post('/api/ml/track-meal-item/', entry, format='json')
+                self.assertEqual(response.status_code, 400)
+                response = self.client.post('/api/ml/track-meal-items/', {'items': [entry]}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(MealItemTracking.objects.exists())
+
+    def test_tracks_known_status(self):
+        for status in ('eaten', 'skipped'):
+            with self.subTest(status=status):
+                response = self.client.post('/api/ml/track-meal-item/', {
+                    'meal_item_id': self.item.id, 'status': status, 'quantity_ratio': 0.5
+                }, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.item.refresh_from_db()
+                self.assertEqual(self.item.current_status, status)
+
+
+class MealPlanQueryPlanTests(TestCase):
+    """The hot MealPlan lookups search an index on (user, ...) instead of scanning the table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [make_user(f'planner{n}') for n in range(4)]
+        for user in cls.users:
+            for month in range(3):
+                make_plan(user, date.today() + timedelta(days=30 * month), days=30, items_per_meal=1)
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            if connection.vendor == 'postgresql':
+                # Test tables are small enough that a scan would win on cost alone
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        self.user = self.users[1]
+        self.today = date.today()
+
+    def assertSearchesIndex(self, queryset, index):
+        plan = queryset.explain()
+        table = MealPlan._meta.db_table
+        self.assertIn(index, plan)
+        self.assertIsNone(re.search(rf'Seq Scan on {table}\b|\bSCAN {table}\b', plan), plan)
+
+    def test_active_plan_summary(self):
+        self.assertSearchesIndex(current_meals(self.user).filter(date__gte=self.today), 'mealplan_user_date_idx')
+
+    def test_meal_plan_range(self):
+        meals = current_meals(self.user).filter(date__range=(self.today, self.today + timedelta(days=6)))
+        self.assertSearchesIndex(meals, 'mealplan_user_date_idx')
+
+    def test_nutrition_window(self):
+        items = tracked_items(self.user, self.today - timedelta(days=7), self.today)
+        self.assertSearchesIndex(items, 'mealplan_user_date_idx')
+
+    def test_meal_type_lookup(self):
+        meals = current_meals(self.user).filter(meal_type='lunch', date__gte=self.today)
+        self.assertSearchesIndex(meals, 'mealplan_user_type_date_idx')
+
+
+class TemplatePlanTests(TestCase):
+    """Template days meet the macro ranges of their diet and goal"""
+
+    def assertDaysWithinRanges(self, diet_type, goal, calories=2200, days=365):
+        ranges = macro_ranges(diet_type, goal)
+        plan = template_meal_plan(calories, diet_type, '', goal, days)
+        for day, meals in plan.items():
+            items = [item for meal in meals.values() for item in meal]
+            total = sum(item['calories'] for item in items)
+            shares = (
+                sum(item['protein'] for item in items) * 4 / total,
+                sum(item['carbs'] for item in items) * 4 / total,
+                sum(item['fat'] for item in items) * 9 / total,
+            )
+            for share, (low, high) in zip(shares, ranges.tolist()):
+                self.assertTrue(low - 1e-6 <= share <= high + 1e-6, f"{diet_type}/{goal} day {day}: {shares}")
+
+    def test_keto_maintain(self):
+        self.assertDaysWithinRanges('keto', 'maintain')
+
+    def test_lose_weight(self):
+        self.assertDaysWithinRanges('none', 'lose_weight')
+
+    def test_no_foods_left_is_a_bad_request(self):
+        user = User.objects.create_user(
+            email='allergic@example.com', username='allergic', password='x',
+            height=180, weight=80, date_of_birth=date(1990, 1, 1), gender='male'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        allergies = (
+            'oat, tofu, chia, avocado, quinoa, peanut, wheat, potato, mushroom, almond, '
+            'banana, berries, orange, apple, soy, nut, green'
+        )
+        response = client.post('/api/ml/generate-ai-meal-plan/', {
+            'generator': 'template', 'diet_type': 'vegan', 'allergies': allergies, 'days': 3
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No foods left', response.json()['error'])
+
+
+class ParseLLMJSONTests(TestCase):
+    """Damaged responses raise PartialJSON so they are never cached as complete"""
+
+    def test_dropped_list_elements_are_partial(self):
+        schema = JSONSchema(require_fields('name'), units='exercises')
+        with self.assertRaises(PartialJSON) as raised:
+            parse_llm_json('{"exercises": [{"name": "Squat"}, {"name": oops}]}', schema)
+        self.assertEqual(raised.exception.report['dropped'], 1)
+        self.assertEqual(raised.exception.value['exercises'], [{'name': 'Squat'}])
+
+    def test_food_that_is_not_an_object_is_invalid(self):
+        food = {'name': 'Oats', 'calories': 100, 'protein': 5, 'carbs': 15, 'fat': 2}
+        day = {meal_type: [dict(food)] for meal_type in MEAL_TYPES}
+        plan = {'1': day, '2': dict(day, lunch=['Oats'])}
+        with self.assertRaises(PartialJSON) as raised:
+            parse_llm_json(json.dumps(plan), meal_plan_schema(2))
+        self.assertEqual(list(raised.exception.value), ['1'])
+
+
+class MarathonTrackingTests(TestCase):
+    """Marathon day tracking accepts only the plan's own training days and survives ledger failures"""
+
+    def setUp(self):
+        self.user = make_user('runner')
+        self.marathon = Marathon.objects.create(
+            user=self.user, marathon_name='City', distance=42.2, target_date=date.today() + timedelta(days=90)
+        )
+        MarathonSession.objects.create(marathon=self.marathon, day_index=0, run_type='easy', distance_km=5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rejects_unknown_day_index(self):
+        for day_index in (None, 'monday', 7, -1):
+            with self.subTest(day_index=day_index):
+                response = self.client.post('/api/ml/track-marathon-day/', {
+                    'marathon_id': self.marathon.id, 'day_index': day_index
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(MarathonDayTracking.objects.exists())
+
+    def test_tracks_known_day_index(self):
+        response = self.client.post('/api/ml/track-marathon-day/', {
+            'marathon_id': self.marathon.id, 'day_index': '0'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['all_completed'])
+
+    def test_bulk_tracking_survives_a_failed_ledger_query(self):
+        def broken_ledger(*args, **kwargs):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT * FROM no_such_table')
+
+        with mock.patch('ml_models.views.set_source_activities', broken_ledger):
+            response = self.client.post('/api/ml/track-marathon-days/', {
+                'marathon_id': self.marathon.id, 'days': [{'day_index': 0}]
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['completed_count'], 1)
+        self.assertTrue(MarathonDayTracking.objects.filter(marathon=self.marathon, completed=True).exists())
+
+class ReconcileActivityTests(TestCase):
+    """Reconciliation brings DailyActivityLog back to the ledger"""
+
+    def test_corrects_edited_and_missing_days(self):
+        user = make_user('walker')
+        today = date.today()
+        yesterday = today - timedelta(days=1)
+        log_activity(user, 'workout_log', today, calories_burned=100)
+        log_activity(user, 'workout_log', yesterday, calories_burned=50)
+        DailyActivityLog.objects.filter(date=today).update(calories_burned=30)
+        DailyActivityLog.objects.filter(date=yesterday).delete()
+
+        self.assertEqual(reconcile_daily_activity(user=user), 2)
+        self.assertEqual(
+            dict(DailyActivityLog.objects.filter(user=user).values_list('date', 'calories_burned')),
+            {today: 100, yesterday: 50}
+        )
+        self.assertEqual(reconcile_daily_activity(user=user), 0)
+
+
+class ConcurrentActivityTests(TransactionTestCase):
+    """Activity added from many threads at once is all counted"""
+
+    THREADS = 8
+    CALLS = 25
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("in-memory SQLite fails concurrent writers instead of waiting for them")
+
+    def run_threads(self, work):
+        errors = []
+        start = threading.Barrier(self.THREADS)
+
+        def run(n):
+            try:
+                start.wait()
+                for call in range(self.CALLS):
+                    work(n, call)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_upsert_loses_no_increments(self):
+        user = make_user('sprinter')
+        today = date.today()
+        self.run_threads(lambda n, call: add_activity(user, today, calories_burned=1, steps=10))
+
+        totals = HealthData.objects.get(user=user, date=today)
+        self.assertEqual(totals.calories_burned, self.THREADS * self.CALLS)
+        self.assertEqual(totals.steps, self.THREADS * self.CALLS * 10)
+
+    def test_ledger_loses_no_increments(self):
+        user = make_user('rower')
+        today = date.today()
+        self.run_threads(lambda n, call: log_activity(user, 'workout_log', today, f'{n}:{call}', calories_burned=1))
+
+        total = self.THREADS * self.CALLS
+        self.assertEqual(DailyActivityLog.objects.get(user=user, date=today).calories_burned, total)
+        self.assertEqual(HealthData.objects.get(user=user, date=today).calories_burned, total)
+        self.assertEqual(reconcile_daily_activity(user=user), 0)
+
+
+class MergeDuplicateMealsMigrationTests(TransactionTestCase):
+    """0008 leaves one meal per (user, date, meal_type) so 0009's constraint applies"""
+
+    before = [('ml_models', '0007_mealitem_current_tracking')]
+    after = [('ml_models', '0009_mealplan_indexes')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_keeps_newest_meal_and_only_its_items(self):
+        apps = self.migrate(self.before)
+        MealPlan = apps.get_model('ml_models', 'MealPlan')
+        MealItem = apps.get_model('ml_models', 'MealItem')
+        user = apps.get_model(settings.AUTH_USER_MODEL).objects.create(email='dup@example.com', username='dup')
+        today = date.today()
+        meals = [MealPlan.objects.create(user=user, date=today, meal_type='lunch') for _ in range(3)]
+        for meal in meals:
+            MealItem.objects.create(meal=meal, food_name=f'Soup {meal.id}', calories=300, protein=10, carbs=40, fat=8)
+        other = MealPlan.objects.create(user=user, date=today, meal_type='dinner')
+        MealItem.objects.create(meal=other, food_name='Rice', calories=400, protein=8, carbs=80, fat=2)
+
+        apps = self.migrate(self.after)
+        MealPlan = apps.get_model('ml_models', 'MealPlan')
+        MealItem = apps.get_model('ml_models', 'MealItem')
+        self.assertEqual(
+            sorted(MealPlan.objects.filter(user_id=user.id).values_list('id', flat=True)),
+            [meals[-1].id, other.id]
+        )
+        self.assertEqual(
+            list(MealItem.objects.filter(meal_id=meals[-1].id).values_list('food_name', flat=True)),
+            [f'Soup {meals[-1].id}']
+        )
+        self.assertEqual(MealItem.objects.filter(meal__user_id=user.id).count(), 2)
+
+
+class StreamMealPlanTests(TestCase):
+    """Under ASGI the first event is sent before the plan is generated"""
+
+    async def test_first_event_arrives_before_generation_finishes(self):
+        user = await User.objects.acreate(
+            email='streamer@example.com', username='streamer',
+            height=170, weight=65, date_of_birth=date(1992, 5, 1), gender='female'
+        )
+        release = threading.Event()
+
+        def plan_days(calories, diet_type, allergies, goal, days, feedback=None):
+            release.wait(10)
+            plan = template_meal_plan(calories, diet_type, allergies, goal, days)
+            for day in range(1, days + 1):
+                yield day, plan[str(day)], False
+
+        with mock.patch('ml_models.views.stream_meal_plan_days', plan_days):
+            try:
+                response = await self.async_client.post(
+                    '/api/ml/generate-ai-meal-plan/stream/', {'days': 2},
+                    content_type='application/json',
+                    headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'},
+                )
+                self.assertEqual(response.status_code, 200)
+                chunks = aiter(response.streaming_content)
+                first = await asyncio.wait_for(anext(chunks), timeout=5)
+                self.assertFalse(release.is_set())
+                self.assertTrue(first.startswith(b'event: progress'))
+            finally:
+                release.set()
+            rest = b''.join([chunk async for chunk in chunks])
+        self.assertEqual(rest.count(b'event: day'), 2)
+        self.assertIn(b'event: done', rest)
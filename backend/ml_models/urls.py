@@ -1,11 +1,15 @@
-from django.urls import path
+from django.urls import path, re_path
 from .views import (
     generate_ai_meal_plan, 
+    stream_ai_meal_plan,
+    get_generation_job,
     track_meal_item, 
+    track_meal_items,
     daily_nutrition, 
     get_meal_plan, 
     check_active_plan, 
     generate_meal_image_endpoint,
+    meal_image,
     recalculate_meal_plan,
     generate_ai_workout_plan,
     generate_ai_marathon_plan,
@@ -15,9 +19,11 @@ from .views import (
     delete_current_meal_plan,
     get_active_workout_plan,
     track_workout_exercise,
+    track_workout_exercises,
     complete_workout_plan,
     get_active_marathon_plan,
     track_marathon_day,
+    track_marathon_days,
     complete_marathon_week,
     log_workout_calories,
     log_marathon_calories,
@@ -32,11 +38,15 @@ from .views import (
 
 urlpatterns = [
     path("generate-ai-meal-plan/", generate_ai_meal_plan),
+    path("generate-ai-meal-plan/stream/", stream_ai_meal_plan),
+    path("jobs/<int:job_id>/", get_generation_job),
     path("meal-plan/", get_meal_plan),
     path("track-meal-item/", track_meal_item),
+    path("track-meal-items/", track_meal_items),
     path("daily_nutrition/", daily_nutrition),
     path("check-active-plan/", check_active_plan),
     path("generate-meal-image/", generate_meal_image_endpoint),
+    re_path(r"^meal-images/(?P<digest>[0-9a-f]{64})\.(?P<extension>png|jpeg|webp)$", meal_image, name="meal-image"),
     path("recalculate-meal-plan/", recalculate_meal_plan),
     path("delete-meal-plan/", delete_current_meal_plan),
     path("workout-plan/", generate_ai_workout_plan),
@@ -46,9 +56,11 @@ urlpatterns = [
     path("regenerate-workout-plan/", regenerate_workout_plan),
     path("active-workout-plan/", get_active_workout_plan),
     path("track-workout-exercise/", track_workout_exercise),
+    path("track-workout-exercises/", track_workout_exercises),
     path("complete-workout-plan/", complete_workout_plan),
     path("active-marathon-plan/", get_active_marathon_plan),
     path("track-marathon-day/", track_marathon_day),
+    path("track-marathon-days/", track_marathon_days),
     path("complete-marathon-week/", complete_marathon_week),
     path("log-workout-calories/", log_workout_calories),
     path("log-marathon-calories/", log_marathon_calories),
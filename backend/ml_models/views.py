@@ -3,11 +3,58 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from datetime import date, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Count
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.views.decorators.http import condition, require_GET
 from django.utils.timezone import now
 import json
-
-from .models import MealPlan, MealItem, MealItemTracking
-from .ai_meal_planner import generate_meal_plan, generate_meal_image
+import math
+
+from .models import MealItem, GenerationJob
+from .ai_meal_planner import generate_meal_plan, stream_meal_plan_days
+from .meal_templates import template_meal_plan, check_diet_foods
+from .meal_plans import save_meal_plan, retire_meal_plan, meal_plan_days, active_plan_summary, MAX_RANGE_DAYS
+from .meal_plan_versions import current_meals, current_meals_filter, collect_superseded_meals
+from . import llm_cache
+from .json_stream import JSONSchema, PartialJSON, parse_llm_json, require_fields
+from .activity import log_activity, set_source_activity, set_source_activities
+from .workout_plans import (
+    number, save_workout_days, save_workout_exercises, save_marathon_schedule,
+    exercise_dict, day_dict, session_dict, prefetch_workout_plans, workout_plan_json,
+    exercise_tracking, tracked_exercise_dict, cached_exercise_index, session_activity,
+)
+from .media_store import IMAGE_CACHE_SECONDS, CONTENT_TYPES, open_image, absolute_image_url
+from .meal_images import catalog_image, prefetch_plan_images, ImagePending, IMAGE_REQUEST_WAIT_SECONDS
+from .jobs import generation_job, run_or_enqueue, job_status, enqueue_job
+from .nutrition import (
+    daily_nutrition_totals, empty_totals, rounded, TRACKING_STATUSES,
+    logged_nutrition_totals, logged_daily_totals, locked_daily_log, record_tracking,
+    locked_daily_logs, record_trackings,
+)
+
+
+# ---------------- LLM RESPONSES ---------------- #
+# Units each plan is kept or dropped by when a response is cut off or partly broken
+WORKOUT_DAY = require_fields('day_number', 'exercises')
+MARATHON_DAY = require_fields('day', 'run_type')
+EXERCISE = require_fields('name')
+
+
+def generate_plan_json(prompt, schema, use_cache=True):
+    """
+    Generate and parse a plan against its schema. When some units are cut
+    off or broken the valid ones are returned rather than failing the
+    whole request; the damaged response is never cached.
+    """
+    try:
+        return llm_cache.generate(prompt, use_cache=use_cache, parse=lambda text: parse_llm_json(text, schema))
+    except PartialJSON as e:
+        print(f"Keeping {e.report['units']} {schema.units} of a partial Gemini response: {e.report}")
+        return e.value
 
 
 # ---------------- CALORIE CALCULATION ---------------- #
@@ -30,40 +77,25 @@ def recommended_calories(age, gender, height, weight, activity):
 # ---------------- NUTRITION FEEDBACK FOR AI ---------------- #
 def get_feedback(user):
     last_week = now().date() - timedelta(days=7)
-    meals = MealPlan.objects.filter(user=user, date__gte=last_week)
+    return rounded(logged_nutrition_totals(user, last_week))
 
-    protein = carbs = fat = calories = 0
 
-    for meal in meals:
-        for item in meal.items.all():
-            tracking = MealItemTracking.objects.filter(meal_item=item).order_by('-timestamp').first()
-            if tracking and tracking.status == "eaten":
-                ratio = tracking.quantity_ratio
-                calories += item.calories * ratio
-                protein += item.protein * ratio
-                carbs += item.carbs * ratio
-                fat += item.fat * ratio
-
-    return {
-        "calories": round(calories, 1),
-        "protein": round(protein, 1),
-        "carbs": round(carbs, 1),
-        "fat": round(fat, 1),
-    }
+# ---------------- MEAL PLAN REQUEST OPTIONS ---------------- #
+MEAL_PLAN_GENERATORS = ('ai', 'template')
 
 
-# ---------------- GENERATE AI MEAL PLAN ---------------- #
-@api_view(["POST"])
-@permission_classes([IsAuthenticated])
-def generate_ai_meal_plan(request):
-    user = request.user
+def prepare_meal_plan_request(user, data):
+    """
+    Validate a meal plan generation request.
 
+    Returns (options, None) with the generate_meal_plan arguments plus the
+    plan start date, replace_from and generator, or (None, error Response).
+    """
     # Get user data from User model
     if not user.height or not user.weight or not user.date_of_birth or not user.gender:
-        return Response({"error": "Please complete your profile with height, weight, date of birth, and gender"}, status=400)
+        return None, Response({"error": "Please complete your profile with height, weight, date of birth, and gender"}, status=400)
 
     # Calculate age from date of birth
-    from datetime import date
     today = date.today()
     age = today.year - user.date_of_birth.year - ((today.month, today.day) < (user.date_of_birth.month, user.date_of_birth.day))
 
@@ -72,101 +104,367 @@ def generate_ai_meal_plan(request):
         user.gender,
         user.height,
         user.weight,
-        request.data.get("activity", "moderate")
+        data.get("activity", "moderate")
     )
 
-    feedback = get_feedback(user)
-
     # Use user's fitness goal from profile if not provided in request
-    goal = request.data.get("goal")
+    goal = data.get("goal")
     if not goal and user.fitness_goal:
         goal = user.fitness_goal
     elif not goal:
         goal = "maintain"  # Default fallback
 
-    days = request.data.get("days", 7)
+    days = data.get("days", 7)
+
+    generator = data.get("generator") or getattr(settings, 'MEAL_PLAN_GENERATOR', 'ai')
+    if generator not in MEAL_PLAN_GENERATORS:
+        return None, Response({"error": "generator must be 'ai' or 'template'"}, status=400)
+
+    # Fallback days come from the food table, so it must have something to offer
+    try:
+        check_diet_foods(data.get("diet_type", "none"), data.get("allergies", ""))
+    except ValueError as e:
+        return None, Response({"error": str(e)}, status=400)
     
     # Check if user has an active meal plan
-    future_meals = MealPlan.objects.filter(user=user, date__gte=today).count()
+    future_meals = current_meals(user).filter(date__gte=today).count()
+    replace_from = None
+    force_new = data.get("force_new", False)
     
     if future_meals > 0:
         # User has an active plan
-        force_new = request.data.get("force_new", False)
-        
         if not force_new:
             # Return info about existing plan
-            return Response({
+            return None, Response({
                 "error": "active_plan_exists",
                 "message": f"You have an active meal plan with {future_meals} upcoming meals. Set 'force_new' to true to replace it.",
                 "active_meals_count": future_meals
             }, status=400)
         else:
-            # User wants to replace the current plan - delete all future meals
-            MealPlan.objects.filter(user=user, date__gte=today).delete()
-
-    # Use real AI meal planner with Gemini
-    plan = generate_meal_plan(
-        calories,
-        request.data.get("diet_type", "none"),
-        request.data.get("allergies", ""),
-        goal,
-        days,
-        feedback=feedback
-    )
+            # User wants to replace the current plan - the new version takes
+            # over from today in the same transaction that saves it
+            replace_from = today
 
-    # Generate meal plan starting from today
-    for d in range(days):
-        day_date = today + timedelta(days=d)
-        for meal_type, items in plan[str(d+1)].items():
-            meal = MealPlan.objects.create(user=user, date=day_date, meal_type=meal_type)
-
-            for food in items:
-                MealItem.objects.create(
-                    meal=meal,
-                    food_name=food["name"],
-                    calories=food["calories"],
-                    protein=food["protein"],
-                    carbs=food["carbs"],
-                    fat=food["fat"]
-                )
+    # Recent intake personalises the prompt; with nothing eaten there is none to send
+    feedback = get_feedback(user)
+
+    return {
+        "calories": calories,
+        "diet_type": data.get("diet_type", "none"),
+        "allergies": data.get("allergies", ""),
+        "goal": goal,
+        "days": days,
+        "feedback": feedback if any(feedback.values()) else None,
+        "start_date": today,
+        "replace_from": replace_from,
+        "generator": generator,
+        # A forced regeneration wants a new plan, not the cached one
+        "use_cache": not force_new,
+    }, None
+
+
+# ---------------- GENERATE AI MEAL PLAN ---------------- #
+@generation_job("meal_plan")
+def create_ai_meal_plan(user, data):
+    """Generate an AI meal plan starting today and store it"""
+    options, error = prepare_meal_plan_request(user, data)
+    if error:
+        return error
+
+    today = options["start_date"]
+    days = options["days"]
+
+    if options["generator"] == "template":
+        # Instant plan from the bundled food table
+        plan = template_meal_plan(
+            options["calories"], options["diet_type"], options["allergies"], options["goal"], days
+        )
+    else:
+        # Use real AI meal planner with Gemini
+        plan = generate_meal_plan(
+            options["calories"],
+            options["diet_type"],
+            options["allergies"],
+            options["goal"],
+            days,
+            feedback=options["feedback"],
+            use_cache=options["use_cache"]
+        )
+
+    # Save meal plan starting from today
+    written = save_meal_plan(user, plan, today, days, replace_from=options["replace_from"])
+    queue_image_prefetch(user, today, today + timedelta(days=days-1))
+    queue_plan_cleanup(user, written)
 
     return Response({
         "success": True,
         "message": "Meal plan generated successfully",
         "days": days,
         "start_date": str(today),
-        "end_date": str(today + timedelta(days=days-1))
+        "end_date": str(today + timedelta(days=days-1)),
+        "meals_created": written['meals_created'],
+        "items_created": written['items_created']
     })
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def generate_ai_meal_plan(request):
+    """Generate an AI meal plan starting today and store it"""
+    return run_or_enqueue(request, "meal_plan")
+
+
+# ---------------- STREAM AI MEAL PLAN ---------------- #
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _aiter_sync(iterator):
+    """
+    Pull a sync iterator's chunks one at a time in the request's sync
+    thread. Django's ASGI handler would otherwise read a sync streaming
+    response to the end before sending any of it.
+    """
+    done = object()
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(iterator, done)) is not done:
+        yield chunk
+
+
+def _streaming_response(request, chunks, content_type):
+    """StreamingHttpResponse that sends each chunk as it is produced under WSGI and ASGI"""
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _aiter_sync(iter(chunks))
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def stream_ai_meal_plan(request):
+    """
+    Generate a meal plan as server-sent events.
+
+    Each day is saved as soon as Gemini finishes it and sent as a "day"
+    event; a final "done" event summarises the plan.
+    """
+    user = request.user
+
+    options, error = prepare_meal_plan_request(user, request.data)
+    if error:
+        return error
+
+    today = options["start_date"]
+    days = options["days"]
+
+    def events():
+        replace_from = options["replace_from"]
+        meals_created = items_created = fallback_days = days_ready = 0
+
+        yield _sse_event("progress", {"days_ready": 0, "days_total": days})
+
+        if options["generator"] == "template":
+            plan = template_meal_plan(
+                options["calories"], options["diet_type"], options["allergies"], options["goal"], days
+            )
+            plan_days = ((day, plan[str(day)], False) for day in range(1, days + 1))
+        else:
+            plan_days = stream_meal_plan_days(
+                options["calories"],
+                options["diet_type"],
+                options["allergies"],
+                options["goal"],
+                days,
+                feedback=options["feedback"]
+            )
+
+        for day_number, meals, is_fallback in plan_days:
+            day_date = today + timedelta(days=day_number - 1)
+            # The old plan is only replaced once the first new day is ready
+            written = save_meal_plan(user, {"1": meals}, day_date, 1, replace_from=replace_from)
+            queue_plan_cleanup(user, written)
+            replace_from = None
+
+            meals_created += written['meals_created']
+            items_created += written['items_created']
+            fallback_days += is_fallback
+            days_ready += 1
+
+            yield _sse_event("day", {
+                "day": day_number,
+                "date": str(day_date),
+                "meals": meals,
+                "fallback": is_fallback,
+                "days_ready": days_ready,
+                "days_total": days
+            })
+
+        queue_image_prefetch(user, today, today + timedelta(days=days-1))
+
+        yield _sse_event("done", {
+            "success": True,
+            "message": "Meal plan generated successfully",
+            "days": days,
+            "start_date": str(today),
+            "end_date": str(today + timedelta(days=days-1)),
+            "meals_created": meals_created,
+            "items_created": items_created,
+            "fallback_days": fallback_days
+        })
+
+    response = _streaming_response(request, events(), "text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
     
 
+# ---------------- GENERATION JOB STATUS ---------------- #
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_generation_job(request, job_id):
+    """Poll a queued generation job for its status and, once finished, its result"""
+    try:
+        job = GenerationJob.objects.get(id=job_id, user=request.user)
+    except GenerationJob.DoesNotExist:
+        return Response({"error": "Job not found"}, status=404)
+
+    return Response({"success": True, **job_status(job)})
+
+
 # ---------------- TRACK MEAL ITEM ---------------- #
+def parse_tracking(entry):
+    """
+    (meal_item_id, status, quantity_ratio) from a tracking request, the
+    ratio defaulting to a full portion. Raises ValueError when malformed.
+    """
+    try:
+        meal_item_id = int(entry["meal_item_id"])
+        status_val = entry["status"]
+        quantity_ratio = float(entry.get("quantity_ratio", 1.0))
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise ValueError("needs meal_item_id, status and a numeric quantity_ratio")
+    if status_val not in TRACKING_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(TRACKING_STATUSES)}")
+    if not math.isfinite(quantity_ratio) or quantity_ratio < 0:
+        raise ValueError("quantity_ratio must be a number of at least 0")
+    return meal_item_id, status_val, quantity_ratio
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def track_meal_item(request):
-    meal_item_id = request.data.get("meal_item_id")
-    status_val = request.data.get("status")
-    quantity_ratio = request.data.get("quantity_ratio")
+    try:
+        meal_item_id, status_val, quantity_ratio = parse_tracking(request.data)
+    except ValueError as e:
+        return Response({"error": f"Meal tracking {e}"}, status=400)
 
     try:
-        meal_item = MealItem.objects.get(id=meal_item_id)
+        meal_item = MealItem.objects.select_related('meal').get(
+            current_meals_filter('meal__'), id=meal_item_id, meal__user=request.user
+        )
     except MealItem.DoesNotExist:
         return Response({"error": "Meal item not found"}, status=404)
 
-    MealItemTracking.objects.create(
-        meal_item=meal_item,
-        status=status_val,
-        quantity_ratio=quantity_ratio
-    )
+    with transaction.atomic():
+        # Row lock on the day's rollup serialises concurrent tracking for that day
+        log = locked_daily_log(request.user, meal_item.meal.date)
+        if log.is_locked:
+            return Response({"error": "Nutrition for this day is locked"}, status=400)
+
+        # Re-read the item's current state now that no one else can change it
+        meal_item = MealItem.objects.select_for_update().get(id=meal_item.id)
+        record_tracking(log, meal_item, status_val, quantity_ratio)
 
     return Response({"message": "Meal tracking saved"})
     
 
+# ---------------- TRACK MANY MEAL ITEMS ---------------- #
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def track_meal_items(request):
+    """
+    Track several meal items at once, e.g. a whole meal eaten.
+
+    Takes {"items": [{"meal_item_id", "status", "quantity_ratio"}, ...]},
+    applied in order, and returns the refreshed totals of each day touched.
+    """
+    entries = request.data.get("items")
+    if not isinstance(entries, list) or not entries:
+        return Response({"error": "items must be a non-empty list"}, status=400)
+
+    parsed = []
+    for entry in entries:
+        try:
+            parsed.append(parse_tracking(entry))
+        except ValueError as e:
+            return Response({"error": f"Each item {e}"}, status=400)
+
+    item_ids = {item_id for item_id, _, _ in parsed}
+    days = set(
+        MealItem.objects.filter(current_meals_filter('meal__'), id__in=item_ids, meal__user=request.user)
+        .values_list('id', 'meal__date')
+    )
+    missing = item_ids - {item_id for item_id, _ in days}
+    if missing:
+        return Response({"error": "Meal items not found", "meal_item_ids": sorted(missing)}, status=404)
+
+    with transaction.atomic():
+        logs = locked_daily_logs(request.user, {day for _, day in days})
+        locked = sorted(str(day) for day, log in logs.items() if log.is_locked)
+        if locked:
+            return Response({"error": "Nutrition for these days is locked", "dates": locked}, status=400)
+
+        # Re-read the items' current state now that no one else can change it
+        items = MealItem.objects.select_related('meal').select_for_update(of=('self',)).in_bulk(item_ids)
+        record_trackings(logs, [
+            (items[item_id], status_val, quantity_ratio)
+            for item_id, status_val, quantity_ratio in parsed
+        ])
+
+    totals = logged_daily_totals(request.user, logs.keys())
+    return Response({
+        "message": "Meal tracking saved",
+        "tracked": len(parsed),
+        "daily_totals": {str(day): rounded(day_totals) for day, day_totals in totals.items()}
+    })
+    
+
 # ---------------- GET MEAL PLAN FOR DATE ---------------- #
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_meal_plan(request):
-    """Get user's meal plan for a specific date"""
+    """
+    Get user's meal plan for a specific date, or with `start` and `end`
+    for every day of a range (inclusive) in one call
+    """
     user = request.user
+    
+    if 'start' in request.GET or 'end' in request.GET:
+        try:
+            start_date = date.fromisoformat(request.GET.get('start', ''))
+            end_date = date.fromisoformat(request.GET.get('end', ''))
+        except ValueError:
+            return Response({"error": "start and end must both be dates (YYYY-MM-DD)"}, status=400)
+        
+        if end_date < start_date or (end_date - start_date).days >= MAX_RANGE_DAYS:
+            return Response({
+                "error": f"end must be on or after start and the range at most {MAX_RANGE_DAYS} days"
+            }, status=400)
+        
+        days = meal_plan_days(user, start_date, end_date, request)
+        if not days:
+            return Response({
+                'success': False,
+                'message': 'No meal plan found for this date range'
+            }, status=404)
+        
+        # Only days that have meals are included
+        return Response({
+            'success': True,
+            'start': str(start_date),
+            'end': str(end_date),
+            'days': {str(day): meals for day, meals in days.items()}
+        })
+    
     date_str = request.GET.get('date', str(date.today()))
     
     try:
@@ -174,46 +472,18 @@ def get_meal_plan(request):
     except ValueError:
         plan_date = date.today()
     
-    meals = MealPlan.objects.filter(user=user, date=plan_date)
+    meals = meal_plan_days(user, plan_date, plan_date, request).get(plan_date)
     
-    if not meals.exists():
+    if not meals:
         return Response({
             'success': False,
             'message': 'No meal plan found for this date'
         }, status=404)
     
-    result = {}
-    for meal in meals:
-        items = []
-        total_calories = 0
-        
-        for item in meal.items.all():
-            tracking = MealItemTracking.objects.filter(meal_item=item).order_by('-timestamp').first()
-            
-            items.append({
-                'id': item.id,
-                'name': item.food_name,
-                'calories': item.calories,
-                'protein': item.protein,
-                'carbs': item.carbs,
-                'fat': item.fat,
-                'image_url': item.image_url,
-                'tracked': tracking is not None,
-                'status': tracking.status if tracking else None,
-                'quantity_ratio': tracking.quantity_ratio if tracking else 1.0
-            })
-            
-            total_calories += item.calories
-        
-        result[meal.meal_type] = {
-            'items': items,
-            'total_calories': round(total_calories, 1)
-        }
-    
     return Response({
         'success': True,
         'date': date_str,
-        'meals': result
+        'meals': meals
     })
 
 
@@ -224,27 +494,7 @@ def daily_nutrition(request):
     user = request.user
     today = date.today()
 
-    meals = MealPlan.objects.filter(user=user, date=today)
-
-    total_calories = total_protein = total_carbs = total_fat = 0
-
-    for meal in meals:
-        for item in meal.items.all():
-            tracking = MealItemTracking.objects.filter(meal_item=item).order_by('-timestamp').first()
-
-            if tracking and tracking.status == "eaten":
-                ratio = tracking.quantity_ratio
-                total_calories += item.calories * ratio
-                total_protein += item.protein * ratio
-                total_carbs += item.carbs * ratio
-                total_fat += item.fat * ratio
-
-    return Response({
-        "calories": round(total_calories, 1),
-        "protein": round(total_protein, 1),
-        "carbs": round(total_carbs, 1),
-        "fat": round(total_fat, 1)
-    })
+    return Response(rounded(logged_nutrition_totals(user, today, today)))
 
 
 # ---------------- CHECK ACTIVE MEAL PLAN ---------------- #
@@ -255,24 +505,20 @@ def check_active_plan(request):
     user = request.user
     today = date.today()
     
-    # Count future meals (including today)
-    future_meals = MealPlan.objects.filter(user=user, date__gte=today)
+    # Date range and count of future meals (including today) in one query
+    plan = active_plan_summary(user, today)
     
-    if future_meals.exists():
-        # Get date range
-        first_meal = future_meals.order_by('date').first()
-        last_meal = future_meals.order_by('-date').first()
-        
-        total_days = (last_meal.date - first_meal.date).days + 1
-        remaining_days = (last_meal.date - today).days + 1
+    if plan['meals']:
+        total_days = (plan['end_date'] - plan['start_date']).days + 1
+        remaining_days = (plan['end_date'] - today).days + 1
         
         return Response({
             "has_active_plan": True,
-            "start_date": str(first_meal.date),
-            "end_date": str(last_meal.date),
+            "start_date": str(plan['start_date']),
+            "end_date": str(plan['end_date']),
             "total_days": total_days,
             "remaining_days": remaining_days,
-            "total_meals": future_meals.count()
+            "total_meals": plan['meals']
         })
     else:
         return Response({
@@ -297,24 +543,28 @@ def generate_meal_image_endpoint(request):
     if meal_item.image_url:
         return Response({
             "success": True,
-            "image_url": meal_item.image_url,
+            "image_url": absolute_image_url(meal_item.image_url, request),
             "cached": True
         })
     
-    # Generate new image
-    meal_type = meal_item.meal.meal_type
-    image_data = generate_meal_image(meal_item.food_name, meal_type)
+    # Reuse the dish's catalog image, generating it once for everyone if needed
+    try:
+        image_url = catalog_image(meal_item.food_name, meal_item.meal.meal_type, wait=IMAGE_REQUEST_WAIT_SECONDS)
+    except ImagePending:
+        # Someone else is generating this dish; don't hold the request thread for it
+        return Response({
+            "success": False,
+            "pending": True,
+            "retry_after": IMAGE_REQUEST_WAIT_SECONDS
+        }, status=202, headers={"Retry-After": str(IMAGE_REQUEST_WAIT_SECONDS)})
     
-    if image_data:
-        # Store as base64
-        import base64
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
-        meal_item.image_url = f"data:image/png;base64,{image_base64}"
-        meal_item.save()
+    if image_url:
+        meal_item.image_url = image_url
+        meal_item.save(update_fields=['image_url'])
         
         return Response({
             "success": True,
-            "image_url": meal_item.image_url,
+            "image_url": absolute_image_url(meal_item.image_url, request),
             "cached": False
         })
     else:
@@ -324,36 +574,81 @@ def generate_meal_image_endpoint(request):
         }, status=500)
 
 
+# ---------------- PREFETCH MEAL PLAN IMAGES ---------------- #
+def queue_image_prefetch(user, start_date, end_date):
+    """Have a generation worker fill in images for a freshly saved plan"""
+    if getattr(settings, 'MEAL_IMAGE_PREFETCH', False):
+        enqueue_job(user, "meal_plan_images", {"start_date": str(start_date), "end_date": str(end_date)})
+
+
+@generation_job("meal_plan_images")
+def prefetch_meal_plan_images(user, data):
+    """Fill in catalog images for every distinct dish in the user's plan"""
+    counts = prefetch_plan_images(
+        user, date.fromisoformat(data["start_date"]), date.fromisoformat(data["end_date"])
+    )
+    return Response({"success": True, **counts})
+
+
+# ---------------- CLEAN UP SUPERSEDED MEAL PLANS ---------------- #
+def queue_plan_cleanup(user, written):
+    """
+    Delete the meals a plan swap superseded: on a generation worker when
+    one runs, else right away so old versions don't pile up
+    """
+    if not written['superseded_versions']:
+        return
+    if getattr(settings, 'GENERATION_WORKER_ENABLED', False):
+        enqueue_job(user, "meal_plan_cleanup", {})
+        return
+    try:
+        collect_superseded_meals(user=user)
+    except Exception as e:
+        # The swap is already saved; collect_meal_plan_versions picks up what's left
+        print(f"Error deleting superseded meal plans: {e}")
+
+
+@generation_job("meal_plan_cleanup")
+def collect_meal_plan_versions(user, data):
+    """Delete the user's superseded meals and the versions left empty"""
+    meals, versions = collect_superseded_meals(user=user)
+    return Response({"success": True, "deleted_meals": meals, "deleted_versions": versions})
+
+
+# ---------------- SERVE MEAL IMAGE ---------------- #
+@require_GET
+@condition(etag_func=lambda request, digest, extension: digest)
+def meal_image(request, digest, extension):
+    """Serve a stored meal image; its URL is its content hash, so it can be cached forever"""
+    image = open_image(digest, extension)
+    if image is None:
+        raise Http404("Image not found")
+
+    response = FileResponse(image, content_type=CONTENT_TYPES[extension])
+    response["Cache-Control"] = f"public, max-age={IMAGE_CACHE_SECONDS}, immutable"
+    return response
+
+
 # ---------------- RECALCULATE MEAL PLAN BASED ON ACTUAL INTAKE ---------------- #
-@api_view(["POST"])
-@permission_classes([IsAuthenticated])
-def recalculate_meal_plan(request):
+@generation_job("recalculate_meal_plan")
+def recalculate_user_meal_plan(user, data):
     """
     Recalculate remaining meal plan based on what user actually ate
     This provides smart AI adjustments based on user's eating patterns
     """
     from .ai_meal_planner import recalculate_meal_plan as ai_recalculate
     
-    user = request.user
     today = date.today()
     
     # Get user's eating data from the last 7 days
     last_week = today - timedelta(days=7)
-    meals = MealPlan.objects.filter(user=user, date__gte=last_week, date__lt=today)
-    
-    total_calories = total_protein = total_carbs = total_fat = 0
-    days_with_data = set()
-    
-    for meal in meals:
-        days_with_data.add(meal.date)
-        for item in meal.items.all():
-            tracking = MealItemTracking.objects.filter(meal_item=item).order_by('-timestamp').first()
-            if tracking and tracking.status == "eaten":
-                ratio = tracking.quantity_ratio
-                total_calories += item.calories * ratio
-                total_protein += item.protein * ratio
-                total_carbs += item.carbs * ratio
-                total_fat += item.fat * ratio
+    days_with_data = daily_nutrition_totals(user, last_week, today - timedelta(days=1))
+    
+    totals = empty_totals()
+    for day_totals in days_with_data.values():
+        for field, value in day_totals.items():
+            totals[field] += value
+    total_calories = totals['calories']
     
     days_tracked = len(days_with_data)
     
@@ -375,59 +670,45 @@ def recalculate_meal_plan(request):
         user.gender,
         user.height,
         user.weight,
-        request.data.get("activity", "moderate")
+        data.get("activity", "moderate")
     )
     
     # Prepare intake data
     user_intake_data = {
         'total_calories': total_calories,
-        'total_protein': total_protein,
-        'total_carbs': total_carbs,
-        'total_fat': total_fat,
+        'total_protein': totals['protein'],
+        'total_carbs': totals['carbs'],
+        'total_fat': totals['fat'],
         'days_tracked': days_tracked,
         'deficit_or_surplus': (target_calories * days_tracked) - total_calories
     }
     
     # Get remaining days in current plan
-    future_meals = MealPlan.objects.filter(user=user, date__gte=today)
-    if not future_meals.exists():
+    remaining_days = active_plan_summary(user, today)['days']
+    if not remaining_days:
         return Response({
             "error": "No active meal plan found. Please generate a new meal plan first."
         }, status=400)
     
-    # Count unique future dates
-    future_dates = future_meals.values_list('date', flat=True).distinct()
-    remaining_days = len(future_dates)
-    
-    # Delete future meals (we'll replace them with recalculated ones)
-    MealPlan.objects.filter(user=user, date__gte=today).delete()
+    try:
+        check_diet_foods(data.get("diet_type", "none"), data.get("allergies", ""))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
     
     # Get recalculated plan from AI
     result = ai_recalculate(
         user_intake_data=user_intake_data,
         target_calories=target_calories,
-        diet_type=request.data.get("diet_type", "none"),
-        allergies=request.data.get("allergies", ""),
+        diet_type=data.get("diet_type", "none"),
+        allergies=data.get("allergies", ""),
         goal=user.fitness_goal or "maintain",
         remaining_days=remaining_days
     )
     
-    # Save the new recalculated plan
-    plan = result['meal_plan']
-    for d in range(remaining_days):
-        day_date = today + timedelta(days=d)
-        for meal_type, items in plan[str(d+1)].items():
-            meal = MealPlan.objects.create(user=user, date=day_date, meal_type=meal_type)
-            
-            for food in items:
-                MealItem.objects.create(
-                    meal=meal,
-                    food_name=food["name"],
-                    calories=food["calories"],
-                    protein=food["protein"],
-                    carbs=food["carbs"],
-                    fat=food["fat"]
-                )
+    # Replace future meals with the recalculated plan
+    written = save_meal_plan(user, result['meal_plan'], today, remaining_days, replace_from=today)
+    queue_image_prefetch(user, today, today + timedelta(days=remaining_days-1))
+    queue_plan_cleanup(user, written)
     
     return Response({
         "success": True,
@@ -436,23 +717,30 @@ def recalculate_meal_plan(request):
         "adjusted_calories": result['adjusted_calories'],
         "original_target": result['original_target'],
         "days_recalculated": remaining_days,
+        "meals_created": written['meals_created'],
+        "items_created": written['items_created'],
         "your_avg_daily_intake": round(total_calories / days_tracked, 1),
         "days_analyzed": days_tracked
     })
 
 
-# ---------------- AI WORKOUT PLANNER ---------------- #
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
-def generate_ai_workout_plan(request):
+def recalculate_meal_plan(request):
+    """
+    Recalculate remaining meal plan based on what user actually ate
+    This provides smart AI adjustments based on user's eating patterns
+    """
+    return run_or_enqueue(request, "recalculate_meal_plan")
+
+
+# ---------------- AI WORKOUT PLANNER ---------------- #
+@generation_job("workout_plan")
+def create_ai_workout_plan(user, data):
     """Generate personalized AI workout plan and store in database"""
-    from google import genai
-    import os
-    import json
     from health_data.models import Workout
     from datetime import date as dt
     
-    user = request.user
     
     # Validate user profile
     if not user.height or not user.weight or not user.date_of_birth or not user.gender:
@@ -462,17 +750,17 @@ def generate_ai_workout_plan(request):
     
     # Calculate age and BMI
     today = dt.today()
-    age = request.data.get("age") or (today.year - user.date_of_birth.year - ((today.month, today.day) < (user.date_of_birth.month, user.date_of_birth.day)))
-    weight = request.data.get("weight", user.weight)
-    height = request.data.get("height", user.height)
+    age = data.get("age") or (today.year - user.date_of_birth.year - ((today.month, today.day) < (user.date_of_birth.month, user.date_of_birth.day)))
+    weight = data.get("weight", user.weight)
+    height = data.get("height", user.height)
     
     height_m = height / 100
     bmi = weight / (height_m * height_m)
     
     # Get fitness level and goal
-    fitness_level = request.data.get("fitness_level", "intermediate")
-    goal = request.data.get("goal") or user.fitness_goal or "general_fitness"
-    duration = request.data.get("duration", "7_days")  # 7_days, 1_month, 3_months
+    fitness_level = data.get("fitness_level", "intermediate")
+    goal = data.get("goal") or user.fitness_goal or "general_fitness"
+    duration = data.get("duration", "7_days")  # 7_days, 1_month, 3_months
     
     # Map duration to days
     duration_map = {
@@ -483,12 +771,9 @@ def generate_ai_workout_plan(request):
     num_days = duration_map.get(duration, 7)
     
     # Get health data from request (from Health Connect or defaults)
-    avg_steps = request.data.get("avg_steps", 5000)
-    sleep_hours = request.data.get("sleep_hours", 7)
-    spo2 = request.data.get("spo2", 98)
-    
-    # Configure Gemini with new API
-    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+    avg_steps = data.get("avg_steps", 5000)
+    sleep_hours = data.get("sleep_hours", 7)
+    spo2 = data.get("spo2", 98)
     
     # Create enhanced prompt with health data
     prompt = f"""Generate a {num_days}-day personalized workout plan in JSON format for:
@@ -542,31 +827,20 @@ Return ONLY valid JSON in this exact format (NO markdown, NO backticks):
 }}"""
     
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
-        )
-        response_text = response.text.strip()
+        workout_plan = generate_plan_json(prompt, JSONSchema(WORKOUT_DAY, 'days', expected=num_days))
         
-        # Extract JSON from response
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        workout_plan = json.loads(response_text)
-        
-        # Store in database - store the entire multi-day plan
-        workout = Workout.objects.create(
-            user=user,
-            workout_name=workout_plan.get('plan_title', f'{num_days}-Day Workout Plan'),
-            workout_type='AI Generated',
-            duration=num_days,  # Store number of days
-            calories_burned=sum([day.get('total_calories', 0) for day in workout_plan.get('days', [])]),
-            intensity='moderate',
-            date=today,
-            description=json.dumps(workout_plan.get('days', []))  # Store all days
-        )
+        # Store in database - the plan with its days and exercises
+        with transaction.atomic():
+            workout = Workout.objects.create(
+                user=user,
+                workout_name=workout_plan.get('plan_title', f'{num_days}-Day Workout Plan'),
+                workout_type='AI Generated',
+                duration=num_days,  # Store number of days
+                calories_burned=sum([number(day.get('total_calories')) for day in workout_plan.get('days', [])]),
+                intensity='moderate',
+                date=today
+            )
+            save_workout_days(workout, workout_plan.get('days', []))
         
         return Response({
             "success": True,
@@ -580,18 +854,20 @@ Return ONLY valid JSON in this exact format (NO markdown, NO backticks):
         }, status=500)
 
 
-# ---------------- AI MARATHON TRAINING PLANNER ---------------- #
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
-def generate_ai_marathon_plan(request):
+def generate_ai_workout_plan(request):
+    """Generate personalized AI workout plan and store in database"""
+    return run_or_enqueue(request, "workout_plan")
+
+
+# ---------------- AI MARATHON TRAINING PLANNER ---------------- #
+@generation_job("marathon_plan")
+def create_ai_marathon_plan(user, data):
     """Generate personalized AI marathon training plan and store in database"""
-    from google import genai
-    import os
-    import json
     from health_data.models import Marathon
     from datetime import date as dt, timedelta, datetime
     
-    user = request.user
     
     # Validate user profile
     if not user.height or not user.weight or not user.date_of_birth or not user.gender:
@@ -601,24 +877,24 @@ def generate_ai_marathon_plan(request):
     
     # Calculate age and BMI
     today = dt.today()
-    age = request.data.get("age") or (today.year - user.date_of_birth.year - ((today.month, today.day) < (user.date_of_birth.month, user.date_of_birth.day)))
+    age = data.get("age") or (today.year - user.date_of_birth.year - ((today.month, today.day) < (user.date_of_birth.month, user.date_of_birth.day)))
     
     height_m = user.height / 100
     bmi = user.weight / (height_m * height_m)
     
     # Get training parameters
-    experience_level = request.data.get("experience_level", "beginner")
-    target_distance = request.data.get("target_distance", "half_marathon")  # half_marathon, full_marathon, 10k
+    experience_level = data.get("experience_level", "beginner")
+    target_distance = data.get("target_distance", "half_marathon")  # half_marathon, full_marathon, 10k
     
     # Get health data from request (from Health Connect or defaults)
-    avg_steps = request.data.get("avg_steps", 5000)
-    spo2 = request.data.get("spo2", 98)
-    resting_heart_rate = request.data.get("resting_heart_rate", 70)
-    sleep_hours = request.data.get("sleep_hours", 7)
-    goal_time_hours = request.data.get("goal_time_hours", 4)
+    avg_steps = data.get("avg_steps", 5000)
+    spo2 = data.get("spo2", 98)
+    resting_heart_rate = data.get("resting_heart_rate", 70)
+    sleep_hours = data.get("sleep_hours", 7)
+    goal_time_hours = data.get("goal_time_hours", 4)
     
     # Get marathon date
-    marathon_date_str = request.data.get("marathon_date")
+    marathon_date_str = data.get("marathon_date")
     if marathon_date_str:
         try:
             target_date = datetime.strptime(marathon_date_str, "%Y-%m-%d").date()
@@ -629,9 +905,6 @@ def generate_ai_marathon_plan(request):
     
     weeks_until_marathon = max(1, (target_date - today).days // 7)
     
-    # Configure Gemini with new API
-    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-    
     # Create enhanced prompt with health data
     prompt = f"""Generate a personalized weekly marathon training plan in JSON format for:
     
@@ -687,29 +960,18 @@ Return ONLY valid JSON in this exact format (NO markdown, NO backticks):
 }}"""
     
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
-        )
-        response_text = response.text.strip()
-        
-        # Extract JSON from response
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        marathon_plan = json.loads(response_text)
+        marathon_plan = generate_plan_json(prompt, JSONSchema(MARATHON_DAY, 'weekly_schedule', expected=7))
         
         # Store in database
-        marathon = Marathon.objects.create(
-            user=user,
-            marathon_name=marathon_plan.get('plan_title', 'AI Marathon Plan'),
-            distance=marathon_plan.get('weekly_mileage_km', 0),
-            target_date=target_date,
-            status='training',
-            notes=json.dumps(marathon_plan.get('weekly_schedule', []))
-        )
+        with transaction.atomic():
+            marathon = Marathon.objects.create(
+                user=user,
+                marathon_name=marathon_plan.get('plan_title', 'AI Marathon Plan'),
+                distance=marathon_plan.get('weekly_mileage_km', 0),
+                target_date=target_date,
+                status='training'
+            )
+            save_marathon_schedule(marathon, marathon_plan.get('weekly_schedule', []))
         
         return Response({
             "success": True,
@@ -723,6 +985,13 @@ Return ONLY valid JSON in this exact format (NO markdown, NO backticks):
         }, status=500)
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def generate_ai_marathon_plan(request):
+    """Generate personalized AI marathon training plan and store in database"""
+    return run_or_enqueue(request, "marathon_plan")
+
+
 # ---------------- GET USER'S WORKOUT PLANS ---------------- #
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
@@ -731,22 +1000,17 @@ def get_user_workout_plans(request):
     from health_data.models import Workout
     
     user = request.user
-    workouts = Workout.objects.filter(user=user).order_by('-created_at')[:10]
+    workouts = prefetch_workout_plans(Workout.objects.filter(user=user).order_by('-created_at')[:10])
     
     plans = []
     for workout in workouts:
-        try:
-            exercises = json.loads(workout.description) if workout.description else []
-        except:
-            exercises = []
-        
         plans.append({
             'id': workout.id,
             'workout_name': workout.workout_name,
             'duration': workout.duration,
             'calories_burned': workout.calories_burned,
             'date': str(workout.date),
-            'exercises': exercises
+            'exercises': workout_plan_json(workout)
         })
     
     return Response({
@@ -763,22 +1027,17 @@ def get_user_marathon_plans(request):
     from health_data.models import Marathon
     
     user = request.user
-    marathons = Marathon.objects.filter(user=user).order_by('-created_at')[:10]
+    marathons = Marathon.objects.filter(user=user).order_by('-created_at').prefetch_related('sessions')[:10]
     
     plans = []
     for marathon in marathons:
-        try:
-            schedule = json.loads(marathon.notes) if marathon.notes else []
-        except:
-            schedule = []
-        
         plans.append({
             'id': marathon.id,
             'marathon_name': marathon.marathon_name,
             'distance': marathon.distance,
             'target_date': str(marathon.target_date),
             'status': marathon.status,
-            'schedule': schedule
+            'schedule': [session_dict(session) for session in marathon.sessions.all()]
         })
     
     return Response({
@@ -788,17 +1047,12 @@ def get_user_marathon_plans(request):
 
 
 # ---------------- REGENERATE WORKOUT PLAN BASED ON USER BEHAVIOR ---------------- #
-@api_view(["POST"])
-@permission_classes([IsAuthenticated])
-def regenerate_workout_plan(request):
+@generation_job("regenerate_workout_plan")
+def create_adaptive_workout_plan(user, data):
     """Regenerate workout plan based on user's workout history and behavior"""
     from health_data.models import Workout
     from datetime import timedelta, date as dt
-    from google import genai
-    import os
-    import json
     
-    user = request.user
     today = dt.today()
     last_30_days = today - timedelta(days=30)
     
@@ -819,9 +1073,6 @@ def regenerate_workout_plan(request):
     height_m = user.height / 100
     bmi = user.weight / (height_m * height_m)
     
-    # Configure Gemini with new API
-    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-    
     # Create adaptive prompt
     prompt = f"""Generate an ADAPTIVE workout plan based on user's actual behavior:
 
@@ -853,24 +1104,21 @@ Return ONLY valid JSON (NO markdown):
 }}"""
     
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
-        )
-        response_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-        workout_plan = json.loads(response_text)
+        # Adaptive plans are personal and should change between requests
+        workout_plan = generate_plan_json(prompt, JSONSchema(EXERCISE, 'exercises'), use_cache=False)
         
         # Store in database
-        workout = Workout.objects.create(
-            user=user,
-            workout_name=workout_plan.get('plan_title', 'Adaptive Workout Plan'),
-            workout_type='AI Adaptive',
-            duration=workout_plan.get('total_duration_minutes', 0),
-            calories_burned=workout_plan.get('total_calories', 0),
-            intensity='moderate',
-            date=today,
-            description=json.dumps(workout_plan.get('exercises', []))
-        )
+        with transaction.atomic():
+            workout = Workout.objects.create(
+                user=user,
+                workout_name=workout_plan.get('plan_title', 'Adaptive Workout Plan'),
+                workout_type='AI Adaptive',
+                duration=workout_plan.get('total_duration_minutes', 0),
+                calories_burned=workout_plan.get('total_calories', 0),
+                intensity='moderate',
+                date=today
+            )
+            save_workout_exercises(workout, workout_plan.get('exercises', []))
         
         return Response({
             "success": True,
@@ -888,6 +1136,13 @@ Return ONLY valid JSON (NO markdown):
         }, status=500)
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def regenerate_workout_plan(request):
+    """Regenerate workout plan based on user's workout history and behavior"""
+    return run_or_enqueue(request, "regenerate_workout_plan")
+
+
 # ---------------- DELETE CURRENT MEAL PLAN ---------------- #
 @api_view(["DELETE"])
 @permission_classes([IsAuthenticated])
@@ -896,44 +1151,71 @@ def delete_current_meal_plan(request):
     user = request.user
     today = date.today()
     
-    # Get count of meals to be deleted
-    future_meals = MealPlan.objects.filter(user=user, date__gte=today)
-    meal_count = future_meals.count()
+    # Get count and date range of meals to be deleted
+    plan = active_plan_summary(user, today)
     
-    if meal_count == 0:
+    if plan['meals'] == 0:
         return Response({
             "success": False,
             "message": "No active meal plan found"
         }, status=404)
     
-    # Get date range for info
-    first_meal = future_meals.order_by('date').first()
-    last_meal = future_meals.order_by('-date').first()
-    
-    # Delete all future meals
-    future_meals.delete()
+    # Supersede all future meals and drop their tracking from the rollups;
+    # the rows themselves are deleted in the background
+    superseded = retire_meal_plan(user, today)
+    queue_plan_cleanup(user, {'superseded_versions': superseded})
     
     return Response({
         "success": True,
         "message": f"Meal plan deleted successfully",
-        "deleted_meals": meal_count,
+        "deleted_meals": plan['meals'],
         "date_range": {
-            "start": str(first_meal.date),
-            "end": str(last_meal.date)
+            "start": str(plan['start_date']),
+            "end": str(plan['end_date'])
         }
     })
 
 
 # ---------------- GET ACTIVE WORKOUT PLAN ---------------- #
+def requested_day_window(params):
+    """
+    (from_day, to_day) of a ?day= or ?from_day=&to_day= request, either end
+    open (None) when left out; None when no window is asked for
+    """
+    if 'day' in params:
+        from_day = to_day = params['day']
+    elif 'from_day' in params or 'to_day' in params:
+        from_day, to_day = params.get('from_day'), params.get('to_day')
+    else:
+        return None
+    
+    try:
+        from_day, to_day = [int(day) if day is not None else None for day in (from_day, to_day)]
+    except ValueError:
+        raise ValueError("day, from_day and to_day must be day numbers")
+    if (from_day is not None and from_day < 1) or (to_day is not None and to_day < (from_day or 1)):
+        raise ValueError("Days start at 1 and to_day must not be before from_day")
+    return from_day, to_day
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_active_workout_plan(request):
-    """Get the most recent workout plan with tracking status"""
+    """
+    Get the most recent workout plan with tracking status. With ?day= or
+    ?from_day=&to_day=, only those days of a multi-day plan are returned;
+    total_days and progress still cover the whole plan.
+    """
     from health_data.models import Workout
-    from .models import WorkoutExerciseTracking
+    from .models import WorkoutExerciseTracking, PlanExercise
     
     user = request.user
     
+    try:
+        window = requested_day_window(request.GET)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    
     # Get the most recent workout plan
     workout = Workout.objects.filter(user=user, workout_type='AI Generated').order_by('-created_at').first()
     
@@ -943,100 +1225,74 @@ def get_active_workout_plan(request):
             'message': 'No workout plan found'
         })
     
-    # Parse days from description (new multi-day format)
-    try:
-        days = json.loads(workout.description) if workout.description else []
+    if window is None:
+        days = list(workout.plan_days.all())
+        exercises = list(workout.plan_exercises.all())
+        tracking = exercise_tracking(workout)
+        total_days = len(days)
+        total_exercises = len(exercises)
+        completed_exercises = sum(1 for exercise in exercises if getattr(tracking.get(exercise.exercise_index), 'completed', False))
+    else:
+        totals = workout.plan_days.aggregate(days=Count('id', distinct=True), exercises=Count('exercises'))
+        total_days = totals['days']
+        days = workout.plan_days.all()
+        if window[0] is not None:
+            days = days.filter(day_number__gte=window[0])
+        if window[1] is not None:
+            days = days.filter(day_number__lte=window[1])
+        days = list(days) if total_days else []
+        exercises = list(PlanExercise.objects.filter(day__in=days)) if total_days else list(workout.plan_exercises.all())
+        tracking = exercise_tracking(workout, [exercise.exercise_index for exercise in exercises])
+        total_exercises = totals['exercises']
+        completed_exercises = WorkoutExerciseTracking.objects.filter(workout=workout, completed=True).count()
+    
+    if total_days:
+        # Multi-day format
+        exercises_by_day = {}
+        for exercise in exercises:
+            exercises_by_day.setdefault(exercise.day_id, []).append(tracked_exercise_dict(exercise, tracking))
         
-        # Check if it's the new multi-day format
-        if days and isinstance(days, list) and len(days) > 0 and 'day_number' in days[0]:
-            # Multi-day format
-            days_with_tracking = []
-            total_exercises = 0
-            completed_exercises = 0
-            
-            for day in days:
-                day_exercises = []
-                for idx, exercise in enumerate(day.get('exercises', [])):
-                    exercise_global_index = total_exercises + idx
-                    tracking = WorkoutExerciseTracking.objects.filter(
-                        workout=workout, 
-                        exercise_index=exercise_global_index
-                    ).first()
-                    
-                    day_exercises.append({
-                        'index': exercise_global_index,
-                        'name': exercise.get('name', ''),
-                        'workout_type': exercise.get('workout_type', 'general'),
-                        'reps_or_duration': exercise.get('reps_or_duration', ''),
-                        'calories': exercise.get('calories', 0),
-                        'completed': tracking.completed if tracking else False,
-                        'difficulty': tracking.difficulty if tracking else None
-                    })
-                    
-                    if tracking and tracking.completed:
-                        completed_exercises += 1
-                
-                total_exercises += len(day.get('exercises', []))
-                
-                days_with_tracking.append({
-                    'day_number': day.get('day_number', 0),
-                    'day_name': day.get('day_name', ''),
-                    'is_rest_day': day.get('is_rest_day', False),
-                    'total_duration_minutes': day.get('total_duration_minutes', 0),
-                    'total_calories': day.get('total_calories', 0),
-                    'exercises': day_exercises
-                })
-            
-            all_completed = completed_exercises == total_exercises
-            
-            return Response({
-                'has_active_plan': True,
-                'workout_id': workout.id,
-                'workout_name': workout.workout_name,
-                'is_multi_day': True,
-                'total_days': len(days),
-                'days': days_with_tracking,
-                'all_completed': all_completed,
-                'progress': {
-                    'completed': completed_exercises,
-                    'total': total_exercises
-                },
-                'created_at': workout.created_at
-            })
-        else:
-            # Old single-day format (backward compatibility)
-            exercises = days  # In old format, it's just exercises array
-            exercises_with_tracking = []
-            for idx, exercise in enumerate(exercises):
-                tracking = WorkoutExerciseTracking.objects.filter(workout=workout, exercise_index=idx).first()
-                exercises_with_tracking.append({
-                    'index': idx,
-                    'name': exercise.get('name', ''),
-                    'workout_type': exercise.get('workout_type', 'general'),
-                    'reps_or_duration': exercise.get('reps_or_duration', ''),
-                    'calories': exercise.get('calories', 0),
-                    'completed': tracking.completed if tracking else False,
-                    'difficulty': tracking.difficulty if tracking else None
-                })
-            
-            all_completed = all(e['completed'] for e in exercises_with_tracking)
-            
-            return Response({
-                'has_active_plan': True,
-                'workout_id': workout.id,
-                'workout_name': workout.workout_name,
-                'is_multi_day': False,
-                'total_duration': workout.duration,
-                'total_calories': workout.calories_burned,
-                'exercises': exercises_with_tracking,
-                'all_completed': all_completed,
-                'created_at': workout.created_at
-            })
-    except Exception as e:
-        return Response({
-            'has_active_plan': False,
-            'error': str(e)
-        }, status=500)
+        days_with_tracking = [
+            dict(day_dict(day), exercises=exercises_by_day.get(day.id, []))
+            for day in days
+        ]
+        
+        all_completed = completed_exercises == total_exercises
+        
+        response = {
+            'has_active_plan': True,
+            'workout_id': workout.id,
+            'workout_name': workout.workout_name,
+            'is_multi_day': True,
+            'total_days': total_days,
+            'days': days_with_tracking,
+            'all_completed': all_completed,
+            'progress': {
+                'completed': completed_exercises,
+                'total': total_exercises
+            },
+            'created_at': workout.created_at
+        }
+        if window is not None:
+            response['from_day'], response['to_day'] = window
+        return Response(response)
+    
+    # Single-day format
+    exercises_with_tracking = [tracked_exercise_dict(exercise, tracking) for exercise in exercises]
+    
+    all_completed = all(e['completed'] for e in exercises_with_tracking)
+    
+    return Response({
+        'has_active_plan': True,
+        'workout_id': workout.id,
+        'workout_name': workout.workout_name,
+        'is_multi_day': False,
+        'total_duration': workout.duration,
+        'total_calories': workout.calories_burned,
+        'exercises': exercises_with_tracking,
+        'all_completed': all_completed,
+        'created_at': workout.created_at
+    })
 
 
 # ---------------- TRACK WORKOUT EXERCISE ---------------- #
@@ -1044,7 +1300,7 @@ def get_active_workout_plan(request):
 @permission_classes([IsAuthenticated])
 def track_workout_exercise(request):
     """Mark a workout exercise as completed and log calories"""
-    from health_data.models import Workout, HealthData
+    from health_data.models import Workout
     from .models import WorkoutExerciseTracking
     from django.utils import timezone
     from datetime import date as dt
@@ -1058,6 +1314,14 @@ def track_workout_exercise(request):
     except Workout.DoesNotExist:
         return Response({'error': 'Workout not found'}, status=404)
     
+    # Find the exercise's day and calories in the compiled plan
+    plan = cached_exercise_index(workout.id)
+    try:
+        exercise_index = int(exercise_index)
+        day_number, _, exercise_calories = plan.locate(exercise_index)
+    except (TypeError, ValueError, IndexError):
+        return Response({'error': f'exercise_index must be between 0 and {plan.total - 1}'}, status=400)
+    
     # Create or update tracking
     tracking, created = WorkoutExerciseTracking.objects.get_or_create(
         workout=workout,
@@ -1070,73 +1334,125 @@ def track_workout_exercise(request):
         tracking.completed_at = timezone.now() if completed else None
         tracking.save()
     
-    # Log calories to daily progress if completed
-    if completed:
-        try:
-            days = json.loads(workout.description) if workout.description else []
-            
-            # Find the exercise and its calories
-            exercise_calories = 0
-            if days and isinstance(days, list) and len(days) > 0 and 'day_number' in days[0]:
-                # Multi-day format
-                for day in days:
-                    for ex in day.get('exercises', []):
-                        # Match by global index (we need to calculate it)
-                        pass  # Will calculate below
-            
-            # For now, get calories from the exercise data
-            # We'll need to parse the workout structure to find the exact exercise
-            today = dt.today()
-            health_data, _ = HealthData.objects.get_or_create(
-                user=request.user,
-                date=today,
-                defaults={'steps': 0, 'calories_burned': 0, 'distance': 0, 'active_minutes': 0}
-            )
-            
-            # Parse workout to find exercise calories
-            if days and isinstance(days, list):
-                if len(days) > 0 and 'day_number' in days[0]:
-                    # Multi-day format - find exercise by index
-                    current_index = 0
-                    for day in days:
-                        for ex in day.get('exercises', []):
-                            if current_index == exercise_index:
-                                exercise_calories = ex.get('calories', 0)
-                                break
-                            current_index += 1
-                        if exercise_calories > 0:
-                            break
-                else:
-                    # Single day format
-                    if exercise_index < len(days):
-                        exercise_calories = days[exercise_index].get('calories', 0)
-            
-            if exercise_calories > 0:
-                health_data.calories_burned += exercise_calories
-                health_data.save()
-        except Exception as e:
-            pass  # Don't fail the tracking if calorie logging fails
+    # Log calories to daily progress if completed, or take them back if not
+    try:
+        set_source_activity(
+            request.user, 'workout_exercise', f"{workout.id}:{exercise_index}", dt.today(),
+            {'calories_burned': exercise_calories} if completed else None
+        )
+    except Exception as e:
+        print(f"Error logging workout exercise calories: {e}")  # Don't fail the tracking
     
     # Check if all exercises are completed
-    try:
-        exercises = json.loads(workout.description) if workout.description else []
-        if exercises and isinstance(exercises, list) and len(exercises) > 0 and 'day_number' in exercises[0]:
-            # Multi-day format
-            total_exercises = sum(len(day.get('exercises', [])) for day in exercises)
-        else:
-            total_exercises = len(exercises)
-        completed_count = WorkoutExerciseTracking.objects.filter(workout=workout, completed=True).count()
-        all_completed = completed_count == total_exercises
-    except:
-        all_completed = False
+    completed_count = WorkoutExerciseTracking.objects.filter(workout=workout, completed=True).count()
+    all_completed = completed_count == plan.total
     
     return Response({
         'success': True,
         'completed': tracking.completed,
+        'day_number': day_number,
         'all_completed': all_completed
     })
 
 
+def tracking_changes(entries, index_key):
+    """
+    {index: completed} from a bulk tracking request's list of
+    {index_key, "completed"} entries, later entries for an index winning.
+    Raises ValueError when an entry is malformed.
+    """
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"must be a non-empty list of {{{index_key}, completed}}")
+    
+    changes = {}
+    for entry in entries:
+        try:
+            index = int(entry[index_key])
+            completed = entry.get('completed', True)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError(f"each entry needs an integer {index_key}")
+        if not isinstance(completed, bool):
+            raise ValueError("completed must be true or false")
+        changes[index] = completed
+    return changes
+
+
+# ---------------- TRACK MANY WORKOUT EXERCISES ---------------- #
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def track_workout_exercises(request):
+    """
+    Mark several exercises of a workout at once, e.g. a whole day done.
+
+    Takes {"workout_id", "exercises": [{"exercise_index", "completed"}, ...]}
+    and applies them in one transaction: one upsert of the tracking rows,
+    one calorie update and one progress count.
+    """
+    from health_data.models import Workout
+    from .models import WorkoutExerciseTracking
+    from django.utils import timezone
+    from datetime import date as dt
+    
+    try:
+        workout = Workout.objects.get(id=request.data.get('workout_id'), user=request.user)
+    except (Workout.DoesNotExist, TypeError, ValueError):
+        return Response({'error': 'Workout not found'}, status=404)
+    
+    try:
+        changes = tracking_changes(request.data.get('exercises'), 'exercise_index')
+    except ValueError as e:
+        return Response({'error': f'exercises: {e}'}, status=400)
+    
+    plan = cached_exercise_index(workout.id)
+    invalid = sorted(index for index in changes if not 0 <= index < plan.total)
+    if invalid:
+        return Response({
+            'error': f'exercise_index must be between 0 and {plan.total - 1}',
+            'exercise_indexes': invalid
+        }, status=400)
+    
+    stamp = timezone.now()
+    with transaction.atomic():
+        WorkoutExerciseTracking.objects.bulk_create(
+            [
+                WorkoutExerciseTracking(
+                    workout=workout,
+                    exercise_index=index,
+                    completed=completed,
+                    completed_at=stamp if completed else None
+                )
+                for index, completed in sorted(changes.items())
+            ],
+            update_conflicts=True,
+            unique_fields=['workout', 'exercise_index'],
+            update_fields=['completed', 'completed_at'],
+        )
+        
+        # Log the completed exercises' calories and take back the rest in one
+        # go, in a savepoint so a failure there leaves the transaction usable
+        try:
+            with transaction.atomic():
+                set_source_activities(request.user, 'workout_exercise', {
+                    f"{workout.id}:{index}": (dt.today(), {'calories_burned': plan.locate(index)[2]} if completed else None)
+                    for index, completed in changes.items()
+                })
+        except Exception as e:
+            print(f"Error logging workout exercise calories: {e}")  # Don't fail the tracking
+        
+        completed_count = WorkoutExerciseTracking.objects.filter(workout=workout, completed=True).count()
+    
+    return Response({
+        'success': True,
+        'exercises': [
+            {'index': index, 'completed': completed, 'day_number': plan.locate(index)[0]}
+            for index, completed in sorted(changes.items())
+        ],
+        'completed_count': completed_count,
+        'total_exercises': plan.total,
+        'all_completed': completed_count == plan.total
+    })
+
+
 # ---------------- COMPLETE WORKOUT PLAN ---------------- #
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -1187,22 +1503,14 @@ def get_active_marathon_plan(request):
             'message': 'No marathon plan found'
         })
     
-    # Parse schedule from notes
-    try:
-        schedule = json.loads(marathon.notes) if marathon.notes else []
-    except:
-        schedule = []
-    
     # Get tracking status for each day
+    tracking_by_day = {row.day_index: row for row in MarathonDayTracking.objects.filter(marathon=marathon)}
     days_with_tracking = []
-    for idx, day in enumerate(schedule):
-        tracking = MarathonDayTracking.objects.filter(marathon=marathon, day_index=idx).first()
+    for session in marathon.sessions.all():
+        tracking = tracking_by_day.get(session.day_index)
         days_with_tracking.append({
-            'index': idx,
-            'day': day.get('day', ''),
-            'run_type': day.get('run_type', ''),
-            'distance_km': day.get('distance_km', 0),
-            'notes': day.get('notes', ''),
+            'index': session.day_index,
+            **session_dict(session),
             'completed': tracking.completed if tracking else False,
             'difficulty': tracking.difficulty if tracking else None
         })
@@ -1227,8 +1535,8 @@ def get_active_marathon_plan(request):
 @permission_classes([IsAuthenticated])
 def track_marathon_day(request):
     """Mark a marathon training day as completed and log calories/distance"""
-    from health_data.models import Marathon, HealthData
-    from .models import MarathonDayTracking
+    from health_data.models import Marathon
+    from .models import MarathonDayTracking, MarathonSession
     from django.utils import timezone
     from datetime import date as dt
     
@@ -1238,9 +1546,16 @@ def track_marathon_day(request):
     
     try:
         marathon = Marathon.objects.get(id=marathon_id, user=request.user)
-    except Marathon.DoesNotExist:
+    except (Marathon.DoesNotExist, TypeError, ValueError):
         return Response({'error': 'Marathon plan not found'}, status=404)
     
+    # Same bounds as track_marathon_days: an integer index of one of the plan's sessions
+    try:
+        day_index = int(day_index)
+        session = marathon.sessions.get(day_index=day_index)
+    except (TypeError, ValueError, MarathonSession.DoesNotExist):
+        return Response({'error': 'Training days not found', 'day_indexes': [day_index]}, status=400)
+    
     # Create or update tracking
     tracking, created = MarathonDayTracking.objects.get_or_create(
         marathon=marathon,
@@ -1253,43 +1568,17 @@ def track_marathon_day(request):
         tracking.completed_at = timezone.now() if completed else None
         tracking.save()
     
-    # Log calories and distance to daily progress if completed
-    if completed:
-        try:
-            schedule = json.loads(marathon.notes) if marathon.notes else []
-            
-            if day_index < len(schedule):
-                day_data = schedule[day_index]
-                distance_km = day_data.get('distance_km', 0)
-                
-                # Estimate calories burned from running (rough estimate: 60 cal per km)
-                estimated_calories = int(distance_km * 60)
-                
-                # Estimate duration (rough estimate: 6 min per km for average pace)
-                estimated_duration = int(distance_km * 6)
-                
-                today = dt.today()
-                health_data, _ = HealthData.objects.get_or_create(
-                    user=request.user,
-                    date=today,
-                    defaults={'steps': 0, 'calories_burned': 0, 'distance': 0, 'active_minutes': 0}
-                )
-                
-                health_data.calories_burned += estimated_calories
-                health_data.distance += distance_km
-                health_data.active_minutes += estimated_duration
-                health_data.save()
-        except Exception as e:
-            pass  # Don't fail the tracking if calorie logging fails
+    # Log calories and distance to daily progress if completed, or take them back if not
+    try:
+        activity = session_activity(session) if completed else None
+        set_source_activity(request.user, 'marathon_day', f"{marathon.id}:{day_index}", dt.today(), activity)
+    except Exception as e:
+        print(f"Error logging marathon day activity: {e}")  # Don't fail the tracking
     
     # Check if all days are completed
-    try:
-        schedule = json.loads(marathon.notes) if marathon.notes else []
-        total_days = len(schedule)
-        completed_count = MarathonDayTracking.objects.filter(marathon=marathon, completed=True).count()
-        all_completed = completed_count == total_days
-    except:
-        all_completed = False
+    total_days = marathon.sessions.count()
+    completed_count = MarathonDayTracking.objects.filter(marathon=marathon, completed=True).count()
+    all_completed = completed_count == total_days
     
     return Response({
         'success': True,
@@ -1298,6 +1587,74 @@ def track_marathon_day(request):
     })
 
 
+# ---------------- TRACK MANY MARATHON DAYS ---------------- #
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def track_marathon_days(request):
+    """
+    Mark several training days of a marathon week at once.
+
+    Takes {"marathon_id", "days": [{"day_index", "completed"}, ...]} and
+    applies them in one transaction like track_workout_exercises.
+    """
+    from health_data.models import Marathon
+    from .models import MarathonDayTracking
+    from django.utils import timezone
+    from datetime import date as dt
+    
+    try:
+        marathon = Marathon.objects.get(id=request.data.get('marathon_id'), user=request.user)
+    except (Marathon.DoesNotExist, TypeError, ValueError):
+        return Response({'error': 'Marathon plan not found'}, status=404)
+    
+    try:
+        changes = tracking_changes(request.data.get('days'), 'day_index')
+    except ValueError as e:
+        return Response({'error': f'days: {e}'}, status=400)
+    
+    sessions = {session.day_index: session for session in marathon.sessions.all()}
+    invalid = sorted(set(changes) - set(sessions))
+    if invalid:
+        return Response({'error': 'Training days not found', 'day_indexes': invalid}, status=400)
+    
+    stamp = timezone.now()
+    with transaction.atomic():
+        MarathonDayTracking.objects.bulk_create(
+            [
+                MarathonDayTracking(
+                    marathon=marathon,
+                    day_index=index,
+                    completed=completed,
+                    completed_at=stamp if completed else None
+                )
+                for index, completed in sorted(changes.items())
+            ],
+            update_conflicts=True,
+            unique_fields=['marathon', 'day_index'],
+            update_fields=['completed', 'completed_at'],
+        )
+        
+        # Savepoint so a failure logging activity leaves the transaction usable
+        try:
+            with transaction.atomic():
+                set_source_activities(request.user, 'marathon_day', {
+                    f"{marathon.id}:{index}": (dt.today(), session_activity(sessions[index]) if completed else None)
+                    for index, completed in changes.items()
+                })
+        except Exception as e:
+            print(f"Error logging marathon day activity: {e}")  # Don't fail the tracking
+        
+        completed_count = MarathonDayTracking.objects.filter(marathon=marathon, completed=True).count()
+    
+    return Response({
+        'success': True,
+        'days': [{'day_index': index, 'completed': completed} for index, completed in sorted(changes.items())],
+        'completed_count': completed_count,
+        'total_days': len(sessions),
+        'all_completed': completed_count == len(sessions)
+    })
+
+
 # ---------------- COMPLETE MARATHON WEEK ---------------- #
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -1330,42 +1687,42 @@ def complete_marathon_week(request):
 
 
 # ---------------- LOG WORKOUT CALORIES TO DAILY PROGRESS ---------------- #
+def idempotency_key(request):
+    """Client key that makes a retried log request count once, from the body or an Idempotency-Key header"""
+    key = request.data.get('idempotency_key') or request.headers.get('Idempotency-Key')
+    return str(key)[:100] if key else None
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def log_workout_calories(request):
     """Log calories burned from workout to daily health data"""
-    from health_data.models import HealthData
     from datetime import date as dt
     
     user = request.user
-    calories = request.data.get('calories', 0)
     workout_date = request.data.get('date', str(dt.today()))
     
+    try:
+        calories = float(request.data.get('calories', 0))
+    except (TypeError, ValueError):
+        return Response({'error': 'calories must be a number'}, status=400)
+    
     try:
         date_obj = dt.fromisoformat(workout_date)
     except:
         date_obj = dt.today()
     
-    # Get or create health data for the day
-    health_data, created = HealthData.objects.get_or_create(
-        user=user,
-        date=date_obj,
-        defaults={
-            'steps': 0,
-            'calories_burned': 0,
-            'distance': 0,
-            'active_minutes': 0
-        }
+    # Add workout calories to daily total, once per idempotency key
+    totals, added = log_activity(
+        user, 'workout_log', date_obj, idempotency_key(request),
+        calories_burned=calories
     )
     
-    # Add workout calories to daily total
-    health_data.calories_burned += calories
-    health_data.save()
-    
     return Response({
         'success': True,
-        'total_calories': health_data.calories_burned,
-        'date': str(date_obj)
+        'total_calories': totals['calories_burned'],
+        'date': str(date_obj),
+        'duplicate': not added
     })
 
 
@@ -1374,44 +1731,38 @@ def log_workout_calories(request):
 @permission_classes([IsAuthenticated])
 def log_marathon_calories(request):
     """Log calories burned from marathon training to daily health data"""
-    from health_data.models import HealthData
     from datetime import date as dt
     
     user = request.user
-    calories = request.data.get('calories', 0)
-    distance_km = request.data.get('distance_km', 0)
-    duration_minutes = request.data.get('duration_minutes', 0)
     training_date = request.data.get('date', str(dt.today()))
     
+    try:
+        calories = float(request.data.get('calories', 0))
+        distance_km = float(request.data.get('distance_km', 0))
+        duration_minutes = int(float(request.data.get('duration_minutes', 0)))
+    except (TypeError, ValueError):
+        return Response({'error': 'calories, distance_km and duration_minutes must be numbers'}, status=400)
+    
     try:
         date_obj = dt.fromisoformat(training_date)
     except:
         date_obj = dt.today()
     
-    # Get or create health data for the day
-    health_data, created = HealthData.objects.get_or_create(
-        user=user,
-        date=date_obj,
-        defaults={
-            'steps': 0,
-            'calories_burned': 0,
-            'distance': 0,
-            'active_minutes': 0
-        }
+    # Add marathon training data to daily total, once per idempotency key
+    totals, added = log_activity(
+        user, 'marathon_log', date_obj, idempotency_key(request),
+        calories_burned=calories,
+        distance=distance_km,
+        active_minutes=duration_minutes
     )
     
-    # Add marathon training data to daily total
-    health_data.calories_burned += calories
-    health_data.distance += distance_km
-    health_data.active_minutes += duration_minutes
-    health_data.save()
-    
     return Response({
         'success': True,
-        'total_calories': health_data.calories_burned,
-        'total_distance': health_data.distance,
-        'total_active_minutes': health_data.active_minutes,
-        'date': str(date_obj)
+        'total_calories': totals['calories_burned'],
+        'total_distance': totals['distance'],
+        'total_active_minutes': totals['active_minutes'],
+        'date': str(date_obj),
+        'duplicate': not added
     })
 
 
@@ -1448,17 +1799,12 @@ def get_daily_workout_summary(request):
 
 
 # ---------------- GENERATE DAILY WORKOUT (NEW SYSTEM) ---------------- #
-@api_view(["POST"])
-@permission_classes([IsAuthenticated])
-def generate_daily_workout(request):
+@generation_job("daily_workout")
+def create_daily_workout(user, data):
     """Generate workout for TODAY only with progressive difficulty based on feedback"""
-    from google import genai
-    import os
-    import json
     from health_data.models import Workout
     from datetime import date as dt, timedelta
     
-    user = request.user
     today = dt.today()
     
     # Validate user profile
@@ -1468,21 +1814,21 @@ def generate_daily_workout(request):
         }, status=400)
     
     # Calculate age and BMI
-    age = request.data.get("age") or (today.year - user.date_of_birth.year - ((today.month, today.day) < (user.date_of_birth.month, user.date_of_birth.day)))
-    weight = request.data.get("weight", user.weight)
-    height = request.data.get("height", user.height)
+    age = data.get("age") or (today.year - user.date_of_birth.year - ((today.month, today.day) < (user.date_of_birth.month, user.date_of_birth.day)))
+    weight = data.get("weight", user.weight)
+    height = data.get("height", user.height)
     
     height_m = height / 100
     bmi = weight / (height_m * height_m)
     
     # Get fitness level and goal
-    fitness_level = request.data.get("fitness_level", "intermediate")
-    goal = request.data.get("goal") or user.fitness_goal or "general_fitness"
+    fitness_level = data.get("fitness_level", "intermediate")
+    goal = data.get("goal") or user.fitness_goal or "general_fitness"
     
     # Get health data from request
-    avg_steps = request.data.get("avg_steps", 5000)
-    sleep_hours = request.data.get("sleep_hours", 7)
-    spo2 = request.data.get("spo2", 98)
+    avg_steps = data.get("avg_steps", 5000)
+    sleep_hours = data.get("sleep_hours", 7)
+    spo2 = data.get("spo2", 98)
     
     # Get yesterday's workout and feedback for progression
     yesterday = today - timedelta(days=1)
@@ -1510,18 +1856,11 @@ def generate_daily_workout(request):
     # Get previous workout details for context
     prev_workout_summary = ""
     if prev_workout:
-        try:
-            prev_exercises = json.loads(prev_workout.description) if prev_workout.description else []
-            prev_workout_summary = f"\nPrevious Workout (Day {prev_day_number}):\n"
-            prev_workout_summary += f"- Total Duration: {prev_workout.duration} minutes\n"
-            prev_workout_summary += f"- Total Calories: {prev_workout.calories_burned}\n"
-            prev_workout_summary += f"- Exercises: {len(prev_exercises)}\n"
-            prev_workout_summary += f"- User Feedback: {prev_feedback or 'No feedback'}\n"
-        except:
-            prev_workout_summary = ""
-    
-    # Configure Gemini
-    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+        prev_workout_summary = f"\nPrevious Workout (Day {prev_day_number}):\n"
+        prev_workout_summary += f"- Total Duration: {prev_workout.duration} minutes\n"
+        prev_workout_summary += f"- Total Calories: {prev_workout.calories_burned}\n"
+        prev_workout_summary += f"- Exercises: {prev_workout.plan_exercises.count()}\n"
+        prev_workout_summary += f"- User Feedback: {prev_feedback or 'No feedback'}\n"
     
     # Create prompt for daily workout
     prompt = f"""Generate a personalized workout for TODAY ONLY (Day {current_day_number}) in JSON format:
@@ -1570,33 +1909,23 @@ Return ONLY valid JSON (NO markdown, NO backticks):
 }}"""
     
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
-        )
-        response_text = response.text.strip()
-        
-        # Extract JSON
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        workout_data = json.loads(response_text)
+        # Daily workouts build on the user's own history, so never reuse them
+        workout_data = generate_plan_json(prompt, JSONSchema(EXERCISE, 'exercises'), use_cache=False)
         
         # Store in database as daily plan
-        workout = Workout.objects.create(
-            user=user,
-            workout_name=workout_data.get('workout_name', f'Day {current_day_number} Workout'),
-            workout_type='Daily Progressive',
-            duration=workout_data.get('total_duration_minutes', 0),
-            calories_burned=workout_data.get('total_calories', 0),
-            intensity='moderate',
-            date=today,
-            description=json.dumps(workout_data.get('exercises', [])),
-            is_daily_plan=True,
-            plan_day_number=current_day_number
-        )
+        with transaction.atomic():
+            workout = Workout.objects.create(
+                user=user,
+                workout_name=workout_data.get('workout_name', f'Day {current_day_number} Workout'),
+                workout_type='Daily Progressive',
+                duration=workout_data.get('total_duration_minutes', 0),
+                calories_burned=workout_data.get('total_calories', 0),
+                intensity='moderate',
+                date=today,
+                is_daily_plan=True,
+                plan_day_number=current_day_number
+            )
+            save_workout_exercises(workout, workout_data.get('exercises', []))
         
         return Response({
             "success": True,
@@ -1617,6 +1946,13 @@ Return ONLY valid JSON (NO markdown, NO backticks):
         }, status=500)
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def generate_daily_workout(request):
+    """Generate workout for TODAY only with progressive difficulty based on feedback"""
+    return run_or_enqueue(request, "daily_workout")
+
+
 # ---------------- COMPLETE DAILY WORKOUT WITH FEEDBACK ---------------- #
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -1665,7 +2001,6 @@ def complete_daily_workout(request):
 def get_todays_workout(request):
     """Get today's workout if it exists"""
     from health_data.models import Workout
-    from .models import WorkoutExerciseTracking
     from datetime import date as dt
     
     user = request.user
@@ -1684,27 +2019,14 @@ def get_todays_workout(request):
             'message': 'No workout for today. Generate one!'
         })
     
-    # Parse exercises
-    try:
-        exercises = json.loads(workout.description) if workout.description else []
-    except:
-        exercises = []
-    
     # Get tracking status for each exercise
+    tracking = exercise_tracking(workout)
     exercises_with_tracking = []
-    for idx, exercise in enumerate(exercises):
-        tracking = WorkoutExerciseTracking.objects.filter(
-            workout=workout,
-            exercise_index=idx
-        ).first()
-        
+    for exercise in workout.plan_exercises.all():
         exercises_with_tracking.append({
-            'index': idx,
-            'name': exercise.get('name', ''),
-            'workout_type': exercise.get('workout_type', 'general'),
-            'reps_or_duration': exercise.get('reps_or_duration', ''),
-            'calories': exercise.get('calories', 0),
-            'completed': tracking.completed if tracking else False
+            'index': exercise.exercise_index,
+            **exercise_dict(exercise),
+            'completed': getattr(tracking.get(exercise.exercise_index), 'completed', False)
         })
     
     # Check if all exercises are completed
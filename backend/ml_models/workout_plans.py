@@ -0,0 +1,227 @@
+from bisect import bisect_right
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .models import MarathonSession, PlanDay, PlanExercise, WorkoutExerciseTracking
+
+EXERCISE_INDEX_TTL = 24 * 60 * 60
+
+
+def number(value, cast=float):
+    """A numeric field of an LLM plan, or 0 when it isn't a number"""
+    try:
+        return cast(float(value))
+    except (TypeError, ValueError):
+        return cast(0)
+
+
+def text(value, max_length=None):
+    value = '' if value is None else str(value)
+    return value[:max_length] if max_length else value
+
+
+def plan_exercise(workout, index, exercise, day=None):
+    return PlanExercise(
+        workout=workout,
+        day=day,
+        exercise_index=index,
+        name=text(exercise.get('name'), 200),
+        workout_type=text(exercise.get('workout_type') or 'general', 50),
+        reps_or_duration=text(exercise.get('reps_or_duration'), 100),
+        calories=number(exercise.get('calories')),
+    )
+
+
+def save_workout_exercises(workout, exercises):
+    """Store a single-day plan's exercises, indexed in order"""
+    exercises = [exercise for exercise in exercises if isinstance(exercise, dict)]
+    with transaction.atomic():
+        rows = PlanExercise.objects.bulk_create(
+            [plan_exercise(workout, index, exercise) for index, exercise in enumerate(exercises)]
+        )
+        invalidate_exercise_index(workout.id)
+    return rows
+
+
+def save_workout_days(workout, days):
+    """
+    Store a multi-day plan's days and their exercises. Exercises are
+    indexed across the whole plan, the index tracking refers to.
+    """
+    days = [day for day in days if isinstance(day, dict)]
+    with transaction.atomic():
+        plan_days = PlanDay.objects.bulk_create([
+            PlanDay(
+                workout=workout,
+                position=position,
+                day_number=number(day.get('day_number'), int) or position + 1,
+                day_name=text(day.get('day_name'), 100),
+                is_rest_day=bool(day.get('is_rest_day', False)),
+                total_duration_minutes=number(day.get('total_duration_minutes'), int),
+                total_calories=number(day.get('total_calories')),
+            )
+            for position, day in enumerate(days)
+        ])
+
+        exercises = []
+        for plan_day, day in zip(plan_days, days):
+            for exercise in day.get('exercises') or []:
+                if isinstance(exercise, dict):
+                    exercises.append(plan_exercise(workout, len(exercises), exercise, plan_day))
+        PlanExercise.objects.bulk_create(exercises)
+        invalidate_exercise_index(workout.id)
+    return plan_days
+
+
+class ExerciseIndex:
+    """
+    A workout's exercises compiled for tracking: where each day's
+    exercises start (prefix sums of the exercise count per day), every
+    exercise's calories and the total, so tracking an exercise needs no
+    query on the plan.
+    """
+
+    def __init__(self, day_numbers, day_starts, calories):
+        self.day_numbers = day_numbers
+        self.day_starts = day_starts
+        self.calories = calories
+
+    @property
+    def total(self):
+        return len(self.calories)
+
+    def locate(self, index):
+        """(day number, position within the day, calories) of an exercise; IndexError when there is none"""
+        if not 0 <= index < self.total:
+            raise IndexError(index)
+        if not self.day_starts:
+            return None, index, self.calories[index]
+        day = bisect_right(self.day_starts, index) - 1
+        return self.day_numbers[day], index - self.day_starts[day], self.calories[index]
+
+
+def compile_exercise_index(workout_id):
+    day_numbers, day_starts, calories = [], [], []
+    last_day = None
+    rows = PlanExercise.objects.filter(workout_id=workout_id).values_list('day_id', 'day__day_number', 'calories')
+    for index, (day_id, day_number, exercise_calories) in enumerate(rows):
+        if day_id is not None and day_id != last_day:
+            day_numbers.append(day_number)
+            day_starts.append(index)
+            last_day = day_id
+        calories.append(exercise_calories)
+    return ExerciseIndex(tuple(day_numbers), tuple(day_starts), tuple(calories))
+
+
+def exercise_index_key(workout_id):
+    return f"workout-exercises:{workout_id}"
+
+
+def cached_exercise_index(workout_id):
+    """The workout's compiled ExerciseIndex, from the cache when it is there"""
+    key = exercise_index_key(workout_id)
+    index = cache.get(key)
+    if index is None:
+        index = compile_exercise_index(workout_id)
+        cache.set(key, index, EXERCISE_INDEX_TTL)
+    return index
+
+
+def invalidate_exercise_index(workout_id):
+    """Drop the compiled index once the transaction changing the workout's exercises commits"""
+    transaction.on_commit(lambda: cache.delete(exercise_index_key(workout_id)))
+
+
+def save_marathon_schedule(marathon, schedule):
+    """Store a marathon week's training days, indexed in order"""
+    schedule = [day for day in schedule if isinstance(day, dict)]
+    return MarathonSession.objects.bulk_create([
+        MarathonSession(
+            marathon=marathon,
+            day_index=index,
+            day=text(day.get('day'), 20),
+            run_type=text(day.get('run_type'), 50),
+            distance_km=number(day.get('distance_km')),
+            notes=text(day.get('notes')),
+        )
+        for index, day in enumerate(schedule)
+    ])
+
+
+def session_activity(session):
+    """Activity a completed marathon session adds to the day's progress"""
+    return {
+        # Rough estimates: 60 cal per km, 6 min per km for an average pace
+        'calories_burned': int(session.distance_km * 60),
+        'distance': session.distance_km,
+        'active_minutes': int(session.distance_km * 6),
+    }
+
+
+def exercise_dict(exercise):
+    return {
+        'name': exercise.name,
+        'workout_type': exercise.workout_type,
+        'reps_or_duration': exercise.reps_or_duration,
+        'calories': exercise.calories,
+    }
+
+
+def exercise_tracking(workout, indexes=None):
+    """The workout's tracking rows by exercise index, all or just `indexes`, in one query"""
+    tracking = WorkoutExerciseTracking.objects.filter(workout=workout)
+    if indexes is not None:
+        tracking = tracking.filter(exercise_index__in=indexes)
+    return {row.exercise_index: row for row in tracking}
+
+
+def tracked_exercise_dict(exercise, tracking):
+    row = tracking.get(exercise.exercise_index)
+    return {
+        'index': exercise.exercise_index,
+        **exercise_dict(exercise),
+        'completed': row.completed if row else False,
+        'difficulty': row.difficulty if row else None,
+    }
+
+
+def day_dict(day):
+    return {
+        'day_number': day.day_number,
+        'day_name': day.day_name,
+        'is_rest_day': day.is_rest_day,
+        'total_duration_minutes': day.total_duration_minutes,
+        'total_calories': day.total_calories,
+    }
+
+
+def session_dict(session):
+    return {
+        'day': session.day,
+        'run_type': session.run_type,
+        'distance_km': session.distance_km,
+        'notes': session.notes,
+    }
+
+
+def prefetch_workout_plans(workouts):
+    """Queryset of workouts that fetches their days and exercises in three more queries"""
+    return workouts.prefetch_related(
+        Prefetch('plan_days', queryset=PlanDay.objects.prefetch_related('exercises')),
+        Prefetch('plan_exercises', queryset=PlanExercise.objects.filter(day__isnull=True), to_attr='single_day_exercises'),
+    )
+
+
+def workout_plan_json(workout):
+    """
+    A prefetched workout's plan in the shape Gemini returned it: a list of
+    days with their exercises, or a list of exercises for single-day plans.
+    """
+    if workout.plan_days.all():
+        return [
+            dict(day_dict(day), exercises=[exercise_dict(exercise) for exercise in day.exercises.all()])
+            for day in workout.plan_days.all()
+        ]
+    return [exercise_dict(exercise) for exercise in workout.single_day_exercises]